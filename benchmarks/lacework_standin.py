@@ -0,0 +1,300 @@
+import argparse
+import json
+import os
+import random
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+# setting path
+sys.path.append('.')
+
+from collections.abc import Iterator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from benchmarks.synthetic import SyntheticTenant
+
+# search path -> SyntheticTenant page source
+SEARCH_ENDPOINTS: dict = {
+    '/api/v2/Inventory/search': 'inventory_pages',
+    '/api/v2/AgentInfo/search': 'agent_pages'
+}
+TOKEN_EXPIRY: str = '2099-01-01T00:00:00.000Z'
+
+
+class StandinStats():
+    """Counters for everything the stand-in served, safe to update from handler threads"""
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.requests = 0
+        self.pages = 0
+        self.records = 0
+        self.bytes_sent = 0
+        self.throttled = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def begin(self) -> None:
+        with self.lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def end(self) -> None:
+        with self.lock:
+            self.in_flight -= 1
+
+    def add(self, **counters: int) -> None:
+        with self.lock:
+            for name, value in counters.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            seconds = time.monotonic() - self.started
+            return {
+                'seconds': round(seconds, 3),
+                'requests': self.requests,
+                'pages': self.pages,
+                'records': self.records,
+                'bytes_sent': self.bytes_sent,
+                'throttled': self.throttled,
+                'errors': self.errors,
+                'max_in_flight': self.max_in_flight,
+                'records_per_second': round(self.records / seconds, 1) if seconds > 0 else 0.0
+            }
+
+
+class SearchCursor():
+    # one page of lookahead, so every response knows whether to advertise a nextPage url
+    def __init__(self, pages: Iterator[dict]) -> None:
+        self.pages = pages
+        self.pending = next(pages, None)
+
+    def advance(self) -> dict:
+        page = self.pending
+        self.pending = next(self.pages, None)
+        return page
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    # keep-alive, so client connection pooling behaves as it does against the real API
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self) -> None:
+        body = self.read_json()
+        path = urlsplit(self.path).path
+        if path == '/api/v2/access/tokens':
+            self.respond(201, {'token': uuid.uuid4().hex, 'expiresAt': TOKEN_EXPIRY})
+        elif path in SEARCH_ENDPOINTS:
+            self.server.standin.search(self, path, body)
+        else:
+            self.respond(404, {'message': f'{path} is not served by the stand-in'})
+
+    def do_GET(self) -> None:
+        path = urlsplit(self.path).path
+        if path == '/api/v2/UserProfile':
+            self.respond(200, self.server.standin.user_profile())
+        elif path.rsplit('/', 1)[0] in SEARCH_ENDPOINTS:
+            self.server.standin.next_page(self, path.rsplit('/', 1)[1])
+        else:
+            self.respond(404, {'message': f'{path} is not served by the stand-in'})
+
+    def read_json(self) -> dict:
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length)) if length else {}
+
+    def respond(self, status: int, body: dict, headers: dict = None) -> int:
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+        return len(payload)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class LaceworkStandin():
+    """Local HTTPS stand-in for the Lacework API endpoints the tool calls, serving a SyntheticTenant"""
+    def __init__(
+        self, tenant: SyntheticTenant, latency: float = 0.0, error_rate: float = 0.0, throttle_rate: float = 0.0,
+        retry_after: str = '1', seed: int = 0, port: int = 0, certfile: str = None, keyfile: str = None
+    ) -> None:
+        self.tenant = tenant
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.cursors = dict()
+        self.stats = StandinStats()
+
+        self.tempdir = None
+        if certfile is None:
+            self.tempdir = tempfile.TemporaryDirectory()
+            certfile, keyfile = self_signed_certificate(self.tempdir.name)
+        self.certfile = certfile
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), StandinHandler)
+        self.server.daemon_threads = True
+        self.server.standin = self
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        self.server.socket = context.wrap_socket(self.server.socket, server_side=True)
+        self.thread = None
+
+    @property
+    def port(self) -> int:
+        return self.server.server_port
+
+    def environment(self) -> dict:
+        # LaceworkClient builds https://{account}.{base_domain}, so the loopback address is split across the two
+        return {
+            'LW_ACCOUNT': '127',
+            'LW_BASE_DOMAIN': f'0.0.1:{self.port}',
+            'LW_API_KEY': 'standin-key',
+            'LW_API_SECRET': 'standin-secret',
+            'REQUESTS_CA_BUNDLE': self.certfile,
+            'SSL_CERT_FILE': self.certfile
+        }
+
+    def start(self) -> 'LaceworkStandin':
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        if self.tempdir:
+            self.tempdir.cleanup()
+
+    def __enter__(self) -> 'LaceworkStandin':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def user_profile(self) -> dict:
+        return {'data': [{
+            'username': 'standin@example.com',
+            'orgAccount': len(self.tenant.subaccounts) > 1,
+            'orgAdmin': True,
+            'accounts': [
+                {'accountName': lw_subaccount, 'admin': True, 'userEnabled': 1} for lw_subaccount in self.tenant.subaccounts
+            ]
+        }]}
+
+    def inject_failure(self, handler: StandinHandler) -> bool:
+        with self.lock:
+            roll = self.rng.random()
+        if roll < self.throttle_rate:
+            self.stats.add(throttled=1)
+            handler.respond(429, {'message': 'Rate limit exceeded'}, {'Retry-After': self.retry_after})
+            return True
+        if roll < self.throttle_rate + self.error_rate:
+            self.stats.add(errors=1)
+            handler.respond(500, {'message': 'Injected server error'})
+            return True
+        return False
+
+    def search(self, handler: StandinHandler, path: str, body: dict) -> None:
+        self.stats.begin()
+        try:
+            time.sleep(self.latency)
+            if self.inject_failure(handler):
+                return
+            lw_subaccount = handler.headers.get('Account-Name') or self.tenant.subaccounts[0]
+            if lw_subaccount not in self.tenant.subaccounts:
+                handler.respond(404, {'message': f'unknown subaccount {lw_subaccount}'})
+                return
+            cursor = SearchCursor(getattr(self.tenant, SEARCH_ENDPOINTS[path])(lw_subaccount, body))
+            token = uuid.uuid4().hex
+            with self.lock:
+                self.cursors[token] = (path, cursor)
+            self.send_page(handler, token)
+        finally:
+            self.stats.end()
+
+    def next_page(self, handler: StandinHandler, token: str) -> None:
+        self.stats.begin()
+        try:
+            time.sleep(self.latency)
+            if self.inject_failure(handler):
+                return
+            if token not in self.cursors:
+                handler.respond(404, {'message': 'unknown or expired page'})
+                return
+            self.send_page(handler, token)
+        finally:
+            self.stats.end()
+
+    def send_page(self, handler: StandinHandler, token: str) -> None:
+        with self.lock:
+            path, cursor = self.cursors[token]
+            page = cursor.advance()
+            if cursor.pending is None:
+                del self.cursors[token]
+
+        next_page = f'https://127.0.0.1:{self.port}{path}/{token}' if cursor.pending is not None else None
+        body = {'paging': {'rows': len(page['data']), 'urls': {'nextPage': next_page}}, 'data': page['data']}
+        sent = handler.respond(200, body)
+        self.stats.add(pages=1, records=len(page['data']), bytes_sent=sent)
+
+
+def self_signed_certificate(directory: str) -> tuple[str, str]:
+    certfile = os.path.join(directory, 'standin.crt')
+    keyfile = os.path.join(directory, 'standin.key')
+    subprocess.run([
+        'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+        '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1',
+        '-keyout', keyfile, '-out', certfile
+    ], check=True, capture_output=True)
+    return (certfile, keyfile)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve a synthetic tenant over a local stand-in for the Lacework API')
+    parser.add_argument('--hosts', type=int, default=10_000)
+    parser.add_argument('--subaccounts', type=int, default=1)
+    parser.add_argument('--page-size', type=int, default=5000)
+    parser.add_argument('--coverage', type=float, default=0.8, help='share of hosts that report an agent')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every search and page request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of search and page requests answered with a 500')
+    parser.add_argument(
+        '--throttle-rate', type=float, default=0.0, help='share of search and page requests answered with a 429'
+    )
+    parser.add_argument('--retry-after', default='1', help='Retry-After header sent with injected 429s')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--port', type=int, default=8443)
+    parser.add_argument('--certfile', default=None, help='TLS certificate; a self-signed one is generated when omitted')
+    parser.add_argument('--keyfile', default=None)
+    args = parser.parse_args()
+
+    tenant = SyntheticTenant(args.hosts, args.subaccounts, args.page_size, args.coverage, args.seed)
+    standin = LaceworkStandin(
+        tenant, args.latency, args.error_rate, args.throttle_rate, args.retry_after, args.seed, args.port, args.certfile,
+        args.keyfile
+    )
+    with standin:
+        print('Point the tool at the stand-in with:')
+        for key, value in standin.environment().items():
+            print(f'export {key}={value}')
+        print('Serving until interrupted; statistics are printed on exit.', flush=True)
+        try:
+            standin.thread.join()
+        except KeyboardInterrupt:
+            pass
+        print(json.dumps(standin.stats.to_dict(), indent=4))
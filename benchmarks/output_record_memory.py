@@ -0,0 +1,54 @@
+import argparse
+import sys
+import tracemalloc
+# setting path
+sys.path.append('.')
+
+from instances_without_agents import OutputRecord
+
+
+class DictOutputRecord():
+    # the pre-__slots__ OutputRecord layout, kept here as the comparison baseline
+    def __init__(
+        self, urn: str, creation_time: str, is_kubernetes: bool, subaccount: str, os_image: str, tags: object = None
+    ) -> None:
+        self.urn = urn
+        self.creation_time = creation_time
+        self.is_kubernetes = is_kubernetes
+        self.os_image = os_image
+        self.subaccount = subaccount
+        self.tags = tags
+
+
+def build_records(record_type: type, count: int) -> list:
+    records = list()
+    for i in range(count):
+        # decoded api pages hand back a fresh string object per field, which is what interning collapses
+        subaccount = ''.join(['production-', 'subaccount'])
+        os_image = ''.join(['projects/debian-cloud/global/licenses/', 'debian-11-bullseye'])
+        urn = f'arn:aws:ec2:us-east-1:123456789012:instance/i-{i:017x}'
+        records.append(record_type(urn, '2022-01-01T00:00:00Z', False, subaccount, os_image, ''))
+    return records
+
+
+def measure(record_type: type, count: int) -> int:
+    tracemalloc.start()
+    records = build_records(record_type, count)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+    return current
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare resident memory of OutputRecord against a dict-backed record')
+    parser.add_argument('--records', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    baseline = measure(DictOutputRecord, args.records)
+    slotted = measure(OutputRecord, args.records)
+
+    print(f'records:            {args.records}')
+    print(f'dict-backed record: {baseline / args.records:.1f} bytes/record ({baseline / 2**20:.1f} MiB)')
+    print(f'OutputRecord:       {slotted / args.records:.1f} bytes/record ({slotted / 2**20:.1f} MiB)')
+    print(f'reduction:          {(1 - slotted / baseline) * 100:.1f}%')
@@ -0,0 +1,228 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+import tracemalloc
+# setting path
+sys.path.append('.')
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from benchmarks.synthetic import FakeLaceworkClient, SyntheticTenant
+from instances_without_agents import (
+    INVENTORY_NORMALIZERS,
+    AdaptiveLimiter,
+    InstanceResult,
+    SubaccountContext,
+    ThrottledClient,
+    apply_agent_presence_filtering,
+    apply_fargate_filter,
+    fetch_subaccount_inputs,
+    get_agent_instances
+)
+
+START_TIME = '2022-01-01T00:00:00Z'
+END_TIME = '2022-01-02T00:00:00Z'
+
+STAGES = ['generate', 'parse', 'apply_agent_presence_filtering', 'apply_fargate_filter', 'merge', 'output_json', 'output_csv']
+
+
+class StageStats():
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.seconds = 0.0
+        self.records = 0
+        self.peak_bytes = 0
+
+    def records_per_second(self) -> float:
+        return self.records / self.seconds if self.seconds > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            'stage': self.name,
+            'seconds': round(self.seconds, 4),
+            'records': self.records,
+            'records_per_second': round(self.records_per_second(), 1),
+            'peak_bytes': self.peak_bytes
+        }
+
+
+class PipelineBenchmark():
+    """Runs the reconciliation pipeline stage by stage against a synthetic tenant"""
+    def __init__(self, tenant: SyntheticTenant, trace_memory: bool = True, parse_processes: int = 0) -> None:
+        self.tenant = tenant
+        self.trace_memory = trace_memory
+        self.parse_processes = parse_processes
+        self.stages = {name: StageStats(name) for name in STAGES}
+
+    @contextmanager
+    def stage(self, name: str):
+        stats = self.stages[name]
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+        started = time.perf_counter()
+        yield stats
+        stats.seconds += time.perf_counter() - started
+        if self.trace_memory:
+            # what the stage allocated on top of everything already resident
+            _, peak = tracemalloc.get_traced_memory()
+            stats.peak_bytes = max(stats.peak_bytes, peak - baseline)
+
+    def run(self) -> dict:
+        parse_pool = None
+        if self.parse_processes:
+            parse_pool = ProcessPoolExecutor(self.parse_processes, mp_context=multiprocessing.get_context('spawn'))
+        try:
+            return self.run_stages(parse_pool)
+        finally:
+            if parse_pool:
+                parse_pool.shutdown()
+
+    def run_stages(self, parse_pool: ProcessPoolExecutor = None) -> dict:
+        if parse_pool:
+            # start the workers outside the timed stages
+            list(parse_pool.map(abs, range(self.parse_processes)))
+        if self.trace_memory:
+            tracemalloc.start()
+
+        # pages are fetched as encoded responses, so parse includes decoding them, on the pool when there is one
+        client = ThrottledClient(FakeLaceworkClient(self.tenant), AdaptiveLimiter(1))
+        instances_without_agents = set()
+        matched_instances = set()
+        agents_without_inventory = set()
+
+        for lw_subaccount in self.tenant.subaccounts:
+            client.set_subaccount(lw_subaccount)
+
+            # the cost of producing the synthetic pages, to subtract from parse
+            with self.stage('generate') as stats:
+                stats.records += drain(client, lw_subaccount)
+
+            context = SubaccountContext(lw_subaccount, parse_pool=parse_pool)
+            with self.stage('parse') as stats:
+                agent_snapshot, all_instances_inventory, fargate_inventory = fetch_subaccount_inputs(
+                    client, START_TIME, END_TIME, lw_subaccount, context
+                )
+                list_agent_instances = get_agent_instances(agent_snapshot, context)
+                fargate_tasks = sum(len(page['data']) for page in fargate_inventory)
+                stats.records += len(all_instances_inventory) + agent_snapshot.count + fargate_tasks
+
+            with self.stage('apply_agent_presence_filtering') as stats:
+                results = apply_agent_presence_filtering(all_instances_inventory, list_agent_instances, lw_subaccount, context)
+                stats.records += len(all_instances_inventory) + len(list_agent_instances)
+
+            with self.stage('apply_fargate_filter') as stats:
+                results = apply_fargate_filter(fargate_inventory, agent_snapshot, *results, lw_subaccount)
+                stats.records += fargate_tasks + len(agent_snapshot.fargate)
+
+            with self.stage('merge') as stats:
+                instances_without_agents.update(results[0])
+                matched_instances.update(results[1])
+                agents_without_inventory.update(results[2])
+                stats.records += sum(len(r) for r in results)
+
+            del context, agent_snapshot, all_instances_inventory, fargate_inventory, list_agent_instances, results
+
+        with self.stage('merge'):
+            instance_result = InstanceResult(instances_without_agents, matched_instances, agents_without_inventory)
+        output_records = len(instances_without_agents) + len(matched_instances) + len(agents_without_inventory)
+
+        with open(os.devnull, 'w') as devnull:
+            with self.stage('output_json') as stats:
+                instance_result.printJson(devnull)
+                stats.records += output_records
+            with self.stage('output_csv') as stats:
+                instance_result.printCsv(devnull)
+                stats.records += output_records
+
+        if self.trace_memory:
+            tracemalloc.stop()
+
+        return {
+            'hosts': self.tenant.hosts,
+            'subaccounts': len(self.tenant.subaccounts),
+            'page_size': self.tenant.page_size,
+            'coverage': self.tenant.coverage,
+            'parse_processes': self.parse_processes,
+            'instances_without_agents': len(instance_result.instances_without_agents),
+            'instances_with_agents': len(instance_result.instances_with_agents),
+            'agents_without_inventory': len(instance_result.agents_without_inventory),
+            'stages': [self.stages[name].to_dict() for name in STAGES]
+        }
+
+
+def drain(client: ThrottledClient, lw_subaccount: str) -> int:
+    records = drain_search(client.inventory._session, [
+        {'filters': [{'field': 'resourceType', 'expression': 'eq', 'value': resource_type}]}
+        for resource_type in [*INVENTORY_NORMALIZERS, 'ecs:task']
+    ])
+    return records + drain_search(client.agent_info._session, [{}])
+
+
+def drain_search(session: object, bodies: list[dict]) -> int:
+    # produces and encodes every page without decoding them
+    records = 0
+    for body in bodies:
+        response = session.post('', json=body)
+        records += response.records
+        while response.next_page:
+            response = session.get(response.next_page)
+            records += response.records
+    return records
+
+
+def print_run(run: dict, trace_memory: bool) -> None:
+    print(
+        f"hosts={run['hosts']} subaccounts={run['subaccounts']} page_size={run['page_size']} coverage={run['coverage']} "
+        f"parse_processes={run['parse_processes']}"
+    )
+    print(
+        f"  results: {run['instances_without_agents']} without agent, {run['instances_with_agents']} with agent, "
+        f"{run['agents_without_inventory']} agents without inventory"
+    )
+    print(f"  {'stage':<32} {'seconds':>10} {'records':>10} {'records/s':>12} {'peak MiB':>10}")
+    for stage in run['stages']:
+        peak = f"{stage['peak_bytes'] / 2**20:.1f}" if trace_memory else '-'
+        print(
+            f"  {stage['stage']:<32} {stage['seconds']:>10.3f} {stage['records']:>10} "
+            f"{stage['records_per_second']:>12.0f} {peak:>10}"
+        )
+    print()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time each reconciliation stage against deterministic synthetic tenants')
+    parser.add_argument(
+        '--hosts', type=int, nargs='+', default=[1_000, 10_000, 100_000],
+        help='total hosts per tenant, e.g. 1000 10000 100000 1000000'
+    )
+    parser.add_argument(
+        '--subaccounts', type=int, nargs='+', default=[1, 10], help='subaccounts the hosts are spread across, e.g. 1 10 100'
+    )
+    parser.add_argument('--page-size', type=int, default=5000)
+    parser.add_argument('--coverage', type=float, default=0.8, help='share of hosts that report an agent')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help='skip tracemalloc, which slows every stage down')
+    parser.add_argument(
+        '--parse-processes', type=int, nargs='+', default=[0],
+        help='worker processes to normalize inventory pages on, e.g. 0 4 (0 parses inline)'
+    )
+    parser.add_argument('--json', dest='json_output', default=None, help='also write the measurements to this file')
+    args = parser.parse_args()
+
+    runs = list()
+    for hosts in args.hosts:
+        for subaccounts in args.subaccounts:
+            tenant = SyntheticTenant(hosts, subaccounts, args.page_size, args.coverage, args.seed)
+            for parse_processes in args.parse_processes:
+                run = PipelineBenchmark(tenant, not args.no_memory, parse_processes).run()
+                print_run(run, not args.no_memory)
+                runs.append(run)
+
+    if args.json_output:
+        with open(args.json_output, 'w') as f:
+            json.dump(runs, f, indent=4)
@@ -0,0 +1,332 @@
+import itertools
+import json
+import random
+import threading
+
+from collections.abc import Iterator
+
+# share of each subaccount's hosts per resource type; the remainder are fargate tasks
+AWS_SHARE: float = 0.50
+GCP_SHARE: float = 0.25
+AZURE_SHARE: float = 0.10
+AZURE_VMSS_SHARE: float = 0.05
+
+
+class SyntheticTenant():
+    """Deterministic inventory and agent_info pages shaped like the records the parsers consume"""
+    def __init__(
+        self, hosts: int, subaccounts: int = 1, page_size: int = 5000, coverage: float = 0.8, seed: int = 0,
+        prefix: str = 'subaccount'
+    ) -> None:
+        self.hosts = hosts
+        # a distinct prefix gives each of several tenants its own sub-accounts, and so its own host ids
+        self.subaccounts = [f'{prefix}-{n:03d}' for n in range(subaccounts)]
+        self.page_size = page_size
+        self.coverage = coverage
+        self.seed = seed
+
+    def subaccount_hosts(self, lw_subaccount: str) -> int:
+        index = self.subaccounts.index(lw_subaccount)
+        return self.hosts // len(self.subaccounts) + (1 if index < self.hosts % len(self.subaccounts) else 0)
+
+    def counts(self, lw_subaccount: str) -> dict:
+        hosts = self.subaccount_hosts(lw_subaccount)
+        aws = int(hosts * AWS_SHARE)
+        gcp = int(hosts * GCP_SHARE)
+        azure = int(hosts * AZURE_SHARE)
+        azure_vmss = int(hosts * AZURE_VMSS_SHARE)
+        return {
+            'aws': aws, 'gcp': gcp, 'azure': azure, 'azure_vmss': azure_vmss, 'fargate': hosts - aws - gcp - azure - azure_vmss
+        }
+
+    def rng(self, lw_subaccount: str, kind: str) -> random.Random:
+        # string seeds hash deterministically, so every run (and every process) sees the same tenant
+        return random.Random(f'{self.seed}/{lw_subaccount}/{kind}')
+
+    def paged(self, records: Iterator[dict]) -> Iterator[dict]:
+        page = list()
+        pages = 0
+        for record in records:
+            page.append(record)
+            if len(page) == self.page_size:
+                yield {'data': page}
+                pages += 1
+                page = list()
+        # an empty search still answers with one (empty) page
+        if page or pages == 0:
+            yield {'data': page}
+
+    ###########
+    # inventory
+    ###########
+    def inventory_pages(self, lw_subaccount: str, body: dict) -> Iterator[dict]:
+        resource_type = next(f['value'] for f in body.get('filters', []) if f['field'] == 'resourceType')
+        generator = {
+            'ec2:instance': self.aws_instances,
+            'compute.googleapis.com/Instance': self.gcp_instances,
+            'microsoft.compute/virtualmachines': self.azure_instances,
+            'microsoft.compute/virtualmachinescalesets/virtualmachines': self.azure_vmss_instances,
+            'ecs:task': self.fargate_tasks
+        }.get(resource_type)
+        if generator is None:
+            return self.paged(iter(()))
+        return self.paged(generator(lw_subaccount))
+
+    def aws_instances(self, lw_subaccount: str) -> Iterator[dict]:
+        rng = self.rng(lw_subaccount, 'aws')
+        account = aws_account(lw_subaccount)
+        for n in range(self.counts(lw_subaccount)['aws']):
+            instance_id = aws_instance_id(lw_subaccount, n)
+            tags = [
+                {'Key': 'Name', 'Value': f'web-{n}'}, {'Key': 'team', 'Value': rng.choice(['payments', 'search', 'platform'])}
+            ]
+            if rng.random() < 0.3:
+                tags.append({'Key': 'eks:cluster-name', 'Value': f'eks-{n % 7}'})
+            yield {
+                'urn': f'arn:aws:ec2:us-east-1:{account}:instance/{instance_id}',
+                'resourceType': 'ec2:instance',
+                'cloudDetails': {'accountID': account, 'region': 'us-east-1'},
+                'resourceConfig': {
+                    'InstanceId': instance_id,
+                    'LaunchTime': '2022-01-01T00:00:00.000Z',
+                    'ImageId': f'ami-{n % 50:08x}',
+                    'InstanceType': rng.choice(['t3.small', 'm5.large', 'c5.xlarge']),
+                    'Tags': tags
+                }
+            }
+
+    def gcp_instances(self, lw_subaccount: str) -> Iterator[dict]:
+        rng = self.rng(lw_subaccount, 'gcp')
+        project = f'{lw_subaccount}-project'
+        for n in range(self.counts(lw_subaccount)['gcp']):
+            instance_id = gcp_instance_id(lw_subaccount, n)
+            labels = {'env': rng.choice(['prod', 'staging'])}
+            if rng.random() < 0.3:
+                labels['goog-gke-node'] = ''
+                labels['goog-k8s-cluster-name'] = f'gke-{n % 5}'
+            yield {
+                'urn': f'//compute.googleapis.com/projects/{project}/zones/us-central1-a/instances/{instance_id}',
+                'resourceType': 'compute.googleapis.com/Instance',
+                'cloudDetails': {'projectId': project},
+                'resourceConfig': {
+                    'id': instance_id,
+                    'name': f'instance-{n}',
+                    'creationTimestamp': '2022-01-01T00:00:00.000-07:00',
+                    'status': 'RUNNING',
+                    'labels': labels,
+                    'tags': {'items': ['http-server']},
+                    'disks': [
+                        {'deviceName': 'boot', 'licenses': [f'projects/debian-cloud/global/licenses/debian-{10 + n % 3}']}
+                    ]
+                }
+            }
+
+    def azure_instances(self, lw_subaccount: str) -> Iterator[dict]:
+        rng = self.rng(lw_subaccount, 'azure')
+        for n in range(self.counts(lw_subaccount)['azure']):
+            tags = {'env': rng.choice(['prod', 'staging'])}
+            if rng.random() < 0.2:
+                tags.update({'aks-managed-cluster-name': f'aks-{n % 3}', 'aks-managed-poolName': 'nodepool1'})
+            resource_group = f'/subscriptions/{lw_subaccount}/resourceGroups/rg-{n % 10}'
+            yield {
+                'urn': f'{resource_group}/providers/Microsoft.Compute/virtualMachines/vm-{n}',
+                'resourceType': 'microsoft.compute/virtualmachines',
+                'resourceTags': tags,
+                'resourceConfig': {
+                    'vmId': azure_vm_id(lw_subaccount, n),
+                    'timeCreated': '2022-01-01T00:00:00.0000000Z',
+                    'hardwareProfile': {'vmSize': 'Standard_B2s'}
+                }
+            }
+
+    def azure_vmss_instances(self, lw_subaccount: str) -> Iterator[dict]:
+        rng = self.rng(lw_subaccount, 'azure_vmss')
+        for n in range(self.counts(lw_subaccount)['azure_vmss']):
+            tags = {'env': rng.choice(['prod', 'staging'])}
+            # most scale sets are aks node pools
+            if rng.random() < 0.6:
+                tags.update({'aks-managed-cluster-name': f'aks-{n % 3}', 'aks-managed-poolName': f'pool{n % 4}'})
+            resource_group = f'/subscriptions/{lw_subaccount}/resourceGroups/rg-{n % 10}'
+            yield {
+                'urn': f'{resource_group}/providers/Microsoft.Compute/virtualMachineScaleSets/vmss-{n % 4}'
+                       f'/virtualMachines/{n}',
+                'resourceType': 'microsoft.compute/virtualmachinescalesets/virtualmachines',
+                'resourceTags': tags,
+                'resourceConfig': {
+                    'instanceId': str(n),
+                    'vmId': azure_vmss_vm_id(lw_subaccount, n),
+                    'timeCreated': '2022-01-01T00:00:00.0000000Z',
+                    'sku': {'name': 'Standard_D2s_v3'}
+                }
+            }
+
+    def fargate_tasks(self, lw_subaccount: str) -> Iterator[dict]:
+        rng = self.rng(lw_subaccount, 'fargate')
+        for n in range(self.counts(lw_subaccount)['fargate']):
+            task_arn = fargate_task_arn(lw_subaccount, n)
+            image = 'lacework/datacollector:latest' if rng.random() < 0.2 else 'nginx:latest'
+            yield {
+                'resourceType': 'ecs:task',
+                'resourceConfig': {
+                    'taskArn': task_arn,
+                    'launchType': 'FARGATE',
+                    'tags': {'service': f'svc-{n % 20}'},
+                    'containers': [{'image': image, 'taskArn': task_arn}]
+                }
+            }
+
+    ########
+    # agents
+    ########
+    def agent_pages(self, lw_subaccount: str, body: dict) -> Iterator[dict]:
+        return self.paged(self.agents(lw_subaccount))
+
+    def agents(self, lw_subaccount: str) -> Iterator[dict]:
+        rng = self.rng(lw_subaccount, 'agents')
+        counts = self.counts(lw_subaccount)
+        account = aws_account(lw_subaccount)
+
+        for n in range(counts['aws']):
+            if rng.random() < self.coverage:
+                yield agent(
+                    f'ip-{n}', {
+                        'VmProvider': 'AWS', 'InstanceId': aws_instance_id(lw_subaccount, n), 'Account': account,
+                        'Hostname': f'ip-{n}'
+                    }
+                )
+        for n in range(counts['gcp']):
+            if rng.random() < self.coverage:
+                yield agent(
+                    f'instance-{n}', {
+                        'VmProvider': 'GCE', 'InstanceId': gcp_instance_id(lw_subaccount, n),
+                        'ProjectId': f'{lw_subaccount}-project', 'Hostname': f'instance-{n}'
+                    }
+                )
+        for n in range(counts['azure']):
+            if rng.random() < self.coverage:
+                yield agent(
+                    f'vm-{n}', {
+                        'VmProvider': 'Microsoft.Compute', 'InstanceId': azure_vm_id(lw_subaccount, n),
+                        'Account': lw_subaccount, 'Hostname': f'vm-{n}'
+                    }
+                )
+        for n in range(counts['azure_vmss']):
+            if rng.random() < self.coverage:
+                yield agent(
+                    f'vmss-{n % 4}{n:06x}', {
+                        'VmProvider': 'Microsoft.Compute', 'InstanceId': azure_vmss_vm_id(lw_subaccount, n),
+                        'Account': lw_subaccount, 'Hostname': f'vmss-{n % 4}{n:06x}'
+                    }
+                )
+        for n in range(counts['fargate']):
+            if rng.random() < self.coverage:
+                task_arn = fargate_task_arn(lw_subaccount, n)
+                yield agent(f'{task_arn}_{n % 3}', {
+                    'VmProvider': 'AWS',
+                    'VmInstanceType': 'AWS_ECS_V4FARGATE',
+                    'Hostname': f'{task_arn}_{n % 3}',
+                    'net.lacework.aws.fargate.taskarn': task_arn
+                }, 'ACTIVE' if rng.random() < 0.9 else 'INACTIVE')
+        # agents on hosts the inventory does not know about
+        for n in range(max(1, self.subaccount_hosts(lw_subaccount) // 20)):
+            yield agent(f'on-prem-{lw_subaccount}-{n}', {'Hostname': f'on-prem-{n}'})
+
+
+class FakeSearchEndpoint():
+    def __init__(self, client: object, pages: object, resource: str) -> None:
+        self.client = client
+        self.pages = pages
+        # what ThrottledClient pages through: the same pages, encoded as the api sends them
+        self.RESOURCE = resource
+        self._session = FakeSession(self)
+
+    def search(self, json: dict) -> Iterator[dict]:
+        return self.pages(self.client.subaccount, json)
+
+    def _build_url(self, resource: str, action: str) -> str:
+        return f'/{resource}/{action}'
+
+
+class FakeResponse():
+    def __init__(self, content: bytes, records: int, next_page: str) -> None:
+        self.content = content
+        # known without decoding the content, for the benchmark to drain a search
+        self.records = records
+        self.next_page = next_page
+
+    def json(self) -> dict:
+        return json.loads(self.content)
+
+
+class FakeSession():
+    """Serves a FakeSearchEndpoint's pages as encoded responses, linked by nextPage urls"""
+    def __init__(self, endpoint: FakeSearchEndpoint) -> None:
+        self.endpoint = endpoint
+        self.lock = threading.Lock()
+        self.tokens = itertools.count()
+        # nextPage url -> (that page, the pages after it)
+        self.cursors = dict()
+
+    def post(self, url: str, **kwargs) -> FakeResponse:
+        pages = iter(self.endpoint.search(json=kwargs['json']))
+        return self.respond(next(pages, {'data': []}), pages)
+
+    def get(self, url: str) -> FakeResponse:
+        with self.lock:
+            page, pages = self.cursors.pop(url)
+        return self.respond(page, pages)
+
+    def respond(self, page: dict, pages: Iterator[dict]) -> FakeResponse:
+        # one page of lookahead, so every response knows whether to advertise a nextPage url
+        following = next(pages, None)
+        next_page = None
+        if following is not None:
+            with self.lock:
+                next_page = f'/{self.endpoint.RESOURCE}/{next(self.tokens)}'
+                self.cursors[next_page] = (following, pages)
+        content = json.dumps({'paging': {'urls': {'nextPage': next_page}}, 'data': page['data']}).encode()
+        return FakeResponse(content, len(page['data']), next_page)
+
+
+class FakeLaceworkClient():
+    """Enough of LaceworkClient for the reconciliation pipeline, served from a SyntheticTenant"""
+    def __init__(self, tenant: SyntheticTenant, subaccount: str = None) -> None:
+        self.tenant = tenant
+        self.subaccount = subaccount if subaccount is not None else tenant.subaccounts[0]
+        self.inventory = FakeSearchEndpoint(self, tenant.inventory_pages, 'Inventory')
+        self.agent_info = FakeSearchEndpoint(self, tenant.agent_pages, 'AgentInfo')
+
+    def set_subaccount(self, subaccount: str) -> None:
+        self.subaccount = subaccount
+
+
+def agent(hostname: str, tags: dict, status: str = 'ACTIVE') -> dict:
+    return {'hostname': hostname, 'status': status, 'tags': tags}
+
+
+def aws_account(lw_subaccount: str) -> str:
+    return f'{sum(map(ord, lw_subaccount)) % 10**12:012d}'
+
+
+def aws_instance_id(lw_subaccount: str, n: int) -> str:
+    return f'i-{hash_prefix(lw_subaccount)}{n:011x}'
+
+
+def gcp_instance_id(lw_subaccount: str, n: int) -> str:
+    return f'{sum(map(ord, lw_subaccount))}{n:012d}'
+
+
+def azure_vm_id(lw_subaccount: str, n: int) -> str:
+    return f'{hash_prefix(lw_subaccount)}-0000-4000-8000-{n:012x}'
+
+
+def azure_vmss_vm_id(lw_subaccount: str, n: int) -> str:
+    return f'{hash_prefix(lw_subaccount)}-0000-4000-9000-{n:012x}'
+
+
+def fargate_task_arn(lw_subaccount: str, n: int) -> str:
+    return f'arn:aws:ecs:us-east-1:{aws_account(lw_subaccount)}:task/cluster-{lw_subaccount}/{n:032x}'
+
+
+def hash_prefix(lw_subaccount: str) -> str:
+    return f'{sum(ord(c) * (i + 1) for i, c in enumerate(lw_subaccount)) % 16**6:06x}'
@@ -1,36 +1,154 @@
+import asyncio
 import json
+import multiprocessing
+import requests
+import re
 import argparse
 import logging
 import os
+import random
 import copy
-
+import csv
+import sqlite3
+import gzip
+import hashlib
+import sys
+import threading
+import time
+
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager, nullcontext
+from functools import partial
+from itertools import chain
+from typing import TextIO
 from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
 from laceworksdk import LaceworkClient
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from laceworksdk.exceptions import ApiError, RateLimitError
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+try:
+    import aiohttp
+except ImportError:
+    # only needed for --async
+    aiohttp = None
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, where --metrics omits peak memory
+    resource = None
 
 logger = logging.getLogger('instance-discovery')
 
 MAX_RESULT_SET: int = 500_000
 LOOKBACK_DAYS: int = 1
-INVENTORY_CACHE: dict = {}
-AGENT_CACHE: dict = {}
-INSTANCE_CLUSTER_CACHE: dict = {}
+# an incremental fetch starts this long before the previous run's end,
+# for records ingested after that run but timestamped before it
+INCREMENTAL_OVERLAP_SECONDS: int = 300
+MAX_WORKERS: int = 20
+# agent, fargate and the four INVENTORY_NORMALIZERS fetches run concurrently within each subaccount
+SUBACCOUNT_FETCH_WORKERS: int = 6
+FARGATE_INSTANCE_TYPE: str = 'AWS_ECS_V4FARGATE'
+OUTPUT_CHUNK_SIZE: int = 64 * 1024
+OUTPUT_BUFFER_SIZE: int = 1024 * 1024
+CACHE_TTL_SECONDS: int = 3600
+CACHE_MAX_BYTES: int = 1024 * 1024 * 1024
+MAX_RETRIES: int = 5
+BASE_BACKOFF_SECONDS: float = 1.0
+MAX_BACKOFF_SECONDS: float = 60.0
+LATENCY_TARGET_SECONDS: float = 10.0
+# a time slice returning this many records is split in two and fetched again, well before the api's result cap
+SLICE_SPLIT_THRESHOLD: int = int(MAX_RESULT_SET * 0.9)
+MIN_SLICE_SECONDS: int = 60
+# pages each --async search downloads ahead of its consumer
+ASYNC_PAGES_AHEAD: int = 2
+REFRESH_INTERVAL_SECONDS: int = 900
+# records buffered per --sqlite transaction
+SQLITE_BATCH_SIZE: int = 10_000
+RESULT_SETS: list[str] = ['instances_without_agents', 'instances_with_agents', 'agents_without_inventory']
+# columns indexed in each --sqlite result set table, created once the load has finished
+SQLITE_INDEXED_COLUMNS: list[str] = [
+    'urn', 'subaccount', 'cloud', 'is_kubernetes', 'os_image', 'os_image_name', 'creation_time', 'cluster', 'tenant'
+]
+SERVE_ADDRESS: str = '127.0.0.1'
+# CoverageCounter dimension -> the labels its values are published under by --serve
+METRIC_DIMENSIONS: dict = {
+    'subaccount': ('tenant', 'subaccount'),
+    'cloud': ('cloud',),
+    'cluster': ('subaccount', 'cloud', 'cluster')
+}
+# tags and labels marking a kubernetes node, and naming its cluster
+EKS_CLUSTER_TAG: str = 'eks:cluster-name'
+GKE_NODE_LABEL: str = 'goog-gke-node'
+GKE_CLUSTER_LABEL: str = 'goog-k8s-cluster-name'
+AKS_TAG_PREFIX: str = 'aks-managed-'
+AKS_CLUSTER_TAG: str = 'aks-managed-cluster-name'
+URN_SEGMENT_PATTERN = re.compile(r'[/:]')
+# urn prefix -> cloud, for the --statistics breakdown
+URN_CLOUD_PREFIXES: list[tuple[str, str]] = [
+    ('arn:aws:ecs:', 'AWS Fargate'),
+    ('arn:aws:', 'AWS'),
+    ('//compute.googleapis.com/', 'GCP'),
+    ('/subscriptions/', 'Azure')
+]
+# --metrics phase of inventory searches outside INVENTORY_NORMALIZERS, which declare their own
+SEARCH_PHASES: dict = {
+    'ecs:task': 'fargate_inventory'
+}
+
+
+def intern_value(value: object) -> object:
+    # subaccount and image names repeat across most records, so share one copy of each string
+    return sys.intern(value) if type(value) == str else value
 
 
 class OutputRecord():
-    def __init__(self, urn: str, creation_time: str, is_kubernetes: bool, subaccount: str, os_image: str, tags: object = None) -> None:
+    __slots__ = ('urn', 'creation_time', 'is_kubernetes', 'os_image', 'subaccount', 'tags', 'cluster', 'tenant', '_tags_text')
+
+    def __init__(
+        self, urn: str, creation_time: str, is_kubernetes: bool, subaccount: str, os_image: str, tags: object = None,
+        cluster: str = None, tenant: str = None
+    ) -> None:
         self.urn = urn
         self.creation_time = creation_time
         self.is_kubernetes = is_kubernetes
-        self.os_image = os_image
-        self.subaccount = subaccount
+        self.os_image = intern_value(os_image)
+        self.subaccount = intern_value(subaccount)
         self.tags = tags
-    
+        self.cluster = intern_value(cluster)
+        self.tenant = intern_value(tenant)
+        self._tags_text = None
+
+    @property
+    def tags_text(self) -> str:
+        # flattened tags for csv output, rendered on first use only
+        if self._tags_text is None:
+            self._tags_text = str(self.tags).replace(chr(34),chr(39))
+        return self._tags_text
+
+    def to_dict(self) -> dict:
+        record = {
+            'urn': self.urn,
+            'creation_time': self.creation_time,
+            'is_kubernetes': self.is_kubernetes,
+            'os_image': self.os_image,
+            'subaccount': self.subaccount,
+            'tags': self.tags,
+            'cluster': self.cluster
+        }
+        # only multi-tenant runs tag their records
+        if self.tenant is not None:
+            record['tenant'] = self.tenant
+        return record
+
     def __str__(self) -> str:
-        return json.dumps(self.__dict__, indent=4, sort_keys=True)
+        return json.dumps(self.to_dict(), indent=4, sort_keys=True)
 
     def __repr__(self) -> str:
-        return json.dumps(self.__dict__, indent=4, sort_keys=True)
+        return json.dumps(self.to_dict(), indent=4, sort_keys=True)
     
     def __eq__(self, o: object) -> bool:
         return self.urn == o.urn
@@ -40,7 +158,10 @@ class OutputRecord():
 
 
 class InstanceResult():
-    def __init__(self, instances_without_agents: set[OutputRecord], instances_with_agents: set[OutputRecord], agents_without_inventory: set[OutputRecord]) -> None:
+    def __init__(
+        self, instances_without_agents: set[OutputRecord], instances_with_agents: set[OutputRecord],
+        agents_without_inventory: set[OutputRecord]
+    ) -> None:
         self.instances_without_agents = list(instances_without_agents)
         self.instances_with_agents = list(instances_with_agents)
         self.agents_without_inventory = list(agents_without_inventory)
@@ -49,42 +170,1050 @@ class InstanceResult():
         self.instances_with_agents.sort(key=lambda x: x.urn)
         self.agents_without_inventory.sort(key=lambda x: x.urn)
 
-    def printJson(self) -> None:
-        print(json.dumps(self.__dict__, indent=4, sort_keys=True, default=serialize))
+    def printJson(self, stream: TextIO = None, compact: bool = False) -> None:
+        stream = stream if stream is not None else sys.stdout
+        if compact:
+            encoder = json.JSONEncoder(separators=(',', ':'), sort_keys=True, default=serialize)
+        else:
+            encoder = json.JSONEncoder(indent=4, sort_keys=True, default=serialize)
+        write_chunks(stream, encoder.iterencode(self.__dict__))
+        stream.write('\n')
+
+    def printCsv(self, stream: TextIO = None) -> None:
+        stream = stream if stream is not None else sys.stdout
+        writer = csv.writer(stream, lineterminator='\n')
+        header = [
+            'Identifier', 'CreationTime', 'Instance_without_agent', 'Instance_reconciled_with_agent',
+            'Agent_without_inventory', 'Os_image', 'Tags', 'Subaccount'
+        ]
+        records = chain(self.instances_without_agents, self.instances_with_agents, self.agents_without_inventory)
+        if any(record.tenant is not None for record in records):
+            # multi-tenant runs add a trailing column, so single tenant csv keeps its shape
+            writer.writerow(header + ['Tenant'])
+            writer.writerows(csv_row(i, 'true', '', '') + [i.tenant] for i in self.instances_without_agents)
+            writer.writerows(csv_row(i, '', 'true', '') + [i.tenant] for i in self.instances_with_agents)
+            writer.writerows(csv_row(i, '', '', 'true') + [i.tenant] for i in self.agents_without_inventory)
+            return
+        writer.writerow(header)
+        writer.writerows(csv_row(i, 'true', '', '') for i in self.instances_without_agents)
+        writer.writerows(csv_row(i, '', 'true', '') for i in self.instances_with_agents)
+        writer.writerows(csv_row(i, '', '', 'true') for i in self.agents_without_inventory)
+
+    def printStandard(self, stream: TextIO = None) -> None:
+        stream = stream if stream is not None else sys.stdout
+        if len(self.instances_without_agents) > 0:
+            stream.write('Instances without agent:\n')
+            write_chunks(stream, (f'\t{instance.urn}\n' for instance in self.instances_without_agents))
+            stream.write('\n\n')
 
-    def printCsv(self) -> None:
-        print("Identifier,CreationTime,Instance_without_agent,Instance_reconciled_with_agent,Agent_without_inventory,Os_image,Tags,Subaccount")
-        for i in self.instances_without_agents:
-            print(f'{i.urn},{i.creation_time},true,,,"{i.os_image}","{str(i.tags).replace(chr(34),chr(39))}",{i.subaccount}')
+        if len(self.instances_with_agents) > 0:
+            stream.write('Instances reconciled with agent:\n')
+            write_chunks(stream, (f'\t{instance.urn}\n' for instance in self.instances_with_agents))
+            stream.write('\n\n')
 
-        for i in self.instances_with_agents:
-            print(f'{i.urn},{i.creation_time},,true,,"{i.os_image}","{str(i.tags).replace(chr(34),chr(39))}",{i.subaccount}')
+        if len(self.agents_without_inventory) > 0:
+            stream.write('Agents without corresponding inventory:\n')
+            write_chunks(stream, (f'\t{instance.urn}\n' for instance in self.agents_without_inventory))
+            stream.write('\n\n')
+
+
+def csv_row(record: OutputRecord, without_agent: str, with_agent: str, without_inventory: str) -> list:
+    # the csv writer takes care of quoting
+    return [
+        record.urn, record.creation_time, without_agent, with_agent, without_inventory,
+        record.os_image, record.tags_text, record.subaccount
+    ]
+
+
+def write_chunks(stream: TextIO, pieces: Iterable[str], chunk_size: int = OUTPUT_CHUNK_SIZE) -> None:
+    # coalesce many small encoder fragments into fewer, larger writes
+    buffer = list()
+    buffered = 0
+    for piece in pieces:
+        buffer.append(piece)
+        buffered += len(piece)
+        if buffered >= chunk_size:
+            stream.write(''.join(buffer))
+            buffer.clear()
+            buffered = 0
+    if buffer:
+        stream.write(''.join(buffer))
+
+
+class AgentSnapshot():
+    """All agent_info records for one subaccount and time window, partitioned by provider in a single pass"""
+    def __init__(self, agent_info: object) -> None:
+        self.by_provider = dict()
+        self.fargate = list()
+        self.count = 0
+
+        for page in agent_info:
+            for r in page.get('data', []):
+                self.count += 1
+                tags = r['tags'] if 'tags' in r else {}
+                provider = tags.get('VmProvider')
+                self.by_provider.setdefault(provider, []).append(r)
+                if provider == 'AWS' and tags.get('VmInstanceType') == FARGATE_INSTANCE_TYPE:
+                    self.fargate.append(r)
+
+
+class PhaseMetrics():
+    """Wall time and counters per phase, safe to update from the fetch threads and the async engine"""
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.seconds = None
+        self.phases = dict()
+
+    def add(self, phase: str, **counters: float) -> None:
+        with self.lock:
+            totals = self.phases.setdefault(phase, {
+                'seconds': 0.0, 'pages': 0, 'records': 0, 'bytes_received': 0, 'parse_failures': 0
+            })
+            for name, value in counters.items():
+                totals[name] += value
+
+    @contextmanager
+    def timed(self, phase: str):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(phase, seconds=time.monotonic() - started)
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            phases = {phase: dict(totals, seconds=round(totals['seconds'], 3)) for phase, totals in self.phases.items()}
+        return {'seconds': round(self.seconds, 3) if self.seconds is not None else None, 'phases': phases}
+
+
+class RunMetrics():
+    """Everything --metrics reports: run-level phases, per-subaccount phases and peak memory"""
+    def __init__(self) -> None:
+        self.started = time.monotonic()
+        self.run = PhaseMetrics()
+        self.lock = threading.Lock()
+        self.subaccounts = dict()
+
+    def subaccount(self, lw_subaccount: str) -> PhaseMetrics:
+        # called from each tenant's scheduling thread
+        with self.lock:
+            return self.subaccounts.setdefault(lw_subaccount, PhaseMetrics())
+
+    def to_dict(self) -> dict:
+        self.run.seconds = time.monotonic() - self.started
+        return {
+            'run': self.run.to_dict(),
+            'peak_memory_bytes': peak_memory_bytes(),
+            'subaccounts': {lw_subaccount: metrics.to_dict() for lw_subaccount, metrics in sorted(self.subaccounts.items())}
+        }
+
+    def write(self, stream: TextIO) -> None:
+        json.dump(self.to_dict(), stream, indent=4, sort_keys=True)
+        stream.write('\n')
+
+
+class SubaccountContext():
+    """Lookup indexes for a single subaccount's reconciliation, released once its report is merged"""
+    def __init__(
+        self, lw_subaccount: str, metrics: PhaseMetrics = None, time_sliced: bool = False, parse_pool: Executor = None
+    ) -> None:
+        self.lw_subaccount = lw_subaccount
+        self.inventory_cache = dict()
+        self.agent_cache = dict()
+        # always counted, but only reported with --metrics
+        self.metrics = metrics if metrics is not None else PhaseMetrics()
+        # time sliced searches can legitimately return more than MAX_RESULT_SET records
+        self.time_sliced = time_sliced
+        # --parse-processes pool inventory pages are normalized on, or None to normalize them inline
+        self.parse_pool = parse_pool
+
+
+class SearchCache():
+    """On-disk cache of search result pages, keyed by subaccount, query body and lookback window"""
+    def __init__(
+        self, cache_dir: str, ttl: int = CACHE_TTL_SECONDS, max_bytes: int = CACHE_MAX_BYTES,
+        lookback_seconds: int = LOOKBACK_DAYS * 24 * 3600
+    ) -> None:
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lookback_seconds = lookback_seconds
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, lw_subaccount: str, endpoint: str, body: dict) -> str:
+        normalized = dict(body)
+        if 'timeFilter' in normalized:
+            # a full lookback window always ends at "now", so key it on its length and let the ttl decide freshness.
+            # shorter windows (--incremental fetches since the previous run) are keyed on their bounds, as two
+            # consecutive windows of the same length cover different changes
+            if cache_window(normalized['timeFilter']) == self.lookback_seconds:
+                normalized['timeFilter'] = self.lookback_seconds
+        material = json.dumps([lw_subaccount, endpoint, normalized], sort_keys=True)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f'{key}.json.gz')
+
+    def load(self, key: str) -> list:
+        path = self.path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def store(self, key: str, pages: list) -> None:
+        path = self.path(key)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(pages, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self) -> None:
+        entries = list()
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.json.gz'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        # expired entries go first, then the oldest until we are back under the size limit
+        now = time.time()
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, path in sorted(entries):
+            if now - mtime <= self.ttl and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def search(self, search: object, lw_subaccount: str, endpoint: str, body: dict) -> Iterator[dict]:
+        key = self.key(lw_subaccount, endpoint, body)
+        pages = self.load(key)
+        if pages is not None:
+            logger.debug('%s %s: served %d pages from cache', lw_subaccount, endpoint, len(pages))
+            return iter(pages)
+        return self._record(key, search(json=body))
+
+    def _record(self, key: str, pages: Iterator[dict]) -> Iterator[dict]:
+        collected = list()
+        for page in pages:
+            collected.append(page)
+            yield page
+        # only a fully drained search is worth keeping
+        self.store(key, collected)
+
+
+class SearchEndpointProxy():
+    def __init__(self, client: object, endpoint: object, name: str) -> None:
+        self.client = client
+        self.endpoint = endpoint
+        self.name = name
+
+    def search(self, json: dict) -> Iterator[dict]:
+        return self.client.search(self.endpoint, self.name, json)
+
+    def search_normalized(
+        self, json: dict, resource_type: str, parse_pool: Executor
+    ) -> Iterator[tuple[list[tuple], list[tuple], int]]:
+        return self.client.search_normalized(self.endpoint, self.name, json, resource_type, parse_pool)
+
+    def __getattr__(self, name: str) -> object:
+        return getattr(self.endpoint, name)
+
+
+class ClientProxy():
+    """LaceworkClient stand-in which routes inventory and agent_info searches through its search method"""
+    def __init__(self, client: LaceworkClient) -> None:
+        self.client = client
+        self.inventory = SearchEndpointProxy(self, client.inventory, 'inventory')
+        self.agent_info = SearchEndpointProxy(self, client.agent_info, 'agent_info')
+
+    def search(self, endpoint: object, name: str, body: dict) -> Iterator[dict]:
+        return endpoint.search(json=body)
+
+    def search_normalized(
+        self, endpoint: object, name: str, body: dict, resource_type: str, parse_pool: Executor
+    ) -> Iterator[tuple[list[tuple], list[tuple], int]]:
+        # only ThrottledClient sees raw responses; a proxy that needs decoded pages (the cache, time slices, --async)
+        # hands them on decoded, and they are normalized inline, as pickling them to a worker costs more than that saves
+        return (normalize_page(resource_type, page.get('data', [])) for page in self.search(endpoint, name, body))
+
+    def __getattr__(self, name: str) -> object:
+        return getattr(self.client, name)
+
+
+class CachedClient(ClientProxy):
+    """Serves inventory and agent_info searches through a SearchCache"""
+    def __init__(self, client: LaceworkClient, cache: SearchCache, lw_subaccount: str) -> None:
+        super().__init__(client)
+        self.cache = cache
+        self.lw_subaccount = lw_subaccount
+
+    def search(self, endpoint: object, name: str, body: dict) -> Iterator[dict]:
+        return self.cache.search(endpoint.search, self.lw_subaccount, name, body)
+
+
+class MeteredClient(ClientProxy):
+    """Counts the pages, records and wall time of every search into a subaccount's PhaseMetrics"""
+    def __init__(self, client: LaceworkClient, metrics: PhaseMetrics) -> None:
+        super().__init__(client)
+        self.metrics = metrics
+
+    def search(self, endpoint: object, name: str, body: dict) -> Iterator[dict]:
+        phase = search_phase(name, body)
+        # the clock runs until the consumer drains the search, so it covers parsing as well as paging
+        started = time.monotonic()
+        try:
+            for page in endpoint.search(json=body):
+                self.metrics.add(phase, pages=1, records=len(page.get('data', [])) if isinstance(page, dict) else 0)
+                yield page
+        finally:
+            self.metrics.add(phase, seconds=time.monotonic() - started)
+
+    def search_normalized(
+        self, endpoint: object, name: str, body: dict, resource_type: str, parse_pool: Executor
+    ) -> Iterator[tuple[list[tuple], list[tuple], int]]:
+        phase = search_phase(name, body)
+        started = time.monotonic()
+        try:
+            normalized_pages = endpoint.search_normalized(json=body, resource_type=resource_type, parse_pool=parse_pool)
+            for rows, warnings, failures in normalized_pages:
+                self.metrics.add(phase, pages=1, records=len(rows) + failures)
+                yield (rows, warnings, failures)
+        finally:
+            self.metrics.add(phase, seconds=time.monotonic() - started)
+
+
+class AdaptiveLimiter():
+    """Bounds in-flight API requests; the bound halves on throttling and grows back by one per window of successes"""
+    def __init__(
+        self, ceiling: int, max_retries: int = MAX_RETRIES, latency_target: float = LATENCY_TARGET_SECONDS,
+        global_cap: threading.Semaphore = None
+    ) -> None:
+        self.ceiling = max(1, ceiling)
+        # shared by every tenant's limiter, so throttling is per account but --max-workers still bounds the whole run
+        self.global_cap = global_cap
+        self.limit = float(self.ceiling)
+        self.max_retries = max_retries
+        self.latency_target = latency_target
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+    def acquire(self) -> None:
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+        if self.global_cap is not None:
+            self.global_cap.acquire()
+
+    def release(self, congested: bool, latency: float) -> None:
+        if self.global_cap is not None:
+            self.global_cap.release()
+        with self.condition:
+            self.in_flight -= 1
+            if congested:
+                self.limit = max(1.0, self.limit / 2)
+            elif latency > self.latency_target:
+                self.limit = max(1.0, self.limit * 0.9)
+            else:
+                self.limit = min(float(self.ceiling), self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+    def call(self, request: Callable, *args, **kwargs) -> object:
+        for attempt in range(self.max_retries + 1):
+            self.acquire()
+            started = time.monotonic()
+            congested = False
+            try:
+                return request(*args, **kwargs)
+            except Exception as ex:
+                congested = is_retryable(ex)
+                if not congested or attempt == self.max_retries:
+                    raise
+                delay = retry_delay(ex, attempt)
+                logger.warning(
+                    f'API request throttled or failed ({ex}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s'
+                )
+            finally:
+                self.release(congested, time.monotonic() - started)
+            time.sleep(delay)
+
+
+class ThrottledClient(ClientProxy):
+    """Pages through inventory and agent_info searches one request at a time under an AdaptiveLimiter"""
+    def __init__(self, client: LaceworkClient, limiter: AdaptiveLimiter, metrics: PhaseMetrics = None) -> None:
+        super().__init__(client)
+        self.limiter = limiter
+        self.metrics = metrics if metrics is not None else PhaseMetrics()
+
+    def search(self, endpoint: object, name: str, body: dict) -> Iterator[dict]:
+        phase = search_phase(name, body)
+        # same paging as the sdk's SearchEndpoint.search, but each request is retried on its own
+        url = endpoint._build_url(resource=endpoint.RESOURCE, action='search')
+        response = self.limiter.call(endpoint._session.post, url, json=body)
+        while True:
+            self.metrics.add(phase, bytes_received=len(response.content))
+            page = response.json()
+            yield page
+
+            next_page = page.get('paging', {}).get('urls', {}).get('nextPage') if isinstance(page, dict) else None
+            if not next_page:
+                break
+            response = self.limiter.call(endpoint._session.get, next_page)
+
+    def search_normalized(
+        self, endpoint: object, name: str, body: dict, resource_type: str, parse_pool: Executor
+    ) -> Iterator[tuple[list[tuple], list[tuple], int]]:
+        phase = search_phase(name, body)
+        # the raw response goes to a --parse-processes worker, which decodes and normalizes it
+        # and hands back the next page's url along with the rows, so the main process never decodes inventory
+        url = endpoint._build_url(resource=endpoint.RESOURCE, action='search')
+        response = self.limiter.call(endpoint._session.post, url, json=body)
+        while True:
+            self.metrics.add(phase, bytes_received=len(response.content))
+            next_page, normalized = parse_pool.submit(parse_raw_page, resource_type, response.content).result()
+            yield normalized
+
+            if not next_page:
+                break
+            response = self.limiter.call(endpoint._session.get, next_page)
+
+
+class PartitionedClient(ClientProxy):
+    """Splits each search's time window into slices fetched in parallel, splitting again any slice that nears the result cap"""
+    def __init__(
+        self, client: LaceworkClient, slices: int, split_threshold: int = SLICE_SPLIT_THRESHOLD,
+        min_slice_seconds: int = MIN_SLICE_SECONDS
+    ) -> None:
+        super().__init__(client)
+        self.slices = max(1, slices)
+        self.split_threshold = split_threshold
+        self.min_slice_seconds = min_slice_seconds
+
+    def search(self, endpoint: object, name: str, body: dict) -> Iterator[dict]:
+        window = parse_time_filter(body.get('timeFilter'))
+        if window is None:
+            return endpoint.search(json=body)
+        return self._search(endpoint, name, body, window)
+
+    def _fetch_slice(self, endpoint: object, body: dict, start: datetime, end: datetime) -> list:
+        records = list()
+        for page in endpoint.search(json=dict(body, timeFilter=format_time_filter(start, end))):
+            records.extend(page.get('data', []))
+            if len(records) >= self.split_threshold and (end - start).total_seconds() >= 2 * self.min_slice_seconds:
+                # abandon the slice; the caller fetches its two halves instead
+                return None
+        if len(records) >= self.split_threshold:
+            logger.warning(
+                '%s to %s returned %d records and cannot be split further, results may be truncated', start, end, len(records)
+            )
+        return records
+
+    def _search(self, endpoint: object, name: str, body: dict, window: tuple[datetime, datetime]) -> Iterator[dict]:
+        slices = dict()
+        with ThreadPoolExecutor(max_workers=self.slices) as executor:
+            pending = {
+                executor.submit(self._fetch_slice, endpoint, body, start, end): (start, end)
+                for start, end in split_window(*window, self.slices)
+            }
+            while pending:
+                task = next(as_completed(pending))
+                start, end = pending.pop(task)
+                records = task.result()
+                if records is None:
+                    logger.debug('%s search from %s to %s neared the result cap, splitting', name, start, end)
+                    for half_start, half_end in split_window(start, end, 2):
+                        task = executor.submit(self._fetch_slice, endpoint, body, half_start, half_end)
+                        pending[task] = (half_start, half_end)
+                else:
+                    slices[start] = records
+
+        # newest slice first, so a resource seen in several slices keeps its latest snapshot
+        seen = set()
+        for start in sorted(slices, reverse=True):
+            records = slices.pop(start)
+            keys = [search_record_key(name, r) for r in records]
+            yield {'data': [r for key, r in zip(keys, records) if key not in seen]}
+            seen.update(keys)
+
+
+def is_time_sliced(client: object) -> bool:
+    while isinstance(client, ClientProxy):
+        if isinstance(client, PartitionedClient):
+            return True
+        client = client.client
+    return False
 
-        for i in self.agents_without_inventory:
-            print(f'{i.urn},{i.creation_time},,,true,"{i.os_image}","{str(i.tags).replace(chr(34),chr(39))}",{i.subaccount}')
 
-    def printStandard(self) -> None:
-        if len(self.instances_without_agents) > 0:
-            print(f'Instances without agent:')
-            for instance in self.instances_without_agents:
-                print(f'\t{instance.urn}')
-            print('\n')
+class SearchError(Exception):
+    """A failed search request made by the AsyncSearchEngine"""
+    def __init__(self, status_code: int, message: str, retry_after: str = None) -> None:
+        super().__init__(f'[{status_code}] {message}' if status_code else message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        # no status code means the connection itself failed
+        return self.status_code is None or self.status_code == 429 or self.status_code >= 500
+
+
+class AsyncSearchEngine():
+    """Runs every sub-account's searches on one event loop thread over a shared aiohttp connection pool and access token"""
+    def __init__(self, client: LaceworkClient, max_in_flight: int = MAX_WORKERS, max_retries: int = MAX_RETRIES) -> None:
+        self.http_session = client.inventory._session
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_retries = max_retries
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='async-search', daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self._open(), self.loop).result()
+
+    async def _open(self) -> None:
+        self.semaphore = asyncio.Semaphore(self.max_in_flight)
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_in_flight),
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=300)
+        )
 
-        if len(self.instances_with_agents) > 0:
-            print(f'Instances reconciled with agent:')
-            for instance in self.instances_with_agents:
-                print(f'\t{instance.urn}')
-            print('\n')
+    def close(self) -> None:
+        asyncio.run_coroutine_threadsafe(self.session.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def headers(self, lw_subaccount: str) -> dict:
+        # only ever called on the loop thread, so the sdk's token refresh is never raced
+        self.http_session._check_access_token()
+        headers = {
+            'Authorization': f'Bearer {self.http_session._access_token}',
+            'Content-Type': 'application/json',
+            'Org-Access': 'false'
+        }
+        if lw_subaccount:
+            headers['Account-Name'] = lw_subaccount
+        return headers
+
+    async def _request(self, method: str, url: str, lw_subaccount: str, body: dict = None, received: Callable = None) -> dict:
+        for attempt in range(self.max_retries + 1):
+            async with self.semaphore:
+                try:
+                    async with self.session.request(method, url, json=body, headers=self.headers(lw_subaccount)) as response:
+                        if response.status == 204:
+                            return {'data': []}
+                        elif response.status < 300:
+                            content = await response.read()
+                            if received:
+                                received(len(content))
+                            return json.loads(content)
+                        error = SearchError(response.status, await response.text(), response.headers.get('Retry-After'))
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as ex:
+                    error = SearchError(None, f'{type(ex).__name__}: {ex}')
+
+            if not error.retryable or attempt == self.max_retries:
+                raise error
+            delay = backoff_delay(attempt, error.retry_after)
+            logger.warning(
+                f'API request throttled or failed ({error}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s'
+            )
+            await asyncio.sleep(delay)
+
+    async def _search(self, url: str, body: dict, lw_subaccount: str, pages: asyncio.Queue, received: Callable = None) -> None:
+        # a full queue pauses the download until the consumer catches up; cancellation is left to propagate
+        try:
+            page = await self._request('POST', url, lw_subaccount, body, received)
+            while True:
+                await pages.put(page)
+                next_page = page.get('paging', {}).get('urls', {}).get('nextPage') if isinstance(page, dict) else None
+                if not next_page:
+                    break
+                page = await self._request('GET', next_page, lw_subaccount, received=received)
+        except Exception as ex:
+            await pages.put(ex)
+            return
+        await pages.put(None)
+
+    def search(self, endpoint: object, body: dict, lw_subaccount: str, received: Callable = None) -> Iterator[dict]:
+        url = self.http_session._base_url + endpoint._build_url(resource=endpoint.RESOURCE, action='search')
+        pages = asyncio.Queue(ASYNC_PAGES_AHEAD)
+        download = asyncio.run_coroutine_threadsafe(self._search(url, body, lw_subaccount, pages, received), self.loop)
+        try:
+            while True:
+                page = asyncio.run_coroutine_threadsafe(pages.get(), self.loop).result()
+                if page is None:
+                    break
+                elif isinstance(page, Exception):
+                    raise page
+                yield page
+        finally:
+            # a consumer that stops early, such as a time slice abandoned near the result cap, stops the download too
+            download.cancel()
+
+
+class AsyncSearchClient(ClientProxy):
+    """Hands inventory and agent_info searches to a shared AsyncSearchEngine instead of a per sub-account session"""
+    def __init__(self, client: LaceworkClient, engine: AsyncSearchEngine, metrics: PhaseMetrics = None) -> None:
+        super().__init__(client)
+        self.engine = engine
+        self.metrics = metrics if metrics is not None else PhaseMetrics()
+        # captured now, as the shared client is pointed at the next sub-account straight after
+        self.lw_subaccount = client.inventory._session._subaccount
+
+    def search(self, endpoint: object, name: str, body: dict) -> Iterator[dict]:
+        received = partial(self.add_bytes, search_phase(name, body))
+        return self.engine.search(endpoint, body, self.lw_subaccount, received)
+
+    def add_bytes(self, phase: str, received: int) -> None:
+        self.metrics.add(phase, bytes_received=received)
+
+
+def without_sdk_retries(client: LaceworkClient) -> LaceworkClient:
+    # the AdaptiveLimiter owns search retries: the sdk session's own urllib3 retries on 5xx would multiply them,
+    # and would hide the failures the limiter backs off on
+    adapter = HTTPAdapter(max_retries=0)
+    for endpoint in (client.inventory, client.agent_info):
+        endpoint._session._session.mount('http://', adapter)
+        endpoint._session._session.mount('https://', adapter)
+    return client
+
+
+def is_retryable(ex: Exception) -> bool:
+    if isinstance(ex, RateLimitError):
+        return True
+    elif isinstance(ex, ApiError):
+        return ex.status_code >= 500
+    return isinstance(ex, (requests.ConnectionError, requests.Timeout))
+
+
+def retry_delay(ex: Exception, attempt: int) -> float:
+    response = getattr(ex, 'response', None)
+    return backoff_delay(attempt, response.headers.get('Retry-After') if response is not None else None)
+
+
+def backoff_delay(attempt: int, retry_after: str = None) -> float:
+    # honour the server's Retry-After when it sends one, otherwise full jitter exponential backoff
+    try:
+        return float(retry_after)
+    except (TypeError, ValueError):
+        return random.uniform(0, min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2 ** attempt))
 
-        if len(self.agents_without_inventory) > 0:
-            print(f'Agents without corresponding inventory:')
-            for instance in self.agents_without_inventory:
-                print(f'\t{instance.urn}')
-            print('\n')
+
+def search_phase(name: str, body: dict) -> str:
+    if name == 'agent_info':
+        return 'agents'
+    resource_type = next((f.get('value') for f in body.get('filters', []) if f.get('field') == 'resourceType'), None)
+    if resource_type in INVENTORY_NORMALIZERS:
+        return INVENTORY_NORMALIZERS[resource_type].phase
+    return SEARCH_PHASES.get(resource_type, name)
+
+
+def peak_memory_bytes() -> int:
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+def parse_time_filter(time_filter: dict) -> tuple[datetime, datetime]:
+    try:
+        return (
+            datetime.strptime(time_filter['startTime'], '%Y-%m-%dT%H:%M:%SZ'),
+            datetime.strptime(time_filter['endTime'], '%Y-%m-%dT%H:%M:%SZ')
+        )
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def format_time_filter(start: datetime, end: datetime) -> dict:
+    return {'startTime': start.strftime('%Y-%m-%dT%H:%M:%SZ'), 'endTime': end.strftime('%Y-%m-%dT%H:%M:%SZ')}
+
+
+def split_window(start: datetime, end: datetime, slices: int) -> list[tuple[datetime, datetime]]:
+    # whole seconds, as that is all the api's time filter carries
+    seconds = int((end - start).total_seconds())
+    slices = max(1, min(slices, seconds))
+    bounds = [start + timedelta(seconds=seconds * i // slices) for i in range(slices)] + [end]
+    return list(zip(bounds, bounds[1:]))
+
+
+def search_record_key(name: str, record: dict) -> object:
+    # what makes two records from different time slices the same host
+    if name == 'agent_info':
+        tags = record.get('tags') or {}
+        return (record.get('hostname'), tags.get('InstanceId'))
+    resource_config = record.get('resourceConfig') or {}
+    return record.get('urn') or resource_config.get('taskArn') or json.dumps(record, sort_keys=True)
+
+
+def cache_window(time_filter: dict) -> object:
+    try:
+        start = datetime.strptime(time_filter['startTime'], '%Y-%m-%dT%H:%M:%SZ')
+        end = datetime.strptime(time_filter['endTime'], '%Y-%m-%dT%H:%M:%SZ')
+    except (KeyError, TypeError, ValueError):
+        return time_filter
+    return int((end - start).total_seconds())
+
+
+class IncrementalState():
+    """Reconciliation inputs for one subaccount, carried between incremental runs with a last-seen time per entry"""
+    def __init__(self, data: dict = None) -> None:
+        data = data if data is not None else {}
+        self.end_time = data.get('end_time')
+        # identifier -> [last seen, OutputRecord]; records are only converted to and from dicts on disk
+        self.inventory = {
+            identifier: [seen, OutputRecord(**record)] for identifier, (seen, record) in data.get('inventory', {}).items()
+        }
+        self.agents = data.get('agents', {})
+        self.fargate_tasks = data.get('fargate_tasks', {})
+        self.fargate_agents = data.get('fargate_agents', {})
+        self.coverage = data.get('coverage', {})
+
+    def merge(
+        self, seen: str, context: SubaccountContext, instance_inventory: set, list_agent_instances: list,
+        fargate_inventory: object, fargate_agents: list
+    ) -> None:
+        for identifier in instance_inventory:
+            self.inventory[identifier] = [seen, context.inventory_cache[identifier]]
+        for instance in list_agent_instances:
+            self.agents[instance] = [seen, context.agent_cache.get(instance)]
+        for page in fargate_inventory:
+            for task in page['data']:
+                self.fargate_tasks[task['resourceConfig']['taskArn']] = [seen, task]
+        for agent in fargate_agents:
+            self.fargate_agents[agent['tags']['net.lacework.aws.fargate.taskarn']] = [seen, agent]
+
+    def expire(self, oldest: str) -> None:
+        for entries in (self.inventory, self.agents, self.fargate_tasks, self.fargate_agents):
+            for key in [k for k, (seen, _) in entries.items() if seen < oldest]:
+                del entries[key]
+
+    def context(self, lw_subaccount: str, metrics: PhaseMetrics = None) -> SubaccountContext:
+        context = SubaccountContext(lw_subaccount, metrics)
+        context.inventory_cache = {identifier: record for identifier, (_, record) in self.inventory.items()}
+        context.agent_cache = {instance: name for instance, (_, name) in self.agents.items() if name is not None}
+        return context
+
+    def fargate_inventory(self) -> list[dict]:
+        return [{'data': [task for _, task in self.fargate_tasks.values()]}]
+
+    def fargate_agent_snapshot(self) -> AgentSnapshot:
+        return AgentSnapshot([{'data': [agent for _, agent in self.fargate_agents.values()]}])
+
+    def coverage_delta(self, results: tuple[list, list, list]) -> dict:
+        instances_without_agents, matched_instances, _ = results
+        coverage = dict()
+        coverage.update((r.urn, 'instances_without_agents') for r in instances_without_agents)
+        coverage.update((r.urn, 'instances_with_agents') for r in matched_instances)
+
+        if self.end_time is None:
+            # the first run is the baseline; there is no previous coverage for a host to have changed from
+            self.coverage = coverage
+            return {'baseline': True, 'lost_coverage': [], 'gained_coverage': []}
+
+        delta = {
+            'lost_coverage': sorted(
+                (r for r in instances_without_agents if self.coverage.get(r.urn) != 'instances_without_agents'),
+                key=lambda x: x.urn
+            ),
+            'gained_coverage': sorted(
+                (r for r in matched_instances if self.coverage.get(r.urn) != 'instances_with_agents'), key=lambda x: x.urn
+            )
+        }
+        self.coverage = coverage
+        return dict(delta, baseline=False)
+
+    def to_dict(self) -> dict:
+        return {
+            'end_time': self.end_time,
+            'inventory': {identifier: [seen, record.to_dict()] for identifier, (seen, record) in self.inventory.items()},
+            'agents': self.agents,
+            'fargate_tasks': self.fargate_tasks,
+            'fargate_agents': self.fargate_agents,
+            'coverage': self.coverage
+        }
+
+
+class IncrementalStateStore():
+    """Per-subaccount IncrementalState kept in memory and, with a state directory, in files,
+    plus the coverage deltas computed this run
+
+    A one-shot run writes each state through to its file. --serve keeps the states warm in memory between refreshes
+    and only writes them out on flush, when the service stops.
+    """
+    def __init__(self, state_dir: str = None, write_through: bool = True) -> None:
+        self.state_dir = state_dir
+        self.write_through = write_through
+        self.states = dict()
+        self.deltas = dict()
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+
+    def path(self, lw_subaccount: str) -> str:
+        return os.path.join(self.state_dir, re.sub(r'[^A-Za-z0-9_.-]', '_', lw_subaccount) + '.json.gz')
+
+    def load(self, lw_subaccount: str) -> IncrementalState:
+        if lw_subaccount in self.states:
+            return self.states[lw_subaccount]
+        if not self.state_dir:
+            return IncrementalState()
+        try:
+            with gzip.open(self.path(lw_subaccount), 'rt', encoding='utf-8') as f:
+                return IncrementalState(json.load(f))
+        except FileNotFoundError:
+            return IncrementalState()
+
+    def save(self, lw_subaccount: str, state: IncrementalState) -> None:
+        self.states[lw_subaccount] = state
+        if self.state_dir and self.write_through:
+            self.write(lw_subaccount, state)
+
+    def flush(self) -> None:
+        if self.state_dir:
+            for lw_subaccount, state in list(self.states.items()):
+                self.write(lw_subaccount, state)
+
+    def write(self, lw_subaccount: str, state: IncrementalState) -> None:
+        path = self.path(lw_subaccount)
+        with gzip.open(f'{path}.tmp', 'wt', encoding='utf-8') as f:
+            json.dump(state.to_dict(), f, separators=(',', ':'))
+        os.replace(f'{path}.tmp', path)
+
+    def write_delta(self, stream: TextIO) -> None:
+        delta = {
+            'lost_coverage': sorted(
+                chain.from_iterable(d['lost_coverage'] for d in self.deltas.values()), key=lambda x: x.urn
+            ),
+            'gained_coverage': sorted(
+                chain.from_iterable(d['gained_coverage'] for d in self.deltas.values()), key=lambda x: x.urn
+            ),
+            # subaccounts seen for the first time, whose empty delta only records a baseline
+            'baseline_subaccounts': sorted(lw_subaccount for lw_subaccount, d in self.deltas.items() if d['baseline'])
+        }
+        json.dump(delta, stream, indent=4, sort_keys=True, default=serialize)
+        stream.write('\n')
+
+
+class SubaccountStats():
+    """Per-subaccount run times and record counts from earlier runs, used to schedule the most expensive subaccounts first"""
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.stats = dict()
+        try:
+            with open(path) as f:
+                self.stats = json.load(f)
+        except FileNotFoundError:
+            pass
+        except ValueError:
+            logger.warning(f'Ignoring unreadable sub-account stats file {path}')
+
+    def cost(self, lw_subaccount: str) -> float:
+        # subaccounts we have never timed could be the largest, so they go first
+        return self.stats.get(lw_subaccount, {}).get('seconds', float('inf'))
+
+    def order(self, lw_subaccounts: list[str]) -> list[str]:
+        # longest-processing-time first keeps a large subaccount from starting last and stretching the run
+        return sorted(lw_subaccounts, key=self.cost, reverse=True)
+
+    def record(self, lw_subaccount: str, seconds: float, records: int = None) -> None:
+        previous = self.stats.get(lw_subaccount, {})
+        if 'seconds' in previous:
+            # smooth out one-off slow or fast runs
+            seconds = (previous['seconds'] + seconds) / 2
+        self.stats[lw_subaccount] = {
+            'seconds': round(seconds, 3),
+            'records': records if records is not None else previous.get('records')
+        }
+
+    def save(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(f'{self.path}.tmp', 'w') as f:
+            json.dump(self.stats, f, indent=4, sort_keys=True)
+        os.replace(f'{self.path}.tmp', self.path)
+
+
+class NdjsonWriter():
+    """Thread-safe writer emitting one json document per result record"""
+    def __init__(self, stream: TextIO) -> None:
+        self.stream = stream
+        self.lock = threading.Lock()
+
+    def write(self, result_set: str, record: OutputRecord) -> None:
+        line = json.dumps(dict(record.to_dict(), result_set=result_set), sort_keys=True, default=serialize)
+        with self.lock:
+            self.stream.write(line + '\n')
+
+
+class TenantWriter():
+    """Tags each streamed record with its tenant before passing it on to the run's writer"""
+    def __init__(self, writer: object, tenant: str) -> None:
+        self.writer = writer
+        self.tenant = intern_value(tenant)
+
+    def write(self, result_set: str, record: OutputRecord) -> None:
+        record.tenant = self.tenant
+        self.writer.write(result_set, record)
+
+
+class CoverageCounter():
+    """Thread-safe --statistics and --by-cluster sink: counts each streamed host by subaccount, cloud, kubernetes,
+    os image and cluster, then drops it"""
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        # (dimension, value) -> [hosts, hosts with agent]
+        self.counts = dict()
+        # urns already counted per result set, so a host reported by several subaccounts or tenants is counted once,
+        # as it is when the batch results are merged into sets
+        self.seen = {result_set: set() for result_set in RESULT_SETS}
+
+    def write(self, result_set: str, record: OutputRecord) -> None:
+        # coverage is a property of inventory, so agents without inventory are not hosts here
+        if result_set == 'agents_without_inventory':
+            return
+        with_agent = 1 if result_set == 'instances_with_agents' else 0
+        cloud = cloud_provider(record.urn)
+        keys = (
+            ('total', ''),
+            # sub-account names are only unique within a tenant
+            ('subaccount', (record.tenant, record.subaccount)),
+            ('cloud', cloud),
+            ('kubernetes', bool(record.is_kubernetes)),
+            ('os_image', os_image_name(record.os_image))
+        )
+        if record.tenant is not None:
+            keys += (('tenant', record.tenant),)
+        if record.cluster or record.is_kubernetes is True:
+            # cluster names are only unique within an account, and nodes whose cluster is not named still count
+            keys += (('cluster', (record.subaccount, cloud, record.cluster or '')),)
+        with self.lock:
+            if record.urn in self.seen[result_set]:
+                return
+            self.seen[result_set].add(record.urn)
+            for key in keys:
+                counts = self.counts.setdefault(key, [0, 0])
+                counts[0] += 1
+                counts[1] += with_agent
+
+    def add_result(self, instance_result: InstanceResult) -> None:
+        for record in instance_result.instances_without_agents:
+            self.write('instances_without_agents', record)
+        for record in instance_result.instances_with_agents:
+            self.write('instances_with_agents', record)
+
+    def get(self, dimension: str, value: object) -> tuple[int, int]:
+        hosts, with_agent = self.counts.get((dimension, value), (0, 0))
+        return (hosts, with_agent)
+
+    def values(self, dimension: str) -> list:
+        # largest first
+        return sorted(
+            (value for d, value in self.counts if d == dimension), key=lambda v: (-self.counts[(dimension, v)][0], str(v))
+        )
+
+
+class SqliteWriter():
+    """Thread-safe --sqlite sink: loads each result set into its own indexed table, plus a tags table, in batches"""
+    def __init__(self, path: str, batch_size: int = SQLITE_BATCH_SIZE) -> None:
+        self.path = path
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.pending = {result_set: list() for result_set in RESULT_SETS}
+        self.pending_tags = list()
+        self.buffered = 0
+        self.records = 0
+
+        # built under a temporary name and moved into place once indexed, so readers never see a partial load
+        self.load_path = f'{path}.tmp'
+        if os.path.exists(self.load_path):
+            os.remove(self.load_path)
+        self.connection = sqlite3.connect(self.load_path, check_same_thread=False)
+        # nothing to recover if the load dies half way, as the file is discarded
+        self.connection.execute('PRAGMA journal_mode = OFF')
+        self.connection.execute('PRAGMA synchronous = OFF')
+        with self.connection:
+            for result_set in RESULT_SETS:
+                self.connection.execute(
+                    f'CREATE TABLE {result_set} (urn TEXT NOT NULL, subaccount TEXT, cloud TEXT, creation_time TEXT, '
+                    'is_kubernetes INTEGER, os_image TEXT, os_image_name TEXT, cluster TEXT, tenant TEXT, tags TEXT)'
+                )
+            self.connection.execute('CREATE TABLE tags (result_set TEXT NOT NULL, urn TEXT NOT NULL, key TEXT, value TEXT)')
+
+    def write(self, result_set: str, record: OutputRecord) -> None:
+        row = (
+            record.urn,
+            record.subaccount,
+            cloud_provider(record.urn),
+            record.creation_time,
+            int(record.is_kubernetes) if type(record.is_kubernetes) == bool else None,
+            # the value the other outputs print (gcp license lists as json), plus the short name --statistics groups by
+            record.os_image if type(record.os_image) == str else json.dumps(record.os_image),
+            os_image_name(record.os_image) if record.os_image else None,
+            record.cluster,
+            record.tenant,
+            json.dumps(record.tags, sort_keys=True) if record.tags else None
+        )
+        tags = [(result_set, record.urn, key, value) for key, value in tag_pairs(record.tags)]
+        with self.lock:
+            self.pending[result_set].append(row)
+            self.pending_tags.extend(tags)
+            self.buffered += 1
+            if self.buffered >= self.batch_size:
+                self.flush()
+
+    def flush(self) -> None:
+        # callers hold self.lock
+        with self.connection:
+            for result_set, rows in self.pending.items():
+                if rows:
+                    self.connection.executemany(f'INSERT INTO {result_set} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+                    rows.clear()
+            if self.pending_tags:
+                self.connection.executemany('INSERT INTO tags VALUES (?, ?, ?, ?)', self.pending_tags)
+                self.pending_tags.clear()
+        self.records += self.buffered
+        self.buffered = 0
+
+    def close(self) -> None:
+        with self.lock:
+            self.flush()
+            # indexing once after the load is much cheaper than maintaining the indexes through every insert
+            with self.connection:
+                for result_set in RESULT_SETS:
+                    for column in SQLITE_INDEXED_COLUMNS:
+                        self.connection.execute(f'CREATE INDEX {result_set}_{column} ON {result_set} ({column})')
+                self.connection.execute('CREATE INDEX tags_key_value ON tags (key, value)')
+                self.connection.execute('CREATE INDEX tags_urn ON tags (urn)')
+                self.connection.execute('ANALYZE')
+            self.connection.close()
+        os.replace(self.load_path, self.path)
+        logger.info('Wrote %d records to %s', self.records, self.path)
+
+
+def tag_pairs(tags: object) -> list[tuple[str, str]]:
+    # aws: [{'Key': k, 'Value': v}], azure and fargate: {k: v}, gcp network tags: {'items': [tag], 'fingerprint': ...}
+    if isinstance(tags, list):
+        return [(t.get('Key'), t.get('Value')) for t in tags if isinstance(t, dict)]
+    if isinstance(tags, dict):
+        if isinstance(tags.get('items'), list):
+            return [(str(item), None) for item in tags['items']]
+        return [(str(key), value if value is None or type(value) == str else json.dumps(value)) for key, value in tags.items()]
+    return []
 
 
 def serialize(obj: object) -> dict:
     """JSON serializer for objects not serializable by default json code"""
+    if isinstance(obj, OutputRecord):
+        return obj.to_dict()
     return obj.__dict__
 
 
@@ -92,6 +1221,11 @@ def get_all_tenant_subaccounts(client: LaceworkClient) -> list:
     return [i['accountName'] for i in client.user_profile.get()['data'][0]['accounts']]
 
 
+def returned_fields(fields: list[str]) -> list[str]:
+    # the search api projects whole top-level fields, so ask for the roots of the paths a parser reads
+    return sorted(set(f.split('.')[0] for f in fields))
+
+
 def check_truncation(results: list) -> bool:
     if type(results) == list:
         if len(results) >= MAX_RESULT_SET:
@@ -99,42 +1233,73 @@ def check_truncation(results: list) -> bool:
     return False
 
 
-# inspect resource to determine if it matches known identifiers marking it as a k8s node
-def is_kubernetes(resource: dict, identifier: str) -> bool:
-    if identifier == "Aws":
-        if 'Tags' in resource['resourceConfig']:
-            for t in resource['resourceConfig']['Tags']:
-                if t['Key'] == 'eks:cluster-name':
-                    INSTANCE_CLUSTER_CACHE[resource['resourceConfig']['InstanceId']] = t['Value']
-                    return True
-    elif identifier == "Gcp":
-        if 'labels' in resource['resourceConfig']:
-            for l in resource['resourceConfig']['labels']:
-                if 'goog-gke-node' in l:
-                    # TODO: INSTANCE_CLUSTER_CACHE
-                    return True
-    elif identifier == "Azure":
-        pass
-    else:
-        raise Exception("Identifer not correctly passed to is_kubernetes!")
+# inspect resource to determine if it matches known identifiers marking it as a k8s node,
+# and the name of its cluster where the resource carries one
+def eks_node_cluster(resource: dict) -> tuple[bool, str]:
+    if 'Tags' in resource['resourceConfig']:
+        for t in resource['resourceConfig']['Tags']:
+            if t['Key'] == EKS_CLUSTER_TAG:
+                return (True, t['Value'])
+    return (False, None)
 
-    return False
 
+def gke_node_cluster(resource: dict) -> tuple[bool, str]:
+    if 'labels' in resource['resourceConfig']:
+        labels = resource['resourceConfig']['labels']
+        for l in labels:
+            if GKE_NODE_LABEL in l:
+                return (True, labels.get(GKE_CLUSTER_LABEL) or None)
+    return (False, None)
 
-def get_fargate_with_lacework_agents(fargate_inventory: object, fargate_agent_info: object, lw_subaccount: str) -> tuple[list, list]:
-    tasks_with_agent = list()
-    tasks_without_agent = list()
 
-    active_fargate_task_arns = list()
-    inactive_fargate_task_arns = list()
-    for page in fargate_agent_info:
-        for task in page['data']:
-            task_arn = task['tags']['net.lacework.aws.fargate.taskarn']
-            if task['status'] == 'ACTIVE':
-                active_fargate_task_arns.append(task_arn)
-            else:
-                inactive_fargate_task_arns.append(task_arn)
+def aks_node_cluster(resource: dict) -> tuple[bool, str]:
+    tags = resource.get('resourceTags')
+    if isinstance(tags, dict):
+        # aks node pools carry aks-managed-* tags; older clusters tag orchestrator: Kubernetes:<version>
+        if any(k.startswith(AKS_TAG_PREFIX) for k in tags) or str(tags.get('orchestrator', '')).startswith('Kubernetes'):
+            return (True, tags.get(AKS_CLUSTER_TAG) or None)
+    return (False, None)
+
+
+def fargate_hostname_prefix(hostname: str) -> str:
+    # The rfind is likely not comprehensive, but it nails it for the sample data
+    # so in the spirit of getting something out there...away we go
+    return hostname[0:hostname.rfind('_')]
 
+
+def index_fargate_agent_tasks(fargate_agents: list) -> tuple[set, set]:
+    active_fargate_task_arns = set()
+    inactive_fargate_task_arns = set()
+    for task in fargate_agents:
+        task_arn = task['tags']['net.lacework.aws.fargate.taskarn']
+        if task['status'] == 'ACTIVE':
+            active_fargate_task_arns.add(task_arn)
+        else:
+            inactive_fargate_task_arns.add(task_arn)
+
+    return (active_fargate_task_arns, inactive_fargate_task_arns)
+
+
+def index_fargate_agent_hostnames(agent_hostnames: Iterable[str]) -> set:
+    # both the full hostname and its task prefix, so a task arn resolves with a single lookup
+    hostnames = set()
+    for hostname in agent_hostnames:
+        hostnames.add(hostname)
+        hostnames.add(fargate_hostname_prefix(hostname))
+    return hostnames
+
+
+# everything classify_fargate_tasks and the incremental state read from a task record
+FARGATE_TASK_FIELDS: list[str] = [
+    'resourceConfig.taskArn',
+    'resourceConfig.tags',
+    'resourceConfig.containers'
+]
+
+
+def classify_fargate_tasks(
+    fargate_inventory: object, active_fargate_task_arns: set, inactive_fargate_task_arns: set, lw_subaccount: str
+) -> Iterator[tuple[bool, OutputRecord]]:
     for page in fargate_inventory:
         for task in page['data']:
             task_placed = False
@@ -144,23 +1309,66 @@ def get_fargate_with_lacework_agents(fargate_inventory: object, fargate_agent_in
             if 'containers' in task['resourceConfig']:
                 for container in task['resourceConfig']['containers']:
                     if 'datacollector' in container['image']:
-                        tasks_with_agent.append(OutputRecord(container['taskArn'],'',False, lw_subaccount, '', tags))
+                        yield (True, OutputRecord(container['taskArn'],'',False, lw_subaccount, '', tags))
                         task_placed = True
                         break
 
             # Look for Lacework agent with active status
             if not task_placed:
                 if task['resourceConfig']['taskArn'] in active_fargate_task_arns:
-                    tasks_with_agent.append(OutputRecord(task['resourceConfig']['taskArn'],'',False, lw_subaccount, '', tags))
+                    yield (True, OutputRecord(task['resourceConfig']['taskArn'],'',False, lw_subaccount, '', tags))
                 elif (
                     task['resourceConfig']['taskArn'] not in inactive_fargate_task_arns
                 ):  # Exclude inactive tasks
-                    tasks_without_agent.append(OutputRecord(task['resourceConfig']['taskArn'],'',False, lw_subaccount, '', tags))
-                
+                    yield (False, OutputRecord(task['resourceConfig']['taskArn'],'',False, lw_subaccount, '', tags))
+
+
+def get_fargate_with_lacework_agents(fargate_inventory: object, fargate_agents: list, lw_subaccount: str) -> tuple[list, list]:
+    tasks_with_agent = list()
+    tasks_without_agent = list()
+
+    active_fargate_task_arns, inactive_fargate_task_arns = index_fargate_agent_tasks(fargate_agents)
+
+    classified_tasks = classify_fargate_tasks(
+        fargate_inventory, active_fargate_task_arns, inactive_fargate_task_arns, lw_subaccount
+    )
+    for has_agent, task in classified_tasks:
+        if has_agent:
+            tasks_with_agent.append(task)
+        else:
+            tasks_without_agent.append(task)
+
     return (tasks_with_agent, tasks_without_agent)
 
 
-def apply_fargate_filter(client: LaceworkClient, start_time: str, end_time: str, instances_without_agents: list, matched_instances: list, agents_without_inventory: list, lw_subaccount_name: str) -> tuple[list, list, list]:
+def reconcile_fargate_tasks(
+    fargate_tasks_with_agent: list, fargate_tasks_without_agent: list, instances_without_agents: list, matched_instances: list,
+    agents_without_inventory: list
+) -> tuple[list, list, list]:
+
+    # Fargate complications -- Currently going to run this as a completely seperate filter
+    # and modify the three existing result sets independently
+    agent_hostnames = index_fargate_agent_hostnames(a.urn for a in agents_without_inventory)
+    matched_fargate_instances = set([task for task in fargate_tasks_with_agent if task.urn in agent_hostnames])
+    matched_instances.extend(matched_fargate_instances)
+    logger.debug('matched faragate instances: %d', len(matched_instances))
+    logger.debug('missing fargate instances: %d', len(fargate_tasks_without_agent))
+
+    logger.debug('agents w/o inventory - pre: %d', len(agents_without_inventory))
+    set_matched_fargate_urns = set([t.urn for t in matched_fargate_instances])
+    agents_without_inventory = [
+        a for a in agents_without_inventory if fargate_hostname_prefix(a.urn) not in set_matched_fargate_urns
+    ]
+    logger.debug('agents w/o inventory - post: %d', len(agents_without_inventory))
+
+    logger.debug('instances w/o agents - pre: %d', len(instances_without_agents))
+    instances_without_agents.extend(fargate_tasks_without_agent)
+    logger.debug('instances w/o agents - post: %d', len(instances_without_agents))
+
+    return (instances_without_agents, matched_instances, agents_without_inventory)
+
+
+def get_fargate_inventory_pages(client: LaceworkClient, start_time: str, end_time: str) -> Iterator[dict]:
 
     ##########
     # Fargate is different
@@ -174,50 +1382,41 @@ def apply_fargate_filter(client: LaceworkClient, start_time: str, end_time: str,
                 { 'field': 'resourceType', 'expression': 'eq', 'value':'ecs:task'},
                 { 'field': 'resourceConfig.launchType', 'expression': 'eq', 'value':'FARGATE'}
             ],
+            'returns': returned_fields(FARGATE_TASK_FIELDS),
             'csp': 'AWS'
         })
 
-    fargate_agent_info = client.agent_info.search(json={
-            'timeFilter': { 
-                'startTime' : start_time, 
-                'endTime'   : end_time
-            }, 
-            'filters': [
-                {'field': 'tags.VmProvider', 'expression': 'eq', 'value': 'AWS'},
-                {
-                    'field': 'tags.VmInstanceType',
-                    'expression': 'eq',
-                    'value': 'AWS_ECS_V4FARGATE',
-                },
-            ],
-        })
+    return fargate_inventory
 
-    # TODO: type the task
-    fargate_tasks_with_agent, fargate_tasks_without_agent = get_fargate_with_lacework_agents(fargate_inventory, fargate_agent_info, lw_subaccount_name)
 
-    # Fargate complications -- Currently going to run this as a completely seperate filter
-    # and modify the three existing result sets independently
+def get_fargate_inventory(client: LaceworkClient, start_time: str, end_time: str) -> list[dict]:
+    # drain the pages here so the paging happens on the fetching thread
+    return list(get_fargate_inventory_pages(client, start_time, end_time))
 
-    matched_fargate_instances = set([task for task in fargate_tasks_with_agent if any(task.urn in hostname.urn for hostname in agents_without_inventory)])
-    matched_instances.extend(matched_fargate_instances)
-    logger.debug(f'matched faragate instances: {len(matched_instances)}')
-    logger.debug(f'missing fargate instances: {len(fargate_tasks_without_agent)}')
 
-    # The rfind is likely not comprehensive, but it nails it for the sample data
-    # so in the spirit of getting something out there...away we go
-    logger.debug(f'agents w/o inventory - pre: {len(agents_without_inventory)}')
-    set_matched_fargate_urns = set([t.urn for t in matched_fargate_instances])
-    agents_without_inventory = [a for a in agents_without_inventory if a.urn[0:a.urn.rfind('_')] not in set_matched_fargate_urns]
-    logger.debug(f'agents w/o inventory - post: {len(agents_without_inventory)}')
+def apply_fargate_filter(
+    fargate_inventory: object, agent_snapshot: AgentSnapshot, instances_without_agents: list, matched_instances: list,
+    agents_without_inventory: list, lw_subaccount_name: str
+) -> tuple[list, list, list]:
+    # TODO: type the task
+    fargate_tasks_with_agent, fargate_tasks_without_agent = get_fargate_with_lacework_agents(
+        fargate_inventory, agent_snapshot.fargate, lw_subaccount_name
+    )
+    return reconcile_fargate_tasks(
+        fargate_tasks_with_agent, fargate_tasks_without_agent, instances_without_agents, matched_instances,
+        agents_without_inventory
+    )
 
-    logger.debug(f'instances w/o agents - pre: {len(instances_without_agents)}')
-    instances_without_agents.extend(fargate_tasks_without_agent)
-    logger.debug(f'instances w/o agents - post: {len(instances_without_agents)}')
 
-    return (instances_without_agents, matched_instances, agents_without_inventory)
+# everything AgentSnapshot, get_agent_instances and index_fargate_agent_tasks read from an agent record
+AGENT_INFO_FIELDS: list[str] = [
+    'hostname',
+    'status',
+    'tags'
+]
 
 
-def get_agent_instances(client: LaceworkClient, start_time: str, end_time: str) -> list[dict]:
+def get_agent_snapshot(client: LaceworkClient, start_time: str, end_time: str) -> AgentSnapshot:
 
     ########
     # Agents
@@ -226,302 +1425,784 @@ def get_agent_instances(client: LaceworkClient, start_time: str, end_time: str)
             'timeFilter': { 
                 'startTime' : start_time, 
                 'endTime'   : end_time
-            } 
+            },
+            'returns': returned_fields(AGENT_INFO_FIELDS)
         })
 
-    list_agent_instances = list()
-    for page in all_agent_instances:
-        for r in page['data']:
-            if ('tags' in r.keys() 
-                    and 'VmProvider' in r['tags'].keys() 
-                    and (r['tags']['VmProvider'] == 'GCE' or r['tags']['VmProvider'] == 'GCP')):
-                
-                list_agent_instances.append(r['tags']['InstanceId'])
-                try:
-                    AGENT_CACHE[r['tags']['InstanceId']] = 'gcp' + '/' + r['tags']['ProjectId'] + '/' + r['tags']['Hostname']
-                except:
-                    AGENT_CACHE[r['tags']['InstanceId']] = 'gcp' + '/' + r['tags']['Hostname']
-
-            elif ('tags' in r.keys() 
-                    and 'VmProvider' in r['tags'].keys() 
-                    and r['tags']['VmProvider'] == 'AWS'):
-
-                if 'InstanceId' in r['tags'].keys(): # EC2 use case - InstanceId is in URN
-                    list_agent_instances.append(r['tags']['InstanceId'])
-                    if 'Account' in r['tags'].keys():
-                        AGENT_CACHE[r['tags']['InstanceId']] = 'aws' + '/' + r['tags']['Account'] + '/' + r['tags']['Hostname']
-                    else: # random Windows agent use case?
-                        AGENT_CACHE[r['tags']['InstanceId']] = 'aws' + '/' + r['tags']['ProjectId'] + '/' + r['tags']['Hostname']
-                else: # Fargate use case 
-                    list_agent_instances.append(r['tags']['Hostname'])
-
-            elif ('tags' in r.keys() 
-                    and 'VmProvider' in r['tags'].keys() 
-                    and r['tags']['VmProvider'] == 'Microsoft.Compute'):
-
-                list_agent_instances.append(r['tags']['InstanceId'])
-                if 'Account' in r['tags'].keys():
-                    AGENT_CACHE[r['tags']['InstanceId']] = 'azure' + '/' + r['tags']['Account'] + '/' + r['tags']['Hostname']
-                else: # random Windows agent use case?
-                    AGENT_CACHE[r['tags']['InstanceId']] = 'azure' + '/' + r['tags']['ProjectId'] + '/' + r['tags']['Hostname']
+    return AgentSnapshot(all_agent_instances)
 
-            else:
-                list_agent_instances.append(r['hostname'])
+
+def gcp_agent_key(r: dict, tags: dict) -> tuple[str, str]:
+    try:
+        return (tags['InstanceId'], 'gcp' + '/' + tags['ProjectId'] + '/' + tags['Hostname'])
+    except KeyError:
+        return (tags['InstanceId'], 'gcp' + '/' + tags['Hostname'])
+
+
+def aws_agent_key(r: dict, tags: dict) -> tuple[str, str]:
+    if 'InstanceId' not in tags: # Fargate use case
+        return (tags['Hostname'], None)
+    # EC2 use case - InstanceId is in URN
+    if 'Account' in tags:
+        return (tags['InstanceId'], 'aws' + '/' + tags['Account'] + '/' + tags['Hostname'])
+    # random Windows agent use case?
+    return (tags['InstanceId'], 'aws' + '/' + tags['ProjectId'] + '/' + tags['Hostname'])
+
+
+def azure_agent_key(r: dict, tags: dict) -> tuple[str, str]:
+    # VMs and VMSS instances both report the vmId as their InstanceId
+    if 'Account' in tags:
+        return (tags['InstanceId'], 'azure' + '/' + tags['Account'] + '/' + tags['Hostname'])
+    # random Windows agent use case?
+    return (tags['InstanceId'], 'azure' + '/' + tags['ProjectId'] + '/' + tags['Hostname'])
+
+
+def hostname_agent_key(r: dict, tags: dict) -> tuple[str, str]:
+    return (r['hostname'], None)
+
+
+def get_agent_instances(agent_snapshot: AgentSnapshot, context: SubaccountContext) -> list[dict]:
+
+    list_agent_instances = list()
+    for provider, records in agent_snapshot.by_provider.items():
+        agent_key = AGENT_KEY_MAPPINGS.get(provider, hostname_agent_key)
+        for r in records:
+            key, hostname = agent_key(r, r['tags'] if 'tags' in r else {})
+            list_agent_instances.append(key)
+            if hostname is not None:
+                context.agent_cache[key] = hostname
     
-    if check_truncation(list_agent_instances):
+    if not context.time_sliced and check_truncation(list_agent_instances):
         logger.warning(f'WARNING: Agent Instances truncated at {MAX_RESULT_SET} records')
-    logger.debug(f'Agent Instances: {list_agent_instances}\n')
+    logger.debug('Agent Instances: %s\n', list_agent_instances)
 
     return list_agent_instances
 
 
-def get_gcp_instance_inventory(client: LaceworkClient, start_time: str, end_time: str, lw_subaccount: str) -> list[dict]:
-    ######
-    # GCP
-    ######
-    gcp_inventory = client.inventory.search(json={
+# everything normalize_gcp_instance and gke_node_cluster read from a record
+GCP_INSTANCE_FIELDS: list[str] = [
+    'urn',
+    'resourceConfig.id',
+    'resourceConfig.creationTimestamp',
+    'resourceConfig.status',
+    'resourceConfig.tags',
+    'resourceConfig.labels',
+    'resourceConfig.disks'
+]
+# everything normalize_aws_instance and eks_node_cluster read from a record
+AWS_INSTANCE_FIELDS: list[str] = [
+    'urn',
+    'resourceConfig.InstanceId',
+    'resourceConfig.LaunchTime',
+    'resourceConfig.Tags'
+]
+# everything normalize_azure_instance and aks_node_cluster read from a record
+AZURE_INSTANCE_FIELDS: list[str] = [
+    'urn',
+    'resourceTags',
+    'resourceConfig.vmId',
+    'resourceConfig.timeCreated'
+]
+
+
+def normalize_gcp_instance(r: dict, warnings: list) -> tuple:
+    tags = r['resourceConfig']['tags'] if 'tags' in r['resourceConfig'] else ''
+    identifier = r['resourceConfig']['id']
+    # identify OS image from GCP instance
+    os_image = str()
+    try:
+        count = 0
+        for disk in r['resourceConfig']['disks']:
+            if 'licenses' in disk.keys():
+                os_image = r['resourceConfig']['disks'][count]['licenses']
+                break
+            elif 'initializeParams' in disk.keys():
+                params = r['resourceConfig']['disks']['initializeParams'] 
+                if 'sourceImage' in params:
+                    os_image = r['resourceConfig']['disks']['initializeParams']['sourceImage']
+                    break
+            count += 1
+    except:
+        if r['resourceConfig']['status'] != 'TERMINATED':
+            warnings.append(('Unable to parse os_image info for instance %s', (r,)))
+
+    kubernetes, cluster = gke_node_cluster(r)
+    return (identifier, r['urn'], r['resourceConfig']['creationTimestamp'], kubernetes, os_image, tags, cluster)
+
+
+def normalize_aws_instance(r: dict, warnings: list) -> tuple:
+    identifier = r['resourceConfig']['InstanceId']
+    tags = r['resourceConfig']['Tags'] if 'Tags' in r['resourceConfig'] else ''
+    os_image = str()
+    kubernetes, cluster = eks_node_cluster(r)
+    return (identifier, r['urn'], r['resourceConfig']['LaunchTime'], kubernetes, os_image, tags, cluster)
+
+
+def normalize_azure_instance(r: dict, warnings: list) -> tuple:
+    # standalone VMs and scale set instances: the agent on either reports the vmId
+    tags = r['resourceTags'] if 'resourceTags' in r else ''
+    identifier = r['resourceConfig']['vmId']
+    os_image = str()
+    kubernetes, cluster = aks_node_cluster(r)
+    # older scale set api versions do not report timeCreated
+    return (identifier, r['urn'], r['resourceConfig'].get('timeCreated', ''), kubernetes, os_image, tags, cluster)
+
+
+class InventoryNormalizer():
+    """Everything one inventory resource type needs: its search, its record normalizer and the agents that key onto it"""
+    def __init__(
+        self, resource_type: str, csp: str, fields: list[str], normalize: Callable, agent_providers: tuple[str, ...],
+        agent_key: Callable, phase: str, label: str
+    ) -> None:
+        self.resource_type = resource_type
+        self.csp = csp
+        self.fields = fields
+        # (record, warnings) -> (identifier, urn, creation_time, is_kubernetes, os_image, tags, cluster)
+        self.normalize = normalize
+        # agent VmProvider tags whose agent_key matches this type's identifiers
+        self.agent_providers = agent_providers
+        self.agent_key = agent_key
+        # --metrics phase, and the name used in truncation warnings
+        self.phase = phase
+        self.label = label
+
+    def search_body(self, start_time: str, end_time: str) -> dict:
+        return {
             'timeFilter': { 
                 'startTime' : start_time, 
                 'endTime'   : end_time
             }, 
             'filters': [
-                { 'field': 'resourceType', 'expression': 'eq', 'value':'compute.googleapis.com/Instance'}
+                { 'field': 'resourceType', 'expression': 'eq', 'value': self.resource_type}
             ],
-            'csp': 'GCP'
-        })
-
-    list_gcp_instances = list()
-    for page in gcp_inventory:
-        for r in page.get('data', []):
-            # rough handling so that a small number of unexpected formats don't kill the entire output
-                try:
-                    tags = r['resourceConfig']['tags'] if 'tags' in r['resourceConfig'] else ''
-                    identifier = r['resourceConfig']['id']
-                    list_gcp_instances.append(identifier)
-                    # identify OS image from GCP instance
-                    os_image = str()
-                    try:
-                        count = 0
-                        for disk in r['resourceConfig']['disks']:
-                            if 'licenses' in disk.keys():
-                                os_image = r['resourceConfig']['disks'][count]['licenses']
-                                break
-                            elif 'initializeParams' in disk.keys():
-                                params = r['resourceConfig']['disks']['initializeParams'] 
-                                if 'sourceImage' in params:
-                                    os_image = r['resourceConfig']['disks']['initializeParams']['sourceImage']
-                                    break
-                            count += 1
-                    except:
-                        if r['resourceConfig']['status'] != 'TERMINATED':
-                            logger.warning(f'Unable to parse os_image info for instance {r}')
-
-                    INVENTORY_CACHE[identifier] = OutputRecord(r['urn'], r['resourceConfig']['creationTimestamp'], is_kubernetes(r,'Gcp'), lw_subaccount, os_image, tags)
-                except Exception as ex:
-                    logger.warning(f'Host could not be parsed due to incomplete inventory information: {ex} \n{r}')
-                    pass
+            'returns': returned_fields(self.fields),
+            'csp': self.csp
+        }
+
+
+# inventory resourceType -> its normalizer; every registered type is searched and reconciled for each subaccount
+INVENTORY_NORMALIZERS: dict = {
+    normalizer.resource_type: normalizer for normalizer in [
+        InventoryNormalizer(
+            resource_type='compute.googleapis.com/Instance',
+            csp='GCP',
+            fields=GCP_INSTANCE_FIELDS,
+            normalize=normalize_gcp_instance,
+            agent_providers=('GCE', 'GCP'),
+            agent_key=gcp_agent_key,
+            phase='gcp_inventory',
+            label='GCP Instances'
+        ),
+        InventoryNormalizer(
+            resource_type='ec2:instance',
+            csp='AWS',
+            fields=AWS_INSTANCE_FIELDS,
+            normalize=normalize_aws_instance,
+            agent_providers=('AWS',),
+            agent_key=aws_agent_key,
+            phase='aws_inventory',
+            label='AWS Instances'
+        ),
+        InventoryNormalizer(
+            resource_type='microsoft.compute/virtualmachines',
+            csp='Azure',
+            fields=AZURE_INSTANCE_FIELDS,
+            normalize=normalize_azure_instance,
+            agent_providers=('Microsoft.Compute',),
+            agent_key=azure_agent_key,
+            phase='azure_inventory',
+            label='Azure Instances'
+        ),
+        InventoryNormalizer(
+            resource_type='microsoft.compute/virtualmachinescalesets/virtualmachines',
+            csp='Azure',
+            fields=AZURE_INSTANCE_FIELDS,
+            normalize=normalize_azure_instance,
+            agent_providers=('Microsoft.Compute',),
+            agent_key=azure_agent_key,
+            phase='azure_vmss_inventory',
+            label='Azure VMSS Instances'
+        )
+    ]
+}
+# agent VmProvider tag -> function returning (key matched against inventory identifiers, host name for the agent_cache or None)
+AGENT_KEY_MAPPINGS: dict = {
+    provider: normalizer.agent_key for normalizer in INVENTORY_NORMALIZERS.values() for provider in normalizer.agent_providers
+}
+
+
+def normalize_page(resource_type: str, data: list[dict]) -> tuple[list[tuple], list[tuple], int]:
+    """Normalize one page of instance records into (identifier, urn, creation_time, is_kubernetes, os_image, tags, cluster)
+
+    Runs on --parse-processes workers, so it only reads its arguments and returns plain tuples, log messages
+    and a parse failure count.
+    """
+    normalize = INVENTORY_NORMALIZERS[resource_type].normalize
+    rows = list()
+    warnings = list()
+    failures = 0
+    for r in data:
+        # rough handling so that a small number of unexpected formats don't kill the entire output
+        try:
+            rows.append(normalize(r, warnings))
+        except Exception as ex:
+            warnings.append(('Host could not be parsed due to incomplete inventory information: %s \n%s', (str(ex), r)))
+            failures += 1
+    return (rows, warnings, failures)
+
+
+def parse_raw_page(resource_type: str, content: bytes) -> tuple[str, tuple[list[tuple], list[tuple], int]]:
+    # runs on --parse-processes workers: (next page url, normalize_page result) for one raw search response
+    page = json.loads(content)
+    next_page = page.get('paging', {}).get('urls', {}).get('nextPage') if isinstance(page, dict) else None
+    return (next_page, normalize_page(resource_type, page.get('data', [])))
+
+
+def iter_normalized_inventory(
+    normalized_pages: Iterable[tuple], normalizer: InventoryNormalizer, lw_subaccount: str, context: SubaccountContext
+) -> Iterator[tuple[str, OutputRecord]]:
+    for rows, warnings, failures in normalized_pages:
+        for message, message_args in warnings:
+            logger.warning(message, *message_args)
+        if failures:
+            context.metrics.add(normalizer.phase, parse_failures=failures)
+        for identifier, urn, creation_time, kubernetes, os_image, tags, cluster in rows:
+            yield (identifier, OutputRecord(urn, creation_time, kubernetes, lw_subaccount, os_image, tags, cluster))
+
+
+def iter_instance_inventory(
+    client: LaceworkClient, start_time: str, end_time: str, lw_subaccount: str, context: SubaccountContext,
+    normalizer: InventoryNormalizer
+) -> Iterator[tuple[str, OutputRecord]]:
+    body = normalizer.search_body(start_time, end_time)
+    if context.parse_pool is not None and isinstance(client, ClientProxy):
+        normalized_pages = client.inventory.search_normalized(
+            json=body, resource_type=normalizer.resource_type, parse_pool=context.parse_pool
+        )
+    else:
+        normalized_pages = (
+            normalize_page(normalizer.resource_type, page.get('data', [])) for page in client.inventory.search(json=body)
+        )
+    yield from iter_normalized_inventory(normalized_pages, normalizer, lw_subaccount, context)
 
-    if check_truncation(list_gcp_instances):
-        logger.warning(f'WARNING: GCP Instances truncated at {MAX_RESULT_SET} records')
-    logger.debug(f'GCP Instances: {list_gcp_instances}\n')
 
-    return list_gcp_instances
+def get_instance_inventory(
+    client: LaceworkClient, start_time: str, end_time: str, lw_subaccount: str, context: SubaccountContext,
+    normalizer: InventoryNormalizer
+) -> list[dict]:
+    list_instances = list()
+    for identifier, record in iter_instance_inventory(client, start_time, end_time, lw_subaccount, context, normalizer):
+        list_instances.append(identifier)
+        context.inventory_cache[identifier] = record
 
+    if not context.time_sliced and check_truncation(list_instances):
+        logger.warning(f'WARNING: {normalizer.label} truncated at {MAX_RESULT_SET} records')
+    logger.debug('%s: %s\n', normalizer.label, list_instances)
 
-def get_aws_instance_inventory(client: LaceworkClient, start_time: str, end_time: str, lw_subaccount: str) -> list[dict]:
-    ######
-    # AWS
-    ######
-    aws_inventory = client.inventory.search(json={
-            'timeFilter': { 
-                'startTime' : start_time, 
-                'endTime'   : end_time
-            }, 
-            'filters': [
-                { 'field': 'resourceType', 'expression': 'eq', 'value':'ec2:instance'}
-            ],
-            'csp': 'AWS'
-        })
+    return list_instances
 
-    list_aws_instances = list()
-    for page in aws_inventory:
-        for r in page.get('data', []):
-            # rough handling so that a small number of unexpected formats don't kill the entire output
-            try:
-                identifier = r['resourceConfig']['InstanceId']
-                tags = r['resourceConfig']['Tags'] if 'Tags' in r['resourceConfig'] else ''
-                list_aws_instances.append(identifier)
-                os_image = str()
-                INVENTORY_CACHE[identifier] = OutputRecord(r['urn'],  r['resourceConfig']['LaunchTime'], is_kubernetes(r,'Aws'), lw_subaccount, os_image, tags)
-            except Exception as ex:
-                logger.warning(f'Host could not be parsed due to incomplete inventory information: {ex} \n{r}')
-                pass
 
-    if check_truncation(list_aws_instances):
-        logger.warning(f'WARNING: AWS Instances truncated at {MAX_RESULT_SET} records')
-    logger.debug(f'AWS Instances: {list_aws_instances}\n')
-    
-    return list_aws_instances
+def urn_segments(urn: str) -> list[str]:
+    # split an inventory urn/arn into the path components an agent identifier can appear as
+    return URN_SEGMENT_PATTERN.split(urn)
 
 
-def get_azure_instance_inventory(client: LaceworkClient, start_time: str, end_time: str, lw_subaccount: str) -> list[dict]:
-    ######
-    # Azure
-    ######
-    # TODO: Get VMSS instances
-    azure_inventory = client.inventory.search(json={
-            'timeFilter': { 
-                'startTime' : start_time, 
-                'endTime'   : end_time
-            }, 
-            'filters': [
-                { 'field': 'resourceType', 'expression': 'eq', 'value':'microsoft.compute/virtualmachines'}
-            ],
-            'csp': 'Azure'
-        })
+class ReconciliationIndex():
+    """Hash index of reconciled inventory keys, so agent lookups avoid scanning every matched urn"""
+    def __init__(self) -> None:
+        self.keys = set()
 
-    list_azure_instances = list()
-    for page in azure_inventory:
-        for r in page.get('data', []):
-            # rough handling so that a small number of unexpected formats don't kill the entire output
-            try:
-                tags = r['resourceTags'] if 'resourceTags' in r else ''
-                identifier = r['resourceConfig']['vmId']
-                list_azure_instances.append(identifier)
-                os_image = str()
-                INVENTORY_CACHE[identifier] = OutputRecord(r['urn'], r['resourceConfig']['timeCreated'], is_kubernetes(r,'Azure'), lw_subaccount, os_image, tags)
-            except Exception as ex:
-                logger.warning(f'Host could not be parsed due to incomplete inventory information: {ex} \n{r}')
-                pass
+    def add(self, identifier: str, record: OutputRecord) -> None:
+        # the identifier is what the agent reported, so a matched agent counts as reconciled even when
+        # its id is not part of the urn (azure vmIds, gcp urns ending in the instance name)
+        self.keys.add(identifier)
+        self.keys.update(urn_segments(record.urn))
 
-    if check_truncation(list_azure_instances):
-        logger.warning(f'WARNING: Azure Instances truncated at {MAX_RESULT_SET} records')
-    logger.debug(f'Azure Instances: {list_azure_instances}\n')
+    def __contains__(self, agent_key: str) -> bool:
+        return agent_key in self.keys
 
-    return list_azure_instances
+    def __len__(self) -> int:
+        return len(self.keys)
 
 
-def apply_agent_presence_filtering(instance_inventory: list, list_agent_instances: list, lw_subaccount: str) -> tuple[list, list, list]:
+def apply_agent_presence_filtering(
+    instance_inventory: list, list_agent_instances: list, lw_subaccount: str, context: SubaccountContext
+) -> tuple[list, list, list]:
 
     instances_without_agents = list()
     matched_instances = list()
     agents_without_inventory = list()
 
     set_agent_instances = set(list_agent_instances)
+    reconciled = ReconciliationIndex()
     #########
     # Set Ops
     #########
     for instance_id in instance_inventory:
-        normalized_output = INVENTORY_CACHE[instance_id]
+        normalized_output = context.inventory_cache[instance_id]
 
         if instance_id in set_agent_instances:
             matched_instances.append(normalized_output)
+            reconciled.add(instance_id, normalized_output)
             # TODO: add secondary check for "premptible instances"
         else:
             instances_without_agents.append(normalized_output)
 
     for instance in list_agent_instances:
-        if not any(instance in instance_urn.urn for instance_urn in matched_instances):
-            if instance in AGENT_CACHE:
+        if instance not in reconciled:
+            if instance in context.agent_cache:
                 # pull out host name if we have it
-                instance = AGENT_CACHE[instance]
+                instance = context.agent_cache[instance]
             o = OutputRecord(instance,'','',lw_subaccount,'')
             agents_without_inventory.append(o)
 
     return (instances_without_agents, matched_instances, agents_without_inventory)
 
 
-def generate_subaccount_report(client: LaceworkClient, start_time: str, end_time: str, lw_subaccount: str) -> tuple[list, list, list]:
-    list_agent_instances = get_agent_instances(client, start_time, end_time)
-    list_gcp_instances = get_gcp_instance_inventory(client, start_time, end_time, lw_subaccount)
-    list_aws_instances = get_aws_instance_inventory(client, start_time, end_time, lw_subaccount)
-    list_azure_instances = get_azure_instance_inventory(client, start_time, end_time, lw_subaccount)
+def fetch_subaccount_inputs(
+    client: LaceworkClient, start_time: str, end_time: str, lw_subaccount: str, context: SubaccountContext
+) -> tuple[AgentSnapshot, set, list]:
+    # the fetches are independent and network bound, so run them side by side and join before reconciling
+    with ThreadPoolExecutor(max_workers=SUBACCOUNT_FETCH_WORKERS) as executor:
+        agent_task = executor.submit(get_agent_snapshot, client, start_time, end_time)
+        inventory_tasks = [
+            executor.submit(get_instance_inventory, client, start_time, end_time, lw_subaccount, context, normalizer)
+            for normalizer in INVENTORY_NORMALIZERS.values()
+        ]
+        fargate_task = executor.submit(get_fargate_inventory, client, start_time, end_time)
 
-    all_instances_inventory = set(list_aws_instances) | set(list_gcp_instances) | set(list_azure_instances) # union the three sets
-    instances_without_agents, matched_instances, agents_without_inventory = apply_agent_presence_filtering(all_instances_inventory, list_agent_instances, lw_subaccount)
+        agent_snapshot = agent_task.result()
+        all_instances_inventory = set().union(*(task.result() for task in inventory_tasks))
+        fargate_inventory = fargate_task.result()
 
-    logger.debug(f'Instances_without_agents:{instances_without_agents}')
-    logger.debug(f'Matched_Instances:{matched_instances}')
-    logger.debug(f'Agents_without_inventory:{agents_without_inventory}')
+    return (agent_snapshot, all_instances_inventory, fargate_inventory)
+
+
+def reconcile_subaccount(
+    all_instances_inventory: set, list_agent_instances: list, fargate_inventory: object, agent_snapshot: AgentSnapshot,
+    lw_subaccount: str, context: SubaccountContext
+) -> tuple[list, list, list]:
+    instances_without_agents, matched_instances, agents_without_inventory = apply_agent_presence_filtering(
+        all_instances_inventory, list_agent_instances, lw_subaccount, context
+    )
+
+    logger.debug('Instances_without_agents:%s', instances_without_agents)
+    logger.debug('Matched_Instances:%s', matched_instances)
+    logger.debug('Agents_without_inventory:%s', agents_without_inventory)
 
     # run the Fargate pass as a separate filter (for now)
-    instances_without_agents, matched_instances, agents_without_inventory = apply_fargate_filter(client, start_time, end_time, instances_without_agents, matched_instances, agents_without_inventory, lw_subaccount)
+    return apply_fargate_filter(
+        fargate_inventory, agent_snapshot, instances_without_agents, matched_instances, agents_without_inventory, lw_subaccount
+    )
 
-    return (instances_without_agents, matched_instances, agents_without_inventory)
 
+def generate_subaccount_report(
+    client: LaceworkClient, start_time: str, end_time: str, lw_subaccount: str, metrics: PhaseMetrics = None,
+    parse_pool: Executor = None
+) -> tuple[list, list, list]:
+    context = SubaccountContext(lw_subaccount, metrics, is_time_sliced(client), parse_pool)
+    agent_snapshot, all_instances_inventory, fargate_inventory = fetch_subaccount_inputs(
+        client, start_time, end_time, lw_subaccount, context
+    )
 
-def output_statistics(args: argparse.Namespace, instance_result: InstanceResult, user_profile_data: dict) -> None:
+    with context.metrics.timed('reconcile'):
+        list_agent_instances = get_agent_instances(agent_snapshot, context)
+        return reconcile_subaccount(
+            all_instances_inventory, list_agent_instances, fargate_inventory, agent_snapshot, lw_subaccount, context
+        )
 
-    coverage_percent = round((len(instance_result.instances_with_agents) / len(instance_result.instances_without_agents + instance_result.instances_with_agents)) * 100, 2) if len(instance_result.instances_with_agents) > 0 else 0
-    print(f'Number of distinct hosts identified during inventory assessment: {len(instance_result.instances_without_agents + instance_result.instances_with_agents)}')
-    print(f'Number of hosts which report successful agent operation: {len(instance_result.instances_with_agents)}')
-    print(f'Coverage Percentage: {coverage_percent}%')
 
-    if not args.current_sub_account_only:
-        for lw_subaccount in user_profile_data.get('accounts', []):
-            lw_subaccount_name = lw_subaccount.get('accountName','')
+def generate_incremental_subaccount_report(
+    client: LaceworkClient, start_time: str, end_time: str, lw_subaccount: str, state_store: IncrementalStateStore,
+    metrics: PhaseMetrics = None, parse_pool: Executor = None
+) -> tuple[list, list, list]:
+    state = state_store.load(lw_subaccount)
+
+    # only ask for what changed since the previous run, unless that run is older than the lookback;
+    # merging is keyed by identifier, so the overlap with the previous run is fetched again harmlessly
+    fetch_start_time = start_time
+    if state.end_time and state.end_time > start_time:
+        overlap_start = datetime.strptime(state.end_time, '%Y-%m-%dT%H:%M:%SZ')
+        overlap_start -= timedelta(seconds=INCREMENTAL_OVERLAP_SECONDS)
+        fetch_start_time = max(start_time, overlap_start.strftime('%Y-%m-%dT%H:%M:%SZ'))
+    logger.debug('%s: incremental fetch from %s to %s', lw_subaccount, fetch_start_time, end_time)
+
+    context = SubaccountContext(lw_subaccount, metrics, is_time_sliced(client), parse_pool)
+    agent_snapshot, all_instances_inventory, fargate_inventory = fetch_subaccount_inputs(
+        client, fetch_start_time, end_time, lw_subaccount, context
+    )
+    metrics = context.metrics
 
-            instances_without_agents_count = len([i for i in instance_result.instances_without_agents if i.subaccount == lw_subaccount_name])
-            instances_with_agent_count = len([i for i in instance_result.instances_with_agents if i.subaccount == lw_subaccount_name])
-            # divide by zero handler...
-            coverage_percent = round((instances_with_agent_count / (instances_without_agents_count + instances_with_agent_count)) * 100, 2) if instances_with_agent_count > 0 else 0
+    with metrics.timed('reconcile'):
+        list_agent_instances = get_agent_instances(agent_snapshot, context)
+        state.merge(
+            end_time, context, all_instances_inventory, list_agent_instances, fargate_inventory, agent_snapshot.fargate
+        )
+        state.expire(start_time)
+        del context, agent_snapshot, all_instances_inventory, fargate_inventory
+
+        # reconcile the full lookback window out of the merged state
+        context = state.context(lw_subaccount, metrics)
+        results = reconcile_subaccount(
+            set(state.inventory), list(state.agents), state.fargate_inventory(), state.fargate_agent_snapshot(),
+            lw_subaccount, context
+        )
+
+    state_store.deltas[lw_subaccount] = state.coverage_delta(results)
+    state.end_time = end_time
+    state_store.save(lw_subaccount, state)
+
+    return results
+
+
+def stream_subaccount_report(
+    client: LaceworkClient, start_time: str, end_time: str, lw_subaccount: str, writer: NdjsonWriter,
+    metrics: PhaseMetrics = None, parse_pool: Executor = None
+) -> None:
+    # searches are timed by the MeteredClient as they are consumed, which here includes writing each record out
+    context = SubaccountContext(lw_subaccount, metrics, is_time_sliced(client), parse_pool)
+
+    set_agent_instances = set()
+    reconciled = ReconciliationIndex()
+    seen_instances = set()
+    lock = threading.Lock()
+
+    def write_inventory(normalizer: InventoryNormalizer) -> None:
+        for identifier, record in iter_instance_inventory(client, start_time, end_time, lw_subaccount, context, normalizer):
+            with lock:
+                if identifier in seen_instances:
+                    continue
+                seen_instances.add(identifier)
+                has_agent = identifier in set_agent_instances
+                if has_agent:
+                    reconciled.add(identifier, record)
+            writer.write('instances_with_agents' if has_agent else 'instances_without_agents', record)
+
+    # the same fetch concurrency as fetch_subaccount_inputs, but records go to the writer as they are reconciled
+    with ThreadPoolExecutor(max_workers=SUBACCOUNT_FETCH_WORKERS) as executor:
+        # fargate tasks are classified once every host is reconciled, so their pages download alongside the rest
+        fargate_task = executor.submit(get_fargate_inventory, client, start_time, end_time)
+
+        # agents are needed to classify anything, so they are indexed first and the raw records released
+        agent_snapshot = get_agent_snapshot(client, start_time, end_time)
+        list_agent_instances = get_agent_instances(agent_snapshot, context)
+        active_fargate_task_arns, inactive_fargate_task_arns = index_fargate_agent_tasks(agent_snapshot.fargate)
+        del agent_snapshot
+        set_agent_instances.update(list_agent_instances)
+
+        for task in [executor.submit(write_inventory, normalizer) for normalizer in INVENTORY_NORMALIZERS.values()]:
+            task.result()
+        fargate_inventory = fargate_task.result()
+
+    # agents which did not reconcile, resolved to their host name where we have it
+    agent_hostnames = list(dict.fromkeys(context.agent_cache.get(i, i) for i in list_agent_instances if i not in reconciled))
+    fargate_agent_hostnames = index_fargate_agent_hostnames(agent_hostnames)
+
+    matched_fargate_urns = set()
+    unmatched_fargate_urns = set()
+    classified_tasks = classify_fargate_tasks(
+        fargate_inventory, active_fargate_task_arns, inactive_fargate_task_arns, lw_subaccount
+    )
+    for has_agent, task in classified_tasks:
+        if not has_agent:
+            # a task can be reported more than once; the batch path collapses repeats in its result sets
+            if task.urn not in unmatched_fargate_urns:
+                unmatched_fargate_urns.add(task.urn)
+                writer.write('instances_without_agents', task)
+        elif task.urn in fargate_agent_hostnames and task.urn not in matched_fargate_urns:
+            matched_fargate_urns.add(task.urn)
+            writer.write('instances_with_agents', task)
+
+    for hostname in agent_hostnames:
+        if fargate_hostname_prefix(hostname) not in matched_fargate_urns:
+            writer.write('agents_without_inventory', OutputRecord(hostname,'','',lw_subaccount,''))
+
+
+def cloud_provider(urn: str) -> str:
+    for prefix, cloud in URN_CLOUD_PREFIXES:
+        if urn.startswith(prefix):
+            return cloud
+    return 'Other'
+
+
+def os_image_name(os_image: object) -> str:
+    # gcp reports a list of license urls, or a source image url; the last path segment names the image
+    if isinstance(os_image, list):
+        os_image = os_image[0] if os_image else ''
+    return str(os_image).rsplit('/', 1)[-1] if os_image else 'unknown'
+
+
+def coverage_percentage(hosts: int, with_agent: int) -> float:
+    # divide by zero handler...
+    return round((with_agent / hosts) * 100, 2) if with_agent > 0 else 0
+
+
+def coverage_line(label: str, hosts: int, with_agent: int) -> str:
+    return f'{label} -- hosts: {hosts}, with agent: {with_agent}, coverage: {coverage_percentage(hosts, with_agent)}%'
+
+
+def output_statistics(
+    args: argparse.Namespace, instance_result: InstanceResult, user_profile_data: dict, stream: TextIO = None
+) -> None:
+    coverage_counter = CoverageCounter()
+    coverage_counter.add_result(instance_result)
+    output_coverage_statistics(args, coverage_counter, user_profile_data, stream)
+
+
+def output_coverage_statistics(
+    args: argparse.Namespace, coverage_counter: CoverageCounter, user_profile_data: dict, stream: TextIO = None
+) -> None:
+    hosts, with_agent = coverage_counter.get('total', '')
+    print(f'Number of distinct hosts identified during inventory assessment: {hosts}', file=stream)
+    print(f'Number of hosts which report successful agent operation: {with_agent}', file=stream)
+    print(f'Coverage Percentage: {coverage_percentage(hosts, with_agent)}%', file=stream)
+
+    print(file=stream)
+    for cloud in coverage_counter.values('cloud'):
+        hosts, with_agent = coverage_counter.get('cloud', cloud)
+        print(coverage_line(cloud, hosts, with_agent), file=stream)
+    for is_kubernetes, label in [(True, 'Kubernetes nodes'), (False, 'Non-Kubernetes hosts')]:
+        hosts, with_agent = coverage_counter.get('kubernetes', is_kubernetes)
+        if hosts > 0:
+            print(coverage_line(label, hosts, with_agent), file=stream)
+
+    for tenant in coverage_counter.values('tenant'):
+        hosts, with_agent = coverage_counter.get('tenant', tenant)
+        print(coverage_line(f'Tenant {tenant}', hosts, with_agent), file=stream)
+
+    print(file=stream)
+    for os_image in coverage_counter.values('os_image'):
+        hosts, with_agent = coverage_counter.get('os_image', os_image)
+        print(coverage_line(f'OS image {os_image}', hosts, with_agent), file=stream)
 
-            print()
-            print(f'{lw_subaccount_name} -- Number of distinct hosts identified during inventory assessment: {instances_without_agents_count + instances_with_agent_count}')
-            print(f'{lw_subaccount_name} -- Number of hosts which report successful agent operation: {instances_with_agent_count}')
-            print(f'{lw_subaccount_name} -- Coverage Percentage: {coverage_percent}%')
+    if not args.current_sub_account_only:
+        for lw_subaccount in user_profile_data.get('accounts', []):
+            tenant = lw_subaccount.get('tenant')
+            hosts, with_agent = coverage_counter.get('subaccount', (tenant, lw_subaccount.get('accountName','')))
+            lw_subaccount_name = tenant_subaccount(tenant, lw_subaccount.get('accountName',''))
+
+            print(file=stream)
+            print(f'{lw_subaccount_name} -- Number of distinct hosts identified during inventory assessment: {hosts}',
+                  file=stream)
+            print(f'{lw_subaccount_name} -- Number of hosts which report successful agent operation: {with_agent}',
+                  file=stream)
+            print(f'{lw_subaccount_name} -- Coverage Percentage: {coverage_percentage(hosts, with_agent)}%', file=stream)
+
+
+def output_cluster_coverage(args: argparse.Namespace, coverage_counter: CoverageCounter, stream: TextIO = None) -> None:
+    stream = stream if stream is not None else sys.stdout
+    clusters = [(key, coverage_counter.get('cluster', key)) for key in coverage_counter.values('cluster')]
+    if args.json:
+        rows = [{
+            'subaccount': lw_subaccount,
+            'cloud': cloud,
+            'cluster': cluster if cluster else None,
+            'nodes': nodes,
+            'nodes_with_agent': with_agent,
+            'coverage': coverage_percentage(nodes, with_agent)
+        } for (lw_subaccount, cloud, cluster), (nodes, with_agent) in clusters]
+        if args.compact:
+            json.dump({'clusters': rows}, stream, separators=(',', ':'), sort_keys=True)
+        else:
+            json.dump({'clusters': rows}, stream, indent=4, sort_keys=True)
+        stream.write('\n')
+    elif args.csv:
+        writer = csv.writer(stream, lineterminator='\n')
+        writer.writerow(['Subaccount','Cloud','Cluster','Nodes','Nodes_with_agent','Coverage'])
+        writer.writerows(
+            [lw_subaccount, cloud, cluster, nodes, with_agent, coverage_percentage(nodes, with_agent)]
+            for (lw_subaccount, cloud, cluster), (nodes, with_agent) in clusters
+        )
+    else:
+        for (lw_subaccount, cloud, cluster), (nodes, with_agent) in clusters:
+            print(
+                f'{lw_subaccount} -- {cloud} cluster {cluster if cluster else "(unnamed)"} -- nodes: {nodes}, '
+                f'with agent: {with_agent}, coverage: {coverage_percentage(nodes, with_agent)}%', file=stream
+            )
+
+
+class Tenant():
+    """A Lacework account scanned by this run, with its client and, for --async, its search engine"""
+    def __init__(self, name: str, client: LaceworkClient, search_engine: AsyncSearchEngine = None) -> None:
+        self.name = name
+        self.client = client
+        self.search_engine = search_engine
+
+
+def tenant_credentials(args: argparse.Namespace) -> list[tuple[str, dict]]:
+    # (tenant name, LaceworkClient arguments); a single account run has no tenant name, so its records stay untagged
+    if args.tenants_file:
+        with open(args.tenants_file) as f:
+            entries = json.load(f)
+        tenants = list()
+        for entry in entries:
+            credentials = {
+                key: entry.get(key) for key in ['account', 'subaccount', 'api_key', 'api_secret', 'base_domain', 'profile']
+            }
+            tenants.append((entry.get('name') or entry.get('profile') or entry.get('account'), credentials))
+        return tenants
+    elif args.profiles:
+        return [(profile, {'profile': profile}) for profile in args.profiles]
+    return [(None, {
+        'account': args.account, 'subaccount': args.subaccount, 'api_key': args.api_key, 'api_secret': args.api_secret,
+        'profile': args.profile
+    })]
 
 
 def main(args: argparse.Namespace) -> None:
+    # setup logger in main for testability
+    logging.basicConfig(
+        format='%(asctime)s %(name)s [%(levelname)s] %(message)s'
+    )
+    logger.setLevel(os.getenv('LOG_LEVEL', logging.INFO))
 
-    if not args.profile and not args.account and not args.subaccount and not args.api_key and not args.api_secret:
+    multi_tenant = bool(args.profiles or args.tenants_file)
+    if not multi_tenant and not any([args.profile, args.account, args.subaccount, args.api_key, args.api_secret]):
         args.profile = 'default'
 
-    if args.csv and args.json:
-        logger.error('Please specify only one of --csv or --json for output formatting')
+    if sum([args.csv, args.json, args.ndjson, bool(args.sqlite)]) > 1:
+        logger.error('Please specify only one of --csv, --json, --ndjson or --sqlite for output formatting')
+        exit(1)
+    elif args.sqlite and args.statistics:
+        logger.error('--sqlite writes per-host records and cannot be combined with --statistics')
+        exit(1)
+    elif args.by_cluster and any([args.statistics, args.ndjson, args.sqlite]):
+        logger.error(
+            '--by-cluster reports per-cluster coverage and cannot be combined with --statistics, --ndjson or --sqlite'
+        )
+        exit(1)
+    elif args.ndjson and args.statistics:
+        logger.error('--ndjson streams per-host records and cannot be combined with --statistics')
+        exit(1)
+    elif args.async_engine and aiohttp is None:
+        logger.error('--async requires the aiohttp package: pip install aiohttp')
+        exit(1)
+    elif args.ndjson and args.incremental:
+        logger.error('--ndjson does not keep reconciled state and cannot be combined with --incremental')
+        exit(1)
+    elif args.serve is not None and any(
+        [args.ndjson, args.statistics, args.by_cluster, args.output, args.metrics, args.sqlite]
+    ):
+        logger.error(
+            '--serve publishes results over http and cannot be combined with --ndjson, --statistics, --by-cluster, '
+            '--output, --metrics or --sqlite'
+        )
+        exit(1)
+    elif args.profiles and args.tenants_file:
+        logger.error('Please specify only one of --profiles or --tenants-file')
+        exit(1)
+    elif multi_tenant and (args.serve is not None or args.incremental):
+        logger.error('--profiles and --tenants-file cannot be combined with --serve or --incremental')
+        exit(1)
+    elif multi_tenant and any([args.profile, args.account, args.subaccount, args.api_key, args.api_secret]):
+        logger.error(
+            '--profiles and --tenants-file name each tenant\'s credentials, '
+            'so other credential values should not be specified.'
+        )
         exit(1)
     elif args.profile and any([args.account, args.api_key, args.api_secret]):
         logger.error('If passing a profile, other credential values should not be specified.')
         exit(1)
-    elif not args.profile and not all([args.account, args.api_key, args.api_secret]):
+    elif not multi_tenant and not args.profile and not all([args.account, args.api_key, args.api_secret]):
         logger.error('If passing credentials, please specify at least --account, --api-key, and --api-secret. --sub-account is optional for this input format.')
         exit(1)
 
-    # setup logger in main for testability
-    logging.basicConfig(
-        format='%(asctime)s %(name)s [%(levelname)s] %(message)s'
-    )
-    logger = logging.getLogger('instance-discovery')
-    logger.setLevel(os.getenv('LOG_LEVEL', logging.INFO))
-
+    tenants = list()
     try:
-        client = LaceworkClient(
-            account=args.account,
-            subaccount=args.subaccount,
-            api_key=args.api_key,
-            api_secret=args.api_secret,
-            profile=args.profile
-        )
+        for name, credentials in tenant_credentials(args):
+            tenants.append(Tenant(name, LaceworkClient(**credentials)))
     except Exception:
         raise
 
+    if len({tenant.name for tenant in tenants}) != len(tenants):
+        logger.error('Every tenant needs a distinct name')
+        exit(1)
+
     if args.debug:
         logger.setLevel('DEBUG')
         logging.basicConfig(level=logging.DEBUG)
 
+    start_time, end_time = lookback_window()
+
+    if args.cache_dir and args.incremental:
+        # SearchCache only reuses full lookback windows; each incremental fetch covers its own time range and is always fetched
+        logger.debug('--incremental fetches are cached under their own time range and are not reused across runs')
+
+    if args.async_engine:
+        for tenant in tenants:
+            # each tenant has its own token and connection pool, so the in-flight budget is split between them
+            tenant.search_engine = AsyncSearchEngine(tenant.client, max(1, args.max_workers // len(tenants)), args.max_retries)
+    # spawned rather than forked, as forking a process that is already running threads can deadlock the children
+    parse_pool = None
+    if args.parse_processes:
+        parse_pool = ProcessPoolExecutor(args.parse_processes, mp_context=multiprocessing.get_context('spawn'))
+    try:
+        if args.serve is not None:
+            serve_reports(args, tenants[0].client, tenants[0].search_engine, parse_pool)
+        elif args.output:
+            with open(args.output, 'w', newline='', buffering=OUTPUT_BUFFER_SIZE) as output_stream:
+                run_report(args, tenants, start_time, end_time, output_stream, parse_pool)
+        else:
+            run_report(args, tenants, start_time, end_time, sys.stdout, parse_pool)
+    finally:
+        for tenant in tenants:
+            if tenant.search_engine:
+                tenant.search_engine.close()
+        if parse_pool:
+            parse_pool.shutdown()
+
+
+def lookback_window() -> tuple[str, str]:
     current_time = datetime.now(timezone.utc)
     start_time = current_time - timedelta(days=LOOKBACK_DAYS)
-    start_time = start_time.strftime('%Y-%m-%dT%H:%M:%SZ')
-    end_time = current_time.strftime('%Y-%m-%dT%H:%M:%SZ')
+    return (start_time.strftime('%Y-%m-%dT%H:%M:%SZ'), current_time.strftime('%Y-%m-%dT%H:%M:%SZ'))
+
+
+def wrap_subaccount_client(
+    client: LaceworkClient, lw_subaccount: str, limiter: AdaptiveLimiter, search_cache: SearchCache = None,
+    search_engine: AsyncSearchEngine = None, metrics: PhaseMetrics = None, time_slices: int = 0
+) -> ClientProxy:
+    if search_engine:
+        client = AsyncSearchClient(client, search_engine, metrics)
+    else:
+        client = ThrottledClient(without_sdk_retries(copy.deepcopy(client)), limiter, metrics)
+    if time_slices:
+        client = PartitionedClient(client, time_slices)
+    if search_cache:
+        client = CachedClient(client, search_cache, lw_subaccount)
+    if metrics:
+        # outermost, so searches served from the cache are counted too
+        client = MeteredClient(client, metrics)
+    return client
+
+
+def search_cache_for(args: argparse.Namespace) -> SearchCache:
+    return SearchCache(args.cache_dir, args.cache_ttl, args.cache_max_mb * 1024 * 1024) if args.cache_dir else None
 
+
+def subaccount_stats_for(args: argparse.Namespace) -> SubaccountStats:
+    stats_file = args.stats_file
+    if not stats_file and args.cache_dir:
+        stats_file = os.path.join(args.cache_dir, 'subaccount-stats.json')
+    return SubaccountStats(stats_file) if stats_file else None
+
+
+def timed_subaccount_report(subaccount_report: Callable, *args) -> tuple[object, float]:
+    started = time.monotonic()
+    result = subaccount_report(*args)
+    return (result, time.monotonic() - started)
+
+
+def collect_subaccount_reports(
+    args: argparse.Namespace, client: LaceworkClient, start_time: str, end_time: str, subaccount_report: Callable,
+    user_profile_data: dict, limiter: AdaptiveLimiter, search_cache: SearchCache = None,
+    search_engine: AsyncSearchEngine = None, subaccount_stats: SubaccountStats = None, run_metrics: RunMetrics = None,
+    tenant: str = None, executor: ThreadPoolExecutor = None
+) -> tuple[set, set, set]:
     instances_without_agents = set()
     matched_instances = set()
     agents_without_inventory = set()
 
-    # Grab the lacework accounts that the user has access to
-    user_profile = client.user_profile.get()
-    user_profile_data = user_profile.get("data", {})[0]
-
     if args.current_sub_account_only:
         # magic to get the current subaccount for reporting on where things are
         lw_subaccount = client.account._session.__dict__['_subaccount'] 
@@ -529,37 +2210,492 @@ def main(args: argparse.Namespace) -> None:
             # very hacky pull of the subdomain off the base_url
             lw_subaccount = client.account._session.__dict__['_base_url'].split('.')[0].split(':')[1][2::]
 
-        instances_without_agents, matched_instances, agents_without_inventory = generate_subaccount_report(client, start_time, end_time, lw_subaccount)
-
-    else:
+        metrics = run_metrics.subaccount(tenant_subaccount(tenant, lw_subaccount)) if run_metrics else None
+        subaccount_client = wrap_subaccount_client(
+            client, tenant_subaccount(tenant, lw_subaccount), limiter, search_cache, search_engine, metrics, args.time_slices
+        )
+        result, seconds = timed_subaccount_report(
+            partial(subaccount_report, metrics=metrics), subaccount_client, start_time, end_time, lw_subaccount
+        )
+        if metrics:
+            metrics.seconds = seconds
+        if result is not None:
+            instances_without_agents, matched_instances, agents_without_inventory = (
+                set(tag_tenant(r, tenant)) for r in result
+            )
+        return (instances_without_agents, matched_instances, agents_without_inventory)
+
+    executor_tasks = dict()
+    failed_subaccounts = list()
+    # split the worker budget so subaccount fan-out times per-subaccount fetches stays bounded
+    subaccount_workers = max(1, args.max_workers // SUBACCOUNT_FETCH_WORKERS)
+    # a multi-tenant run passes in one pool shared by every tenant
+    with nullcontext(executor) if executor else ThreadPoolExecutor(max_workers=subaccount_workers) as executor:
+
+        # cache entries, run time stats and metrics are keyed per tenant, as sub-account names can repeat across tenants
+        lw_subaccount_names = {
+            tenant_subaccount(tenant, lw_subaccount.get('accountName','')): lw_subaccount.get('accountName','')
+            for lw_subaccount in user_profile_data.get('accounts', [])
+        }
+        lw_subaccount_keys = list(lw_subaccount_names)
+        if subaccount_stats:
+            lw_subaccount_keys = subaccount_stats.order(lw_subaccount_keys)
+
+        # Iterate through all subaccounts
+        for lw_subaccount_key in lw_subaccount_keys:
+            lw_subaccount_name = lw_subaccount_names[lw_subaccount_key]
+            client.set_subaccount(lw_subaccount_name)
+            metrics = run_metrics.subaccount(lw_subaccount_key) if run_metrics else None
+            subaccount_client = wrap_subaccount_client(
+                client, lw_subaccount_key, limiter, search_cache, search_engine, metrics, args.time_slices
+            )
+
+            task = executor.submit(
+                timed_subaccount_report, partial(subaccount_report, metrics=metrics), subaccount_client, start_time,
+                end_time, lw_subaccount_name
+            )
+            executor_tasks[task] = lw_subaccount_key
+
+        for task in as_completed(executor_tasks):
+            # drop the finished future so its subaccount's records can be released as soon as they are merged
+            lw_subaccount_key = executor_tasks.pop(task)
+            try:
+                result, seconds = task.result()
+            except Exception as ex:
+                logger.error(f'{lw_subaccount_key}: report failed and is omitted from the results: {ex}')
+                failed_subaccounts.append(lw_subaccount_key)
+                continue
+
+            logger.debug('%s: report complete in %.1fs', lw_subaccount_key, seconds)
+            if run_metrics:
+                run_metrics.subaccount(lw_subaccount_key).seconds = seconds
+            if subaccount_stats:
+                records = sum(len(r) for r in result) if result is not None else None
+                subaccount_stats.record(lw_subaccount_key, seconds, records)
+            if result is not None:
+                instances_without_agents.update(tag_tenant(result[0], tenant))
+                matched_instances.update(tag_tenant(result[1], tenant))
+                agents_without_inventory.update(tag_tenant(result[2], tenant))
+
+    if failed_subaccounts:
+        logger.warning(
+            f'{len(failed_subaccounts)} sub-account(s) could not be reported: {", ".join(sorted(failed_subaccounts))}'
+        )
 
-        executor_tasks = list()
-        with ThreadPoolExecutor() as executor:
+    return (instances_without_agents, matched_instances, agents_without_inventory)
 
-            # Iterate through all subaccounts
-            for lw_subaccount in user_profile_data.get('accounts', []):
-                lw_subaccount_name = lw_subaccount.get('accountName','')
-                client.set_subaccount(lw_subaccount_name)
 
-                executor_tasks.append(executor.submit(generate_subaccount_report, copy.deepcopy(client), start_time, end_time, lw_subaccount_name))
+def collect_tenant_reports(
+    args: argparse.Namespace, tenant: 'Tenant', start_time: str, end_time: str, subaccount_report: Callable,
+    limiter: AdaptiveLimiter, search_cache: SearchCache = None, subaccount_stats: SubaccountStats = None,
+    run_metrics: RunMetrics = None, executor: ThreadPoolExecutor = None
+) -> tuple[tuple[set, set, set], dict]:
+    # Grab the lacework accounts that the user has access to
+    user_profile = tenant.client.user_profile.get()
+    user_profile_data = user_profile.get("data", {})[0]
 
-            for task in as_completed(executor_tasks):
-                result = task.result()
+    results = collect_subaccount_reports(
+        args, tenant.client, start_time, end_time, subaccount_report, user_profile_data, limiter, search_cache,
+        tenant.search_engine, subaccount_stats, run_metrics, tenant.name, executor
+    )
+    return (results, user_profile_data)
+
+
+def tenant_subaccount(tenant: str, lw_subaccount: str) -> str:
+    return f'{tenant}/{lw_subaccount}' if tenant is not None else lw_subaccount
+
+
+def tag_tenant(records: Iterable[OutputRecord], tenant: str) -> Iterable[OutputRecord]:
+    if tenant is not None:
+        for record in records:
+            record.tenant = tenant
+    return records
+
+
+def tenant_subaccount_report(
+    args: argparse.Namespace, tenant: str, writer: object = None, state_store: IncrementalStateStore = None,
+    parse_pool: Executor = None
+) -> Callable:
+    if writer:
+        # records are written as each sub-account streams them, rather than after the whole run is merged
+        if tenant is not None:
+            writer = TenantWriter(writer, tenant)
+        return partial(stream_subaccount_report, writer=writer, parse_pool=parse_pool)
+    elif state_store:
+        return partial(generate_incremental_subaccount_report, state_store=state_store, parse_pool=parse_pool)
+    return partial(generate_subaccount_report, parse_pool=parse_pool)
+
+
+def write_incremental_delta(args: argparse.Namespace, state_store: IncrementalStateStore) -> None:
+    delta_path = args.delta_output if args.delta_output else os.path.join(args.incremental, 'delta.json')
+    with open(delta_path, 'w') as delta_stream:
+        state_store.write_delta(delta_stream)
+
+
+def run_report(
+    args: argparse.Namespace, tenants: list['Tenant'], start_time: str, end_time: str, output_stream: TextIO,
+    parse_pool: Executor = None
+) -> None:
+    search_cache = search_cache_for(args)
+    # rate limits are per Lacework account, so each tenant adapts to its own throttling under one --max-workers cap
+    global_cap = threading.BoundedSemaphore(args.max_workers) if len(tenants) > 1 else None
+    limiters = {
+        tenant.name: AdaptiveLimiter(args.max_workers, args.max_retries, global_cap=global_cap) for tenant in tenants
+    }
+    state_store = IncrementalStateStore(args.incremental) if args.incremental else None
+    subaccount_stats = subaccount_stats_for(args)
+    run_metrics = RunMetrics() if args.metrics else None
+
+    ndjson_writer = NdjsonWriter(output_stream) if args.ndjson else None
+    sqlite_writer = SqliteWriter(args.sqlite) if args.sqlite else None
+    # statistics only need counts, so hosts are streamed into counters instead of being kept and sorted
+    # (incremental runs still build the records, as they are what its state is made of)
+    coverage_counter = CoverageCounter() if (args.statistics or args.by_cluster) and not state_store else None
+
+    if ndjson_writer:
+        writer = ndjson_writer
+    elif coverage_counter:
+        writer = coverage_counter
+    elif sqlite_writer and not state_store:
+        writer = sqlite_writer
+    else:
+        writer = None
 
-                instances_without_agents = instances_without_agents.union(result[0])
-                matched_instances = matched_instances.union(result[1])
-                agents_without_inventory = agents_without_inventory.union(result[2])
+    instances_without_agents = set()
+    matched_instances = set()
+    agents_without_inventory = set()
+    user_profile_data = {'accounts': []}
 
-    instance_result = InstanceResult(instances_without_agents, matched_instances, agents_without_inventory)
-    if args.statistics:
-        output_statistics(args, instance_result,user_profile_data)
+    if len(tenants) == 1:
+        results, user_profile_data = collect_tenant_reports(
+            args, tenants[0], start_time, end_time,
+            tenant_subaccount_report(args, tenants[0].name, writer, state_store, parse_pool), limiters[tenants[0].name],
+            search_cache, subaccount_stats, run_metrics
+        )
+        instances_without_agents, matched_instances, agents_without_inventory = results
     else:
-        if args.json:
-            instance_result.printJson()
-        elif args.csv:
-            instance_result.printCsv()
+        # every tenant's sub-accounts share one pool, so the run takes about as long as its largest tenant
+        failed_tenants = list()
+        subaccount_workers = max(1, args.max_workers // SUBACCOUNT_FETCH_WORKERS)
+        with ThreadPoolExecutor(max_workers=subaccount_workers) as executor, \
+                ThreadPoolExecutor(max_workers=len(tenants)) as tenant_executor:
+            tenant_tasks = {
+                tenant_executor.submit(
+                    collect_tenant_reports, args, tenant, start_time, end_time,
+                    tenant_subaccount_report(args, tenant.name, writer, state_store, parse_pool), limiters[tenant.name],
+                    search_cache, subaccount_stats, run_metrics, executor
+                ): tenant.name
+                for tenant in tenants
+            }
+            for task in as_completed(tenant_tasks):
+                tenant_name = tenant_tasks.pop(task)
+                try:
+                    results, tenant_profile_data = task.result()
+                except Exception as ex:
+                    logger.error(f'{tenant_name}: tenant could not be reported and is omitted from the results: {ex}')
+                    failed_tenants.append(tenant_name)
+                    continue
+                instances_without_agents.update(results[0])
+                matched_instances.update(results[1])
+                agents_without_inventory.update(results[2])
+                # sub-account names are only unique within a tenant
+                user_profile_data['accounts'].extend(
+                    dict(account, tenant=tenant_name) for account in tenant_profile_data.get('accounts', [])
+                )
+        if failed_tenants:
+            logger.warning(f'{len(failed_tenants)} tenant(s) could not be reported: {", ".join(sorted(failed_tenants))}')
+
+    if subaccount_stats:
+        subaccount_stats.save()
+
+    if coverage_counter:
+        output_started = time.monotonic()
+        if args.by_cluster:
+            output_cluster_coverage(args, coverage_counter, output_stream)
+        else:
+            output_coverage_statistics(args, coverage_counter, user_profile_data, output_stream)
+        if run_metrics:
+            run_metrics.run.add('output', seconds=time.monotonic() - output_started)
+    elif sqlite_writer:
+        output_started = time.monotonic()
+        if state_store:
+            write_incremental_delta(args, state_store)
+            result_records = (instances_without_agents, matched_instances, agents_without_inventory)
+            for result_set, records in zip(RESULT_SETS, result_records):
+                for record in records:
+                    sqlite_writer.write(result_set, record)
+        sqlite_writer.close()
+        if run_metrics:
+            run_metrics.run.add('output', seconds=time.monotonic() - output_started)
+    elif not ndjson_writer:
+        output_started = time.monotonic()
+        if state_store:
+            write_incremental_delta(args, state_store)
+
+        instance_result = InstanceResult(instances_without_agents, matched_instances, agents_without_inventory)
+        if args.statistics:
+            output_statistics(args, instance_result,user_profile_data, output_stream)
+        elif args.by_cluster:
+            coverage_counter = CoverageCounter()
+            coverage_counter.add_result(instance_result)
+            output_cluster_coverage(args, coverage_counter, output_stream)
         else:
-            instance_result.printStandard()
+            if args.json:
+                instance_result.printJson(output_stream, args.compact)
+            elif args.csv:
+                instance_result.printCsv(output_stream)
+            else:
+                instance_result.printStandard(output_stream)
+        if run_metrics:
+            run_metrics.run.add('output', seconds=time.monotonic() - output_started)
+
+    if run_metrics:
+        if args.metrics == '-':
+            run_metrics.write(sys.stderr)
+        else:
+            with open(args.metrics, 'w') as metrics_stream:
+                run_metrics.write(metrics_stream)
+
+
+##############
+# daemon mode
+##############
+class ReportSnapshot():
+    """One completed refresh: the reconciled results plus their coverage counts, with both endpoints' bodies rendered once"""
+    def __init__(self, instance_result: InstanceResult, refreshed_at: float, seconds: float) -> None:
+        self.instance_result = instance_result
+        self.refreshed_at = refreshed_at
+        self.seconds = seconds
+        self.coverage_counter = CoverageCounter()
+        self.coverage_counter.add_result(instance_result)
+        self.agents_without_inventory = dict()
+        for record in instance_result.agents_without_inventory:
+            self.agents_without_inventory[record.subaccount] = self.agents_without_inventory.get(record.subaccount, 0) + 1
+        # scrapes and downloads are far more frequent than refreshes, so neither re-renders per request
+        self.results_body = json.dumps(
+            instance_result.__dict__, separators=(',', ':'), sort_keys=True, default=serialize
+        ).encode('utf-8')
+        self.gauges = prometheus_gauges(self)
+
+
+class ReportService():
+    """--serve: refreshes every sub-account on a schedule and keeps the latest results in memory for the http endpoints"""
+    def __init__(
+        self, args: argparse.Namespace, client: LaceworkClient, search_engine: AsyncSearchEngine = None,
+        parse_pool: Executor = None
+    ) -> None:
+        self.args = args
+        self.client = client
+        self.search_engine = search_engine
+        # built once, so the search cache, throttling state and sub-account schedule stay warm between refreshes
+        self.search_cache = search_cache_for(args)
+        self.limiter = AdaptiveLimiter(args.max_workers, args.max_retries)
+        # each sub-account's reconciled state stays in memory, so a refresh only fetches what changed since the previous one;
+        # --incremental also restores it from, and writes it back to, the state directory
+        self.state_store = IncrementalStateStore(args.incremental, write_through=False)
+        self.subaccount_stats = subaccount_stats_for(args)
+        self.subaccount_report = tenant_subaccount_report(args, None, state_store=self.state_store, parse_pool=parse_pool)
+
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.snapshot = None
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    def refresh(self) -> ReportSnapshot:
+        started = time.monotonic()
+        start_time, end_time = lookback_window()
+        user_profile = self.client.user_profile.get()
+        user_profile_data = user_profile.get("data", {})[0]
+
+        results = collect_subaccount_reports(
+            self.args, self.client, start_time, end_time, self.subaccount_report, user_profile_data,
+            self.limiter, self.search_cache, self.search_engine, self.subaccount_stats
+        )
+        if self.subaccount_stats:
+            self.subaccount_stats.save()
+        if self.args.incremental:
+            write_incremental_delta(self.args, self.state_store)
+
+        snapshot = ReportSnapshot(InstanceResult(*results), time.time(), time.monotonic() - started)
+        # swapped in whole, so a request never sees a half-built refresh
+        with self.lock:
+            self.snapshot = snapshot
+            self.refreshes += 1
+        instance_result = snapshot.instance_result
+        hosts = len(instance_result.instances_without_agents) + len(instance_result.instances_with_agents)
+        logger.info('Refreshed %d hosts in %.1fs', hosts, snapshot.seconds)
+        return snapshot
+
+    def run(self) -> None:
+        while True:
+            try:
+                self.refresh()
+            except Exception as ex:
+                # keep serving the previous results until a refresh succeeds
+                logger.error(f'Refresh failed, serving the previous results: {ex}')
+                with self.lock:
+                    self.refresh_failures += 1
+            if self.stopped.wait(self.args.refresh_interval):
+                return
+
+    def start(self) -> 'ReportService':
+        self.thread = threading.Thread(target=self.run, name='instance-discovery-refresh', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.state_store.state_dir and self.thread:
+            # let a refresh in progress finish, so the state written out is consistent
+            self.thread.join()
+        self.state_store.flush()
+
+    def metrics_text(self) -> str:
+        with self.lock:
+            snapshot = self.snapshot
+            refreshes = self.refreshes
+            refresh_failures = self.refresh_failures
+        lines = [snapshot.gauges] if snapshot else []
+        lines.extend(prometheus_family(
+            'instance_discovery_refreshes_total', 'Completed refreshes since the service started', 'counter',
+            [('', refreshes)]
+        ))
+        lines.extend(prometheus_family(
+            'instance_discovery_refresh_failures_total', 'Refreshes which failed since the service started', 'counter',
+            [('', refresh_failures)]
+        ))
+        return '\n'.join(lines) + '\n'
+
+    def results_body(self) -> bytes:
+        with self.lock:
+            return self.snapshot.results_body if self.snapshot else None
+
+
+class ReportRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        service = self.server.service
+        path = urlsplit(self.path).path
+        if path == '/metrics':
+            self.respond(200, service.metrics_text().encode('utf-8'), 'text/plain; version=0.0.4; charset=utf-8')
+        elif path == '/results':
+            body = service.results_body()
+            if body is None:
+                self.respond(503, b'{"message":"the first refresh has not completed yet"}', 'application/json')
+            else:
+                self.respond(200, body, 'application/json')
+        else:
+            self.respond(404, b'{"message":"only /metrics and /results are served"}', 'application/json')
+
+    def respond(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug('%s %s', self.address_string(), format % args)
+
+
+def report_server(service: ReportService, address: str, port: int) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((address, port), ReportRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def serve_reports(
+    args: argparse.Namespace, client: LaceworkClient, search_engine: AsyncSearchEngine = None, parse_pool: Executor = None
+) -> None:
+    service = ReportService(args, client, search_engine, parse_pool).start()
+    server = report_server(service, args.serve_address, args.serve)
+    logger.info(
+        'Serving /metrics and /results on http://%s:%d, refreshing every %ds', args.serve_address, server.server_port,
+        args.refresh_interval
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        server.server_close()
+
+
+def prometheus_label_value(value: object) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_labels(label_names: tuple, value: object) -> str:
+    values = value if type(value) == tuple else (value,)
+    # a label without a value, such as the tenant of a single account, is left out
+    labels = (f'{name}="{prometheus_label_value(v)}"' for name, v in zip(label_names, values) if v is not None)
+    return '{' + ','.join(labels) + '}'
+
+
+def prometheus_family(name: str, help_text: str, metric_type: str, samples: list[tuple[str, object]]) -> list[str]:
+    # samples are (rendered label set, value)
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}']
+    lines.extend(f'{name}{labels} {value}' for labels, value in samples)
+    return lines
+
+
+def prometheus_gauges(snapshot: ReportSnapshot) -> str:
+    counter = snapshot.coverage_counter
+    hosts, with_agent = counter.get('total', '')
+    lines = list()
+    lines.extend(prometheus_family(
+        'instance_discovery_hosts', 'Inventory hosts identified in the lookback window', 'gauge', [('', hosts)]
+    ))
+    lines.extend(prometheus_family(
+        'instance_discovery_hosts_with_agent', 'Inventory hosts reconciled with an agent', 'gauge', [('', with_agent)]
+    ))
+    lines.extend(prometheus_family(
+        'instance_discovery_coverage_ratio', 'Share of inventory hosts reconciled with an agent', 'gauge',
+        [('', coverage_ratio(hosts, with_agent))]
+    ))
+
+    for dimension, label_names in METRIC_DIMENSIONS.items():
+        samples = [
+            (prometheus_labels(label_names, value), counter.get(dimension, value)) for value in counter.values(dimension)
+        ]
+        lines.extend(prometheus_family(
+            f'instance_discovery_{dimension}_hosts', f'Inventory hosts by {dimension}', 'gauge',
+            [(labels, h) for labels, (h, _) in samples]
+        ))
+        lines.extend(prometheus_family(
+            f'instance_discovery_{dimension}_hosts_with_agent', f'Inventory hosts reconciled with an agent by {dimension}',
+            'gauge', [(labels, w) for labels, (_, w) in samples]
+        ))
+        lines.extend(prometheus_family(
+            f'instance_discovery_{dimension}_coverage_ratio',
+            f'Share of inventory hosts reconciled with an agent by {dimension}', 'gauge',
+            [(labels, coverage_ratio(h, w)) for labels, (h, w) in samples]
+        ))
+
+    lines.extend(prometheus_family(
+        'instance_discovery_agents_without_inventory',
+        'Agents reporting in without a matching inventory record, by subaccount', 'gauge',
+        [
+            (f'{{subaccount="{prometheus_label_value(subaccount)}"}}', count)
+            for subaccount, count in sorted(snapshot.agents_without_inventory.items())
+        ]
+    ))
+    lines.extend(prometheus_family(
+        'instance_discovery_last_refresh_timestamp_seconds', 'Unix time the served results were refreshed', 'gauge',
+        [('', round(snapshot.refreshed_at, 3))]
+    ))
+    lines.extend(prometheus_family(
+        'instance_discovery_last_refresh_duration_seconds', 'Seconds the last successful refresh took', 'gauge',
+        [('', round(snapshot.seconds, 3))]
+    ))
+    return '\n'.join(lines)
+
+
+def coverage_ratio(hosts: int, with_agent: int) -> float:
+    return round(with_agent / hosts, 6) if hosts else 0.0
 
 
 if __name__ == '__main__':
@@ -593,6 +2729,21 @@ if __name__ == '__main__':
         default=os.environ.get('LW_PROFILE', None),
         help='The Lacework CLI profile to use'
     )
+    parser.add_argument(
+        '--profiles',
+        nargs='+',
+        default=os.environ['LW_PROFILES'].split(',') if 'LW_PROFILES' in os.environ else None,
+        help='Scan each of these Lacework CLI profiles as a separate tenant, concurrently and in one merged output'
+    )
+    parser.add_argument(
+        '--tenants-file',
+        dest='tenants_file',
+        default=os.environ.get('LW_TENANTS_FILE', None),
+        help=(
+            'JSON list of tenants to scan, each with a name and either a profile or account, api_key, api_secret '
+            'and optional subaccount'
+        )
+    )
     parser.add_argument(
         '--current-sub-account-only',
         default=False,
@@ -611,12 +2762,151 @@ if __name__ == '__main__':
         action='store_true',
         help='Emit results as csv'
     )
+    parser.add_argument(
+        '--compact',
+        default=False,
+        action='store_true',
+        help='Emit json without indentation'
+    )
+    parser.add_argument(
+        '-o', '--output',
+        default=None,
+        help='Write results to this file instead of stdout'
+    )
+    parser.add_argument(
+        '--ndjson',
+        default=False,
+        action='store_true',
+        help='Stream results as newline delimited json, one record per line, as each sub-account is reconciled'
+    )
+    parser.add_argument(
+        '--sqlite',
+        default=None,
+        help='Load the results into an indexed sqlite database at this path, as each sub-account is reconciled'
+    )
     parser.add_argument(
         '--statistics',
         default=False,
         action='store_true',
         help='Output only statistics'
     )
+    parser.add_argument(
+        '--by-cluster',
+        dest='by_cluster',
+        default=False,
+        action='store_true',
+        help='Output node count, nodes with agent and coverage per EKS, GKE and AKS cluster instead of per-host results'
+    )
+    parser.add_argument(
+        '--max-workers',
+        dest='max_workers',
+        type=int,
+        default=int(os.environ.get('LW_MAX_WORKERS', MAX_WORKERS)),
+        help='Upper bound on concurrent API fetches across all sub-accounts'
+    )
+    parser.add_argument(
+        '--max-retries',
+        dest='max_retries',
+        type=int,
+        default=int(os.environ.get('LW_MAX_RETRIES', MAX_RETRIES)),
+        help='Retries for a throttled or failed API request, with jittered exponential backoff'
+    )
+    parser.add_argument(
+        '--async',
+        dest='async_engine',
+        default=False,
+        action='store_true',
+        help='Run all searches on a single asyncio event loop with a shared connection pool (requires aiohttp)'
+    )
+    parser.add_argument(
+        '--parse-processes',
+        dest='parse_processes',
+        type=int,
+        default=int(os.environ.get('LW_PARSE_PROCESSES', 0)),
+        help='Decode and normalize raw inventory pages on this many worker processes instead of the main process'
+    )
+    parser.add_argument(
+        '--time-slices',
+        dest='time_slices',
+        type=int,
+        default=int(os.environ.get('LW_TIME_SLICES', 0)),
+        help=(
+            'Split each search\'s lookback window into this many slices fetched in parallel, re-splitting any slice '
+            'that nears the result cap'
+        )
+    )
+    parser.add_argument(
+        '--cache-dir',
+        dest='cache_dir',
+        default=os.environ.get('LW_CACHE_DIR', None),
+        help=(
+            'Cache inventory and agent search pages in this directory and reuse them across runs. Only full lookback '
+            'windows are reused, so --incremental fetches always reach the API'
+        )
+    )
+    parser.add_argument(
+        '--cache-ttl',
+        dest='cache_ttl',
+        type=int,
+        default=int(os.environ.get('LW_CACHE_TTL', CACHE_TTL_SECONDS)),
+        help='Seconds a cached search stays valid'
+    )
+    parser.add_argument(
+        '--cache-max-mb',
+        dest='cache_max_mb',
+        type=int,
+        default=int(os.environ.get('LW_CACHE_MAX_MB', CACHE_MAX_BYTES // (1024 * 1024))),
+        help='Size limit for the cache directory; oldest entries are evicted first'
+    )
+    parser.add_argument(
+        '--stats-file',
+        dest='stats_file',
+        default=os.environ.get('LW_STATS_FILE', None),
+        help=(
+            'Record per sub-account run times here and schedule the slowest sub-accounts first '
+            '(default: <cache dir>/subaccount-stats.json)'
+        )
+    )
+    parser.add_argument(
+        '--incremental',
+        default=os.environ.get('LW_STATE_DIR', None),
+        help='Keep reconciled state in this directory and only fetch changes since the previous run'
+    )
+    parser.add_argument(
+        '--delta-output',
+        dest='delta_output',
+        default=None,
+        help='File for hosts which newly lost or gained coverage in an --incremental run (default: <state dir>/delta.json)'
+    )
+    parser.add_argument(
+        '--metrics',
+        nargs='?',
+        const='-',
+        default=os.environ.get('LW_METRICS', None),
+        help=(
+            'Write per sub-account and per phase timings, page, record and byte counts, parse failures and peak memory '
+            'as json to this file (default: stderr)'
+        )
+    )
+    parser.add_argument(
+        '--serve',
+        type=int,
+        default=int(os.environ['LW_SERVE']) if 'LW_SERVE' in os.environ else None,
+        help='Run as a daemon serving coverage gauges on /metrics and the current results on /results from this port'
+    )
+    parser.add_argument(
+        '--serve-address',
+        dest='serve_address',
+        default=os.environ.get('LW_SERVE_ADDRESS', SERVE_ADDRESS),
+        help='Address the --serve endpoints listen on'
+    )
+    parser.add_argument(
+        '--refresh-interval',
+        dest='refresh_interval',
+        type=int,
+        default=int(os.environ.get('LW_REFRESH_INTERVAL', REFRESH_INTERVAL_SECONDS)),
+        help='Seconds between --serve refreshes of every sub-account'
+    )
     parser.add_argument(
         '--debug',
         action='store_true',
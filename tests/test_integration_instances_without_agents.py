@@ -1,36 +1,192 @@
+import json
+import shutil
 import sys
+import threading
+import urllib.error
+import urllib.request
 # setting path
 sys.path.append('../instance-discovery')
 
 import instances_without_agents
+import pytest
 
 from argparse import Namespace
-from unittest.mock import patch
-
-# @patch('instances_without_agents.generate_subaccount_report')
-# def test_integration_default_profile_json_output_mocked_data(mock_report):
-
-#     # setup mocks
-#     # TODO: Mock Agent data lookup
-#     # TODO: Mock AWS data lookup
-#     # TODO: Mock GCP data lookup
-#     # TODO: Mock Azure data lookup
-#     # TODO: Mock Fargate data lookup
-#     # TODO: Do we need to mock the client object instantiation?
-#     #mock_report.return_val = (1,[],[])
-
-#     # setup input variables - Default profile - json output
-#     # python3 instances_without_agents.py -p default --json
-#     args = Namespace(account='', api_key='', api_secret='', subaccount='', profile='default', csv=False, json=True, debug=False, current_sub_account_only=True, statistics=False)
-#     instances_without_agents.main(args)
-
-#     # capture output
-#     #out, err = capsys.readouterr()
-#     out = ''
-#     err = ''
-
-#     # assertions
-#     assert '"instances_with_agents"' in out 
-#     assert '"instances_without_agents"' in out 
-#     assert '"agents_without_inventory"' in out 
-#     assert err == '' 
\ No newline at end of file
+from benchmarks.lacework_standin import LaceworkStandin, self_signed_certificate
+from benchmarks.synthetic import SyntheticTenant
+from laceworksdk import LaceworkClient
+
+pytestmark = pytest.mark.skipif(
+    shutil.which('openssl') is None, reason='the API stand-in needs openssl for its TLS certificate'
+)
+
+
+def standin_args(output: str, **overrides) -> Namespace:
+    args = dict(
+        account='127', subaccount=None, api_key='standin-key', api_secret='standin-secret', profile=None, profiles=None,
+        tenants_file=None, current_sub_account_only=False, json=True, csv=False, compact=False, output=output, ndjson=False,
+        sqlite=None, statistics=False, by_cluster=False, max_workers=10, max_retries=5, async_engine=False, cache_dir=None,
+        cache_ttl=0, cache_max_mb=1, stats_file=None, incremental=None, delta_output=None, metrics=None, time_slices=0,
+        parse_processes=0, serve=None, serve_address='127.0.0.1', refresh_interval=900, debug=False
+    )
+    args.update(overrides)
+    return Namespace(**args)
+
+
+def run_against_standin(
+    monkeypatch, tmp_path, tenant: SyntheticTenant, args: dict = {}, **standin_options
+) -> tuple[dict, dict]:
+    output = tmp_path / 'report.json'
+    with LaceworkStandin(tenant, **standin_options) as standin:
+        for key, value in standin.environment().items():
+            monkeypatch.setenv(key, value)
+        instances_without_agents.main(standin_args(str(output), **args))
+        stats = standin.stats.to_dict()
+
+    with open(output) as f:
+        return (json.load(f), stats)
+
+
+def test_integration_json_output_against_api_standin(monkeypatch, tmp_path):
+    tenant = SyntheticTenant(600, subaccounts=3, page_size=50)
+    report, stats = run_against_standin(monkeypatch, tmp_path, tenant)
+
+    assert(set(report.keys()) == {'instances_with_agents', 'instances_without_agents', 'agents_without_inventory'})
+    assert(len(report['instances_with_agents']) > 0)
+    assert(len(report['instances_without_agents']) > 0)
+    assert({r['subaccount'] for r in report['instances_with_agents']} == set(tenant.subaccounts))
+    # every subaccount's six searches paged through more than one page
+    assert(stats['pages'] > 3 * 6)
+    assert(stats['throttled'] == 0 and stats['errors'] == 0)
+
+
+def test_integration_output_is_unchanged_by_throttling_and_errors(monkeypatch, tmp_path):
+    tenant = SyntheticTenant(600, subaccounts=3, page_size=50)
+    clean, _ = run_against_standin(monkeypatch, tmp_path, tenant)
+    noisy, stats = run_against_standin(
+        monkeypatch, tmp_path, tenant, throttle_rate=0.1, error_rate=0.05, retry_after='0', seed=7
+    )
+
+    assert(stats['throttled'] > 0)
+    assert(noisy == clean)
+
+
+def test_integration_time_sliced_output_matches_single_window(monkeypatch, tmp_path):
+    # the stand-in ignores the time filter, so every slice sees every host and only deduplication keeps the output unchanged
+    tenant = SyntheticTenant(600, subaccounts=3, page_size=50)
+    single, _ = run_against_standin(monkeypatch, tmp_path, tenant)
+    sliced, stats = run_against_standin(monkeypatch, tmp_path, tenant, {'time_slices': 4})
+
+    assert(sliced == single)
+    assert(stats['records'] > 4 * len(single['instances_with_agents']))
+
+
+def test_integration_by_cluster_rolls_up_every_kubernetes_node(monkeypatch, tmp_path):
+    tenant = SyntheticTenant(600, subaccounts=3, page_size=50)
+    report, _ = run_against_standin(monkeypatch, tmp_path, tenant)
+    rollup, _ = run_against_standin(monkeypatch, tmp_path, tenant, {'by_cluster': True})
+
+    expected = dict()
+    for result_set in ['instances_with_agents', 'instances_without_agents']:
+        for record in report[result_set]:
+            if record['is_kubernetes'] is True:
+                cloud = instances_without_agents.cloud_provider(record['urn'])
+                counts = expected.setdefault((record['subaccount'], cloud, record['cluster']), [0, 0])
+                counts[0] += 1
+                counts[1] += result_set == 'instances_with_agents'
+
+    assert({c['cloud'] for c in rollup['clusters']} == {'AWS', 'GCP', 'Azure'})
+    clusters = {(c['subaccount'], c['cloud'], c['cluster']): [c['nodes'], c['nodes_with_agent']] for c in rollup['clusters']}
+    assert(clusters == expected)
+
+
+def test_integration_metrics_account_for_every_page_served(monkeypatch, tmp_path):
+    tenant = SyntheticTenant(600, subaccounts=3, page_size=50)
+    metrics_path = tmp_path / 'metrics.json'
+    _, stats = run_against_standin(monkeypatch, tmp_path, tenant, {'metrics': str(metrics_path)})
+
+    with open(metrics_path) as f:
+        metrics = json.load(f)
+
+    assert(set(metrics['subaccounts'].keys()) == set(tenant.subaccounts))
+    phases = [phase for subaccount in metrics['subaccounts'].values() for phase in subaccount['phases'].values()]
+    assert(sum(p['pages'] for p in phases) == stats['pages'])
+    assert(sum(p['records'] for p in phases) == stats['records'])
+    assert(sum(p['bytes_received'] for p in phases) == stats['bytes_sent'])
+    for subaccount in metrics['subaccounts'].values():
+        assert(set(subaccount['phases'].keys()) == {
+            'agents', 'gcp_inventory', 'aws_inventory', 'azure_inventory', 'azure_vmss_inventory', 'fargate_inventory',
+            'reconcile'
+        })
+        assert(subaccount['seconds'] > 0)
+    assert(metrics['run']['phases']['output']['seconds'] >= 0)
+
+
+def test_integration_serve_publishes_results_and_gauges(monkeypatch, tmp_path):
+    tenant = SyntheticTenant(600, subaccounts=3, page_size=50)
+    report, _ = run_against_standin(monkeypatch, tmp_path, tenant)
+
+    with LaceworkStandin(tenant) as standin:
+        for key, value in standin.environment().items():
+            monkeypatch.setenv(key, value)
+        args = standin_args(None, json=False, serve=0)
+        client = LaceworkClient(account=args.account, api_key=args.api_key, api_secret=args.api_secret)
+        service = instances_without_agents.ReportService(args, client)
+        server = instances_without_agents.report_server(service, '127.0.0.1', 0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        # loopback only, whatever proxy the environment configures
+        opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+        url = f'http://127.0.0.1:{server.server_port}'
+        try:
+            with pytest.raises(urllib.error.HTTPError) as not_ready:
+                opener.open(f'{url}/results')
+            service.refresh()
+            served = json.load(opener.open(f'{url}/results'))
+            gauges = opener.open(f'{url}/metrics').read().decode('utf-8').splitlines()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    assert(not_ready.value.code == 503)
+    assert(served == report)
+    hosts = len(report['instances_with_agents']) + len(report['instances_without_agents'])
+    assert(f'instance_discovery_hosts {hosts}' in gauges)
+    for lw_subaccount in tenant.subaccounts:
+        prefix = f'instance_discovery_subaccount_coverage_ratio{{subaccount="{lw_subaccount}"}}'
+        assert(any(line.startswith(prefix) for line in gauges))
+    prefix = 'instance_discovery_cluster_hosts{subaccount="subaccount-000",cloud="AWS",cluster="eks-'
+    assert(any(line.startswith(prefix) for line in gauges))
+    assert('instance_discovery_refreshes_total 1' in gauges)
+
+
+def test_integration_tenants_file_merges_and_tags_each_tenant(monkeypatch, tmp_path):
+    tenants = {
+        'prod': SyntheticTenant(400, subaccounts=2, page_size=50, prefix='prod'),
+        'dev': SyntheticTenant(200, subaccounts=1, page_size=50, prefix='dev')
+    }
+    single = {name: run_against_standin(monkeypatch, tmp_path, tenant)[0] for name, tenant in tenants.items()}
+
+    # one certificate for both stand-ins, as requests verifies against a single bundle
+    certfile, keyfile = self_signed_certificate(str(tmp_path))
+    with LaceworkStandin(tenants['prod'], certfile=certfile, keyfile=keyfile) as prod, \
+            LaceworkStandin(tenants['dev'], certfile=certfile, keyfile=keyfile) as dev:
+        for key, value in prod.environment().items():
+            monkeypatch.setenv(key, value)
+        tenants_file = tmp_path / 'tenants.json'
+        tenants_file.write_text(json.dumps([
+            {
+                'name': name, 'account': '127', 'api_key': 'standin-key', 'api_secret': 'standin-secret',
+                'base_domain': f'0.0.1:{standin.port}'
+            }
+            for name, standin in [('prod', prod), ('dev', dev)]
+        ]))
+        output = tmp_path / 'merged.json'
+        instances_without_agents.main(
+            standin_args(str(output), account=None, api_key=None, api_secret=None, tenants_file=str(tenants_file))
+        )
+
+    with open(output) as f:
+        merged = json.load(f)
+
+    for result_set, records in merged.items():
+        expected = [dict(record, tenant=name) for name, report in single.items() for record in report[result_set]]
+        assert(records == sorted(expected, key=lambda r: r['urn']))
@@ -1,10 +1,21 @@
+import csv
+import io
+import json
+import sqlite3
 import sys
+import threading
+import time
 # setting path
 sys.path.append('../instance-discovery')
 
 import instances_without_agents
+import pytest
+import requests
 from argparse import Namespace
-from unittest.mock import patch
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from laceworksdk.exceptions import RateLimitError
+from unittest.mock import MagicMock, patch
 
 #########################
 # check_truncation
@@ -49,7 +60,9 @@ def test_get_fargate_with_lacework_agents_1():
         }
     ]
     lw_subaccount = 'test'
-    results_with_agent, results_without_agent = instances_without_agents.get_fargate_with_lacework_agents(input_data, lw_subaccount)
+    results_with_agent, results_without_agent = instances_without_agents.get_fargate_with_lacework_agents(
+        input_data, [], lw_subaccount
+    )
 
     assert(results_with_agent != None)
     assert(len(results_with_agent) == 1)
@@ -58,12 +71,146 @@ def test_get_fargate_with_lacework_agents_1():
     assert(len(results_without_agent) == 1)
 
     
+###################################
+# apply_fargate_filter
+###################################
+def test_get_fargate_with_lacework_agents_2():
+    input_data = [
+        {'data':
+            [{'resourceConfig': {'taskArn': 'arn:task/active'}},
+             {'resourceConfig': {'taskArn': 'arn:task/inactive'}},
+             {'resourceConfig': {'taskArn': 'arn:task/missing'}}]
+        }
+    ]
+    input_agent_info = [
+        {'status': 'ACTIVE', 'tags': {'net.lacework.aws.fargate.taskarn': 'arn:task/active'}},
+        {'status': 'INACTIVE', 'tags': {'net.lacework.aws.fargate.taskarn': 'arn:task/inactive'}}
+    ]
+    results_with_agent, results_without_agent = instances_without_agents.get_fargate_with_lacework_agents(
+        input_data, input_agent_info, 'test'
+    )
+
+    assert([t.urn for t in results_with_agent] == ['arn:task/active'])
+    assert([t.urn for t in results_without_agent] == ['arn:task/missing'])
+
+
 ###################################
 # apply_fargate_filter
 ###################################
 def test_apply_fargate_filter_1():
-    # TODO: need to be able to mock LaceworkClinet.inventory.search
-    return 0
+    input_fargate_inventory = [
+        {'data':
+            [{'resourceConfig': {'taskArn': 'arn:task/a',
+                                 'containers': [{'image': 'lacework/datacollector', 'taskArn': 'arn:task/a'}]}},
+             {'resourceConfig': {'taskArn': 'arn:task/b'}},
+             {'resourceConfig': {'taskArn': 'arn:task/c'}}]
+        }
+    ]
+    input_agent_snapshot = instances_without_agents.AgentSnapshot([{'data': [
+        {'status': 'ACTIVE', 'hostname': 'arn:task/b_5678', 'tags': {
+            'VmProvider': 'AWS', 'VmInstanceType': 'AWS_ECS_V4FARGATE', 'Hostname': 'arn:task/b_5678',
+            'net.lacework.aws.fargate.taskarn': 'arn:task/b'
+        }}
+    ]}])
+    input_agents_without_inventory = [
+        instances_without_agents.OutputRecord('arn:task/a_1234','','','test',''),
+        instances_without_agents.OutputRecord('arn:task/b_5678','','','test',''),
+        instances_without_agents.OutputRecord('on-prem-host','','','test','')
+    ]
+
+    results = instances_without_agents.apply_fargate_filter(
+        input_fargate_inventory, input_agent_snapshot, [], [], input_agents_without_inventory, 'test'
+    )
+    result_instances_without_agents, result_matched_instances, result_agents_without_inventory = results
+
+    assert(sorted(t.urn for t in result_matched_instances) == ['arn:task/a', 'arn:task/b'])
+    assert([t.urn for t in result_instances_without_agents] == ['arn:task/c'])
+    assert([a.urn for a in result_agents_without_inventory] == ['on-prem-host'])
+
+
+###################################
+# OutputRecord
+###################################
+def test_output_record_equality_by_urn():
+    a = instances_without_agents.OutputRecord('urn-1','2022-01-01',False,'test','',{'a': 'apple'})
+    b = instances_without_agents.OutputRecord('urn-1','',True,'other','',None)
+
+    assert(a == b)
+    assert(len(set([a, b])) == 1)
+    assert(not hasattr(a, '__dict__'))
+
+
+def test_output_record_interns_shared_fields():
+    a = instances_without_agents.OutputRecord('urn-1','',False,''.join(['sub', 'account']),''.join(['debian', '-11']))
+    b = instances_without_agents.OutputRecord('urn-2','',False,''.join(['sub', 'account']),''.join(['debian', '-11']))
+
+    assert(a.subaccount is b.subaccount)
+    assert(a.os_image is b.os_image)
+
+
+###################################
+# InstanceResult
+###################################
+def sample_instance_result():
+    return instances_without_agents.InstanceResult(
+        set([instances_without_agents.OutputRecord(
+            'b','2022-01-01',False,'test','projects/debian-cloud/licenses/debian-11',{'team': 'a,b', 'quote': '"x"'}
+        )]),
+        set([instances_without_agents.OutputRecord('a','2022-01-01',True,'test','',[{'Key': 'Name', 'Value': 'web'}])]),
+        set([instances_without_agents.OutputRecord('c','','','test','')])
+    )
+
+
+def test_instance_result_print_json_1():
+    stream = io.StringIO()
+    instance_result = sample_instance_result()
+    instance_result.printJson(stream)
+
+    assert(stream.getvalue() == json.dumps(
+        instance_result.__dict__, indent=4, sort_keys=True, default=instances_without_agents.serialize
+    ) + '\n')
+
+
+def test_instance_result_print_json_compact():
+    stream = io.StringIO()
+    sample_instance_result().printJson(stream, compact=True)
+    output = stream.getvalue()
+
+    assert(output.count('\n') == 1)
+    assert(json.loads(output)['instances_with_agents'][0]['urn'] == 'a')
+
+
+def test_instance_result_print_csv_1():
+    stream = io.StringIO()
+    sample_instance_result().printCsv(stream)
+    rows = list(csv.reader(io.StringIO(stream.getvalue())))
+
+    assert(len(rows) == 4)
+    assert(all(len(row) == 8 for row in rows))
+    assert(rows[1][0] == 'b' and rows[1][2] == 'true')
+    assert(rows[1][6] == "{'team': 'a,b', 'quote': ''x''}")
+    assert(rows[2][0] == 'a' and rows[2][3] == 'true')
+    assert(rows[3][0] == 'c' and rows[3][4] == 'true')
+
+
+def test_instance_result_tags_multi_tenant_output():
+    instance_result = sample_instance_result()
+    writer = instances_without_agents.TenantWriter(MagicMock(), 'prod')
+    records = (
+        instance_result.instances_without_agents + instance_result.instances_with_agents
+        + instance_result.agents_without_inventory
+    )
+    for record in records:
+        writer.write('instances_with_agents', record)
+
+    stream = io.StringIO()
+    instance_result.printCsv(stream)
+    rows = list(csv.reader(io.StringIO(stream.getvalue())))
+
+    assert(rows[0][-1] == 'Tenant')
+    assert(all(len(row) == 9 and row[-1] == 'prod' for row in rows[1:]))
+    assert(instance_result.instances_with_agents[0].to_dict()['tenant'] == 'prod')
+    assert('tenant' not in sample_instance_result().instances_with_agents[0].to_dict())
 
 
 ###################################
@@ -127,32 +274,1159 @@ def test_output_statistics_current_account_3(capsys):
     assert(err == '')
 
 
+def test_counting_statistics_match_full_statistics(capsys):
+    client = MagicMock()
+    client.inventory.search.side_effect = mock_inventory_search
+    client.agent_info.search.side_effect = mock_agent_info_search
+    input_args = Namespace(current_sub_account_only=False, statistics=True)
+    input_user_profile_data = {'accounts': [{'accountName': 'test'}, {'accountName': 'empty'}]}
+
+    results = instances_without_agents.generate_subaccount_report(client, '', '', 'test')
+    instances_without_agents.output_statistics(
+        input_args, instances_without_agents.InstanceResult(*results), input_user_profile_data
+    )
+    full, _ = capsys.readouterr()
+
+    coverage_counter = instances_without_agents.CoverageCounter()
+    instances_without_agents.stream_subaccount_report(client, '', '', 'test', coverage_counter)
+    instances_without_agents.output_coverage_statistics(input_args, coverage_counter, input_user_profile_data)
+    counted, _ = capsys.readouterr()
+
+    assert(counted == full)
+    assert('Number of distinct hosts identified during inventory assessment: 4' in counted)
+    assert('Coverage Percentage: 50.0%' in counted)
+    assert('AWS -- hosts: 2, with agent: 1, coverage: 50.0%' in counted)
+    assert('Other -- hosts: 2, with agent: 1, coverage: 50.0%' in counted)
+    assert('Non-Kubernetes hosts -- hosts: 4, with agent: 2, coverage: 50.0%' in counted)
+    assert('OS image unknown -- hosts: 4, with agent: 2, coverage: 50.0%' in counted)
+    assert('empty -- Number of distinct hosts identified during inventory assessment: 0' in counted)
+
+
+def test_counting_statistics_count_hosts_seen_in_several_subaccounts_once(capsys):
+    client = MagicMock()
+    client.inventory.search.side_effect = mock_inventory_search
+    client.agent_info.search.side_effect = mock_agent_info_search
+    input_args = Namespace(current_sub_account_only=False, statistics=True)
+    input_user_profile_data = {'accounts': [{'accountName': 'test'}, {'accountName': 'copy'}]}
+
+    # both subaccounts integrate the same cloud account, as run_report merges them
+    merged = [set(), set(), set()]
+    for lw_subaccount in ['test', 'copy']:
+        for result_set, records in zip(
+            merged, instances_without_agents.generate_subaccount_report(client, '', '', lw_subaccount)
+        ):
+            result_set.update(records)
+    instances_without_agents.output_statistics(
+        input_args, instances_without_agents.InstanceResult(*merged), input_user_profile_data
+    )
+    full, _ = capsys.readouterr()
+
+    coverage_counter = instances_without_agents.CoverageCounter()
+    for lw_subaccount in ['test', 'copy']:
+        instances_without_agents.stream_subaccount_report(client, '', '', lw_subaccount, coverage_counter)
+    instances_without_agents.output_coverage_statistics(input_args, coverage_counter, input_user_profile_data)
+    counted, _ = capsys.readouterr()
+
+    assert(counted == full)
+    assert('Number of distinct hosts identified during inventory assessment: 4' in counted)
+
+
+def test_counting_statistics_keep_same_named_subaccounts_of_each_tenant_apart(capsys):
+    coverage_counter = instances_without_agents.CoverageCounter()
+    coverage_counter.write(
+        'instances_with_agents', instances_without_agents.OutputRecord('arn:prod-1', '', False, 'main', None, tenant='prod')
+    )
+    coverage_counter.write(
+        'instances_without_agents', instances_without_agents.OutputRecord('arn:prod-2', '', False, 'main', None, tenant='prod')
+    )
+    coverage_counter.write(
+        'instances_without_agents', instances_without_agents.OutputRecord('arn:dev-1', '', False, 'main', None, tenant='dev')
+    )
+    input_args = Namespace(current_sub_account_only=False, statistics=True)
+    input_user_profile_data = {
+        'accounts': [{'accountName': 'main', 'tenant': 'prod'}, {'accountName': 'main', 'tenant': 'dev'}]
+    }
+
+    instances_without_agents.output_coverage_statistics(input_args, coverage_counter, input_user_profile_data)
+    out, _ = capsys.readouterr()
+
+    assert('prod/main -- Number of distinct hosts identified during inventory assessment: 2' in out)
+    assert('prod/main -- Coverage Percentage: 50.0%' in out)
+    assert('dev/main -- Number of distinct hosts identified during inventory assessment: 1' in out)
+    assert('dev/main -- Coverage Percentage: 0%' in out)
+
+
+def test_stream_subaccount_report_fetches_inventory_concurrently():
+    # every inventory search, fargate included, waits here until all of them are in flight at once
+    searches = instances_without_agents.INVENTORY_NORMALIZERS.keys() | {'ecs:task'}
+    barrier = threading.Barrier(len(searches), timeout=5)
+
+    def concurrent_inventory_search(json):
+        barrier.wait()
+        return mock_inventory_search(json)
+
+    client = MagicMock()
+    client.inventory.search.side_effect = concurrent_inventory_search
+    client.agent_info.search.side_effect = mock_agent_info_search
+    coverage_counter = instances_without_agents.CoverageCounter()
+
+    instances_without_agents.stream_subaccount_report(client, '', '', 'test', coverage_counter)
+
+    assert(coverage_counter.get('total', '') == (4, 2))
+
+
+def test_os_image_name_and_cloud_provider():
+    assert(instances_without_agents.os_image_name(
+        ['https://www.googleapis.com/compute/v1/projects/debian-cloud/global/licenses/debian-11-bullseye']
+    ) == 'debian-11-bullseye')
+    assert(instances_without_agents.os_image_name('') == 'unknown')
+    assert(instances_without_agents.cloud_provider('arn:aws:ecs:us-east-1:123456789012:task/c/abc') == 'AWS Fargate')
+    assert(instances_without_agents.cloud_provider('//compute.googleapis.com/projects/p/zones/z/instances/1') == 'GCP')
+    assert(instances_without_agents.cloud_provider(
+        '/subscriptions/s/resourceGroups/rg/providers/Microsoft.Compute/virtualMachines/vm'
+    ) == 'Azure')
+
+
 ###################################
-# get_azure_instance_inventory
+# get_azure_vmss_instance_inventory
 ###################################
+def test_azure_vmss_instances_reconcile_with_their_agents():
+    from benchmarks.synthetic import FakeLaceworkClient, SyntheticTenant
+    client = FakeLaceworkClient(SyntheticTenant(2000, page_size=100))
+
+    unmatched_instances, matched_instances, agents_without_inventory = instances_without_agents.generate_subaccount_report(
+        client, '', '', client.subaccount
+    )
+
+    vmss_matched = [r for r in matched_instances if '/virtualMachineScaleSets/' in r.urn]
+    assert(len(vmss_matched) > 0)
+    assert(any(r.is_kubernetes and r.cluster.startswith('aks-') for r in vmss_matched))
+    assert(any('/virtualMachineScaleSets/' in r.urn for r in unmatched_instances))
+    # every scale set agent found its instance
+    assert(not any(r.urn.startswith('azure/') and '/vmss-' in r.urn for r in agents_without_inventory))
+
 
+def test_agent_keys_are_dispatched_on_vm_provider():
+    agent_snapshot = instances_without_agents.AgentSnapshot([{'data': [
+        {'hostname': 'gce', 'tags': {'VmProvider': 'GCE', 'InstanceId': '1234', 'ProjectId': 'p', 'Hostname': 'gce'}},
+        {
+            'hostname': 'ec2',
+            'tags': {'VmProvider': 'AWS', 'InstanceId': 'i-abc', 'ProjectId': '123456789012', 'Hostname': 'ec2'}
+        },
+        {'hostname': 'task_1', 'tags': {'VmProvider': 'AWS', 'Hostname': 'task_1'}},
+        {
+            'hostname': 'vmss000000',
+            'tags': {'VmProvider': 'Microsoft.Compute', 'InstanceId': 'abcd-5678', 'Account': 's', 'Hostname': 'vmss000000'}
+        },
+        {'hostname': 'on-prem', 'tags': {'Hostname': 'on-prem'}}
+    ]}])
+    context = instances_without_agents.SubaccountContext('test')
+
+    agent_instances = instances_without_agents.get_agent_instances(agent_snapshot, context)
+    assert(sorted(agent_instances) == sorted(['1234', 'i-abc', 'task_1', 'abcd-5678', 'on-prem']))
+    assert(context.agent_cache == {'1234': 'gcp/p/gce', 'i-abc': 'aws/123456789012/ec2', 'abcd-5678': 'azure/s/vmss000000'})
 
 
 ###################################
 # apply_agent_presence_filtering
 ###################################
-# @patch('instances_without_agents.INVENTORY_CACHE')
-# def test_apply_agent_presence_filtering_1(mock_cache):
-#     # TODO: Figure out how to actually leverage the mock_cache correctly...
-#     #      ...or refactor to pass Cache as a parameter rather than a global var
-#     mock_cache.return_val = {
-#         'abc': instances_without_agents.OutputRecord('abc','',True,'','',{}),
-#         'xyz': instances_without_agents.OutputRecord('xyz','',True,'','',{})
-#     }
+def test_apply_agent_presence_filtering_1():
+    context = instances_without_agents.SubaccountContext('test')
+    context.inventory_cache = {
+        'i-abc': instances_without_agents.OutputRecord(
+            'arn:aws:ec2:us-east-1:123456789012:instance/i-abc','',False,'test','',{}
+        ),
+        'i-xyz': instances_without_agents.OutputRecord(
+            'arn:aws:ec2:us-east-1:123456789012:instance/i-xyz','',False,'test','',{}
+        )
+    }
+    context.agent_cache = {'i-onprem': 'aws/123456789012/ip-10-0-0-1'}
+
+    input_instance_inventory = ['i-abc', 'i-xyz']
+    input_list_agent_instances = ['i-abc', 'i-onprem', 'some-hostname']
+    input_lw_subaccount = 'test'
+
+    results = instances_without_agents.apply_agent_presence_filtering(
+        input_instance_inventory, input_list_agent_instances, input_lw_subaccount, context
+    )
+    result_instances_without_agents, result_matched_instances, result_agents_without_inventory = results
+
+    assert(len(result_matched_instances) == 1)
+    assert(result_matched_instances[0].urn == 'arn:aws:ec2:us-east-1:123456789012:instance/i-abc')
+
+    assert(len(result_instances_without_agents) == 1)
+    assert(result_instances_without_agents[0].urn == 'arn:aws:ec2:us-east-1:123456789012:instance/i-xyz')
+
+    assert(sorted(a.urn for a in result_agents_without_inventory) == ['aws/123456789012/ip-10-0-0-1', 'some-hostname'])
+
+
+def test_apply_agent_presence_filtering_matches_substring_scan():
+    inventory = {
+        f'i-{n:08x}': instances_without_agents.OutputRecord(
+            f'arn:aws:ec2:us-east-1:123456789012:instance/i-{n:08x}','',False,'test','',{}
+        ) for n in range(200)
+    }
+    agents = [f'i-{n:08x}' for n in range(100, 300)] + ['i-00000064', 'on-prem-host']
+
+    context = instances_without_agents.SubaccountContext('test')
+    context.inventory_cache = inventory
+
+    _, result_matched_instances, result_agents_without_inventory = instances_without_agents.apply_agent_presence_filtering(
+        list(inventory), agents, 'test', context
+    )
+
+    # reference result from the original O(agents x matched) substring scan
+    expected = [a for a in agents if not any(a in m.urn for m in result_matched_instances)]
+    assert([a.urn for a in result_agents_without_inventory] == expected)
+
+
+def test_apply_agent_presence_filtering_reconciles_ids_missing_from_the_urn():
+    context = instances_without_agents.SubaccountContext('test')
+    context.inventory_cache = {
+        'abcd-1234': instances_without_agents.OutputRecord(
+            '/subscriptions/s/resourceGroups/rg/providers/Microsoft.Compute/virtualMachines/vm-1','',False,'test','',{}
+        ),
+        '5678': instances_without_agents.OutputRecord(
+            '//compute.googleapis.com/projects/p/zones/z/instances/web-1','',False,'test','',{}
+        )
+    }
+    context.agent_cache = {'abcd-1234': 'azure/s/vm-1', '5678': 'gcp/p/web-1'}
+
+    _, result_matched_instances, result_agents_without_inventory = instances_without_agents.apply_agent_presence_filtering(
+        ['abcd-1234', '5678'], ['abcd-1234', '5678', 'on-prem-host'], 'test', context
+    )
+
+    # the substring scan reported these agents as without inventory although their hosts matched
+    assert(len(result_matched_instances) == 2)
+    assert([a.urn for a in result_agents_without_inventory] == ['on-prem-host'])
+
+
+###################################
+# generate_subaccount_report
+###################################
+def mock_inventory_search(json):
+    resource_type = json['filters'][0]['value']
+    if resource_type == 'ec2:instance':
+        return [{'data': [
+            {
+                'urn': 'arn:aws:ec2:us-east-1:123456789012:instance/i-abc',
+                'resourceConfig': {'InstanceId': 'i-abc', 'LaunchTime': '2022-01-01'}
+            },
+            {
+                'urn': 'arn:aws:ec2:us-east-1:123456789012:instance/i-xyz',
+                'resourceConfig': {'InstanceId': 'i-xyz', 'LaunchTime': '2022-01-01'}
+            }
+        ]}]
+    elif resource_type == 'ecs:task':
+        return [{'data': [{'resourceConfig': {'taskArn': 'arn:task/c'}}, {'resourceConfig': {'taskArn': 'arn:task/d'}}]}]
+    return [{'data': []}]
+
+
+def mock_agent_info_search(json):
+    return [{'data': [
+        {
+            'hostname': 'ip-10-0-0-1',
+            'tags': {'VmProvider': 'AWS', 'InstanceId': 'i-abc', 'Account': '123456789012', 'Hostname': 'ip-10-0-0-1'}
+        },
+        {
+            'hostname': 'arn:task/d_1234', 'status': 'ACTIVE', 'tags': {
+                'VmProvider': 'AWS', 'VmInstanceType': 'AWS_ECS_V4FARGATE', 'Hostname': 'arn:task/d_1234',
+                'net.lacework.aws.fargate.taskarn': 'arn:task/d'
+            }
+        },
+        {'hostname': 'on-prem-host', 'tags': {}}
+    ]}]
+
+
+def test_generate_subaccount_report_1():
+    client = MagicMock()
+    client.inventory.search.side_effect = mock_inventory_search
+    client.agent_info.search.side_effect = mock_agent_info_search
+
+    results = instances_without_agents.generate_subaccount_report(client, '', '', 'test')
+    result_instances_without_agents, result_matched_instances, result_agents_without_inventory = results
+
+    assert(sorted(i.urn for i in result_instances_without_agents) == [
+        'arn:aws:ec2:us-east-1:123456789012:instance/i-xyz', 'arn:task/c'
+    ])
+    assert(sorted(i.urn for i in result_matched_instances) == [
+        'arn:aws:ec2:us-east-1:123456789012:instance/i-abc', 'arn:task/d'
+    ])
+    assert([a.urn for a in result_agents_without_inventory] == ['on-prem-host'])
+    assert(client.agent_info.search.call_count == 1)
+
+
+###################################
+# metrics
+###################################
+def test_metered_client_counts_pages_records_and_parse_failures():
+    def inventory_with_broken_record(json):
+        pages = mock_inventory_search(json)
+        if json['filters'][0]['value'] == 'ec2:instance':
+            pages.append({'data': [{'urn': 'arn:aws:ec2:us-east-1:123456789012:instance/i-broken', 'resourceConfig': {}}]})
+        return pages
+
+    client = MagicMock()
+    client.inventory.search.side_effect = inventory_with_broken_record
+    client.agent_info.search.side_effect = mock_agent_info_search
+    metrics = instances_without_agents.PhaseMetrics()
+
+    instances_without_agents.generate_subaccount_report(
+        instances_without_agents.MeteredClient(client, metrics), '', '', 'test', metrics
+    )
+    phases = metrics.to_dict()['phases']
+
+    assert(phases['aws_inventory']['pages'] == 2)
+    assert(phases['aws_inventory']['records'] == 3)
+    assert(phases['aws_inventory']['parse_failures'] == 1)
+    assert(phases['agents']['records'] == 3)
+    assert(phases['fargate_inventory']['records'] == 2)
+    assert(phases['gcp_inventory']['parse_failures'] == 0)
+    assert('reconcile' in phases)
+
+
+###################################
+# daemon mode
+###################################
+def test_report_snapshot_gauges_by_subaccount_cloud_and_cluster():
+    OutputRecord = instances_without_agents.OutputRecord
+    without_agent = OutputRecord('arn:aws:ec2:us-east-1:123456789012:instance/i-1','',True,'sub-a','',[],'eks-1')
+    with_agent = OutputRecord('arn:aws:ec2:us-east-1:123456789012:instance/i-2','',True,'sub-a','',[],'eks-1')
+    gcp = OutputRecord('//compute.googleapis.com/projects/p/zones/z/instances/1','',False,'sub "b"','')
+    on_prem = OutputRecord('on-prem','',False,'sub-a','')
+    result = instances_without_agents.InstanceResult({without_agent, gcp}, {with_agent}, {on_prem})
+
+    snapshot = instances_without_agents.ReportSnapshot(result, 1700000000.0, 2.5)
+    gauges = snapshot.gauges.splitlines()
+
+    assert('instance_discovery_hosts 3' in gauges)
+    assert('instance_discovery_cluster_hosts{subaccount="sub-a",cloud="AWS",cluster="eks-1"} 2' in gauges)
+    assert('instance_discovery_cluster_coverage_ratio{subaccount="sub-a",cloud="AWS",cluster="eks-1"} 0.5' in gauges)
+    assert('instance_discovery_subaccount_hosts{subaccount="sub \\"b\\""} 1' in gauges)
+    assert('instance_discovery_cloud_hosts_with_agent{cloud="GCP"} 0' in gauges)
+    assert('instance_discovery_agents_without_inventory{subaccount="sub-a"} 1' in gauges)
+    assert(json.loads(snapshot.results_body)['instances_with_agents'][0]['cluster'] == 'eks-1')
+
+
+def test_report_service_keeps_serving_previous_results_when_a_refresh_fails():
+    args = Namespace(
+        cache_dir=None, max_workers=5, max_retries=0, incremental=None, stats_file=None, refresh_interval=0,
+        current_sub_account_only=False, time_slices=0
+    )
+    client = MagicMock()
+    client.user_profile.get.return_value = {'data': [{'accounts': [{'accountName': 'test'}]}]}
+    client.inventory.search.side_effect = mock_inventory_search
+    client.agent_info.search.side_effect = mock_agent_info_search
+    service = instances_without_agents.ReportService(args, client)
+    assert(service.results_body() is None)
+
+    with patch.object(instances_without_agents, 'ThrottledClient', lambda client, limiter, metrics: client):
+        service.refresh()
+    served = service.results_body()
+    client.user_profile.get.side_effect = Exception('unavailable')
+    service.stopped.set()
+    service.run()
+
+    assert(service.results_body() == served)
+    assert('instance_discovery_refresh_failures_total 1' in service.metrics_text().splitlines())
+    assert('instance_discovery_refreshes_total 1' in service.metrics_text().splitlines())
+
+
+def test_report_service_keeps_reconciled_state_warm_between_refreshes(tmp_path):
+    args = Namespace(
+        cache_dir=None, max_workers=5, max_retries=0, incremental=str(tmp_path), delta_output=None, stats_file=None,
+        refresh_interval=0, current_sub_account_only=False, time_slices=0
+    )
+    client = MagicMock()
+    client.user_profile.get.return_value = {'data': [{'accounts': [{'accountName': 'test'}]}]}
+    client.inventory.search.side_effect = mock_inventory_search
+    client.agent_info.search.side_effect = mock_agent_info_search
+    service = instances_without_agents.ReportService(args, client)
+
+    fetch = MagicMock(wraps=instances_without_agents.fetch_subaccount_inputs)
+    with patch.object(
+        instances_without_agents, 'ThrottledClient', lambda client, limiter, metrics: client
+    ), patch.object(instances_without_agents, 'fetch_subaccount_inputs', fetch):
+        first = service.refresh()
+        state = service.state_store.states['test']
+        first_end_time = state.end_time
+        second = service.refresh()
+
+    # the second refresh reuses the in-memory state and only asks for what changed since the first
+    assert(service.state_store.states['test'] is state)
+    overlap = timedelta(seconds=instances_without_agents.INCREMENTAL_OVERLAP_SECONDS)
+    assert(fetch.call_args_list[1].args[1] == (
+        datetime.strptime(first_end_time, '%Y-%m-%dT%H:%M:%SZ') - overlap
+    ).strftime('%Y-%m-%dT%H:%M:%SZ'))
+    assert(second.results_body == first.results_body)
+    # state files are only written once the service stops
+    assert(not (tmp_path / 'test.json.gz').exists())
+    service.stop()
+    saved_state = instances_without_agents.IncrementalStateStore(str(tmp_path)).load('test')
+    assert(saved_state.inventory.keys() == state.inventory.keys())
+
+
+###################################
+# stream_subaccount_report
+###################################
+def test_stream_subaccount_report_matches_generate_subaccount_report():
+    def inventory_with_repeated_task(json):
+        pages = mock_inventory_search(json)
+        if json['filters'][0]['value'] == 'ecs:task':
+            pages.append(
+                {'data': [{'resourceConfig': {'taskArn': 'arn:task/c'}}, {'resourceConfig': {'taskArn': 'arn:task/d'}}]}
+            )
+        return pages
+
+    client = MagicMock()
+    client.inventory.search.side_effect = inventory_with_repeated_task
+    client.agent_info.search.side_effect = mock_agent_info_search
+    stream = io.StringIO()
+
+    instances_without_agents.stream_subaccount_report(client, '', '', 'test', instances_without_agents.NdjsonWriter(stream))
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    # run_report collapses the batch results into sets, so each host is expected once
+    expected = instances_without_agents.generate_subaccount_report(client, '', '', 'test')
+    for result_set, records in zip(
+        ['instances_without_agents', 'instances_with_agents', 'agents_without_inventory'], expected
+    ):
+        streamed = sorted(line['urn'] for line in lines if line['result_set'] == result_set)
+        assert(streamed == sorted(set(r.urn for r in records)))
+    assert(len([line for line in lines if line['urn'] == 'arn:task/c']) == 1)
+
+
+###################################
+# SqliteWriter
+###################################
+def test_sqlite_writer_loads_streamed_results_with_indexes_and_tags(tmp_path):
+    from benchmarks.synthetic import FakeLaceworkClient, SyntheticTenant
+    client = FakeLaceworkClient(SyntheticTenant(200, page_size=50))
+    path = str(tmp_path / 'results.db')
+
+    # a small batch size, so the stream spans several transactions
+    writer = instances_without_agents.SqliteWriter(path, batch_size=16)
+    instances_without_agents.stream_subaccount_report(client, '', '', client.subaccount, writer)
+    writer.close()
+
+    expected = instances_without_agents.generate_subaccount_report(client, '', '', client.subaccount)
+    connection = sqlite3.connect(path)
+    for result_set, records in zip(instances_without_agents.RESULT_SETS, expected):
+        assert(sorted(urn for (urn,) in connection.execute(f'SELECT urn FROM {result_set}')) == sorted(r.urn for r in records))
+    indexes = {name for (name,) in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert({
+        'instances_with_agents_urn', 'instances_without_agents_subaccount', 'agents_without_inventory_creation_time',
+        'tags_key_value'
+    } <= indexes)
+    tagged = connection.execute(
+        "SELECT count(*) FROM instances_with_agents h JOIN tags t ON t.urn = h.urn WHERE t.key = 'env' AND t.value = 'prod'"
+    ).fetchone()[0]
+    assert(tagged > 0)
+    assert(connection.execute(
+        "SELECT count(*) FROM instances_with_agents WHERE cloud = 'GCP' AND os_image_name LIKE 'debian-%'"
+    ).fetchone()[0] > 0)
+    # os_image holds the same value the json output prints
+    printed = {r.urn: r.os_image for r in expected[1]}
+    for urn, os_image in connection.execute("SELECT urn, os_image FROM instances_with_agents WHERE cloud = 'GCP'"):
+        assert(json.loads(os_image) == printed[urn])
+    assert(not (tmp_path / 'results.db.tmp').exists())
+
+
+def test_tag_pairs_flattens_each_cloud_tag_format():
+    assert(instances_without_agents.tag_pairs([{'Key': 'Name', 'Value': 'web'}]) == [('Name', 'web')])
+    assert(instances_without_agents.tag_pairs({'env': 'prod', 'n': 1}) == [('env', 'prod'), ('n', '1')])
+    assert(instances_without_agents.tag_pairs({'items': ['http-server'], 'fingerprint': 'x'}) == [('http-server', None)])
+    assert(instances_without_agents.tag_pairs('') == [])
+
+
+###################################
+# SearchCache
+###################################
+def test_search_cache_serves_repeat_runs_from_disk(tmp_path):
+    cache = instances_without_agents.SearchCache(str(tmp_path))
+    client = MagicMock()
+    client.inventory.search.side_effect = mock_inventory_search
+    client.agent_info.search.side_effect = mock_agent_info_search
+
+    first_run = instances_without_agents.generate_subaccount_report(
+        instances_without_agents.CachedClient(client, cache, 'test'), '2022-01-01T00:00:00Z', '2022-01-02T00:00:00Z', 'test'
+    )
+    calls = client.inventory.search.call_count + client.agent_info.search.call_count
+
+    # a later run over a window of the same length is answered without touching the api
+    second_run = instances_without_agents.generate_subaccount_report(
+        instances_without_agents.CachedClient(client, cache, 'test'), '2022-01-01T00:15:00Z', '2022-01-02T00:15:00Z', 'test'
+    )
+
+    assert(client.inventory.search.call_count + client.agent_info.search.call_count == calls)
+    for first, second in zip(first_run, second_run):
+        assert(sorted(r.urn for r in first) == sorted(r.urn for r in second))
+
+
+def test_search_cache_ttl_expiry(tmp_path):
+    cache = instances_without_agents.SearchCache(str(tmp_path), ttl=0)
+    search = MagicMock(return_value=[{'data': [1]}])
+    body = {'timeFilter': {'startTime': '2022-01-01T00:00:00Z', 'endTime': '2022-01-02T00:00:00Z'}}
+
+    assert(list(cache.search(search, 'test', 'inventory', body)) == [{'data': [1]}])
+    time.sleep(0.01)
+    assert(list(cache.search(search, 'test', 'inventory', body)) == [{'data': [1]}])
+    assert(search.call_count == 2)
+
+
+def test_search_cache_size_eviction(tmp_path):
+    cache = instances_without_agents.SearchCache(str(tmp_path), max_bytes=1)
+    search = MagicMock(return_value=[{'data': list(range(100))}])
+
+    list(cache.search(search, 'test-1', 'inventory', {}))
+    list(cache.search(search, 'test-2', 'inventory', {}))
+
+    assert(len(list(tmp_path.iterdir())) == 0)
+
+
+###################################
+# generate_incremental_subaccount_report
+###################################
+def test_generate_incremental_subaccount_report_1(tmp_path):
+    state_store = instances_without_agents.IncrementalStateStore(str(tmp_path))
+    client = MagicMock()
+    client.inventory.search.side_effect = mock_inventory_search
+    client.agent_info.search.side_effect = mock_agent_info_search
+
+    instances_without_agents.generate_incremental_subaccount_report(
+        client, '2022-01-01T00:00:00Z', '2022-01-02T00:00:00Z', 'test', state_store
+    )
+    # the first run only records a baseline
+    delta = state_store.deltas['test']
+    assert(delta == {'baseline': True, 'lost_coverage': [], 'gained_coverage': []})
+    stream = io.StringIO()
+    state_store.write_delta(stream)
+    assert(json.loads(stream.getvalue()) == {'lost_coverage': [], 'gained_coverage': [], 'baseline_subaccounts': ['test']})
+
+    # the next run only sees an agent coming up on i-xyz
+    client = MagicMock()
+    client.inventory.search.return_value = [{'data': []}]
+    client.agent_info.search.return_value = [{'data': [
+        {
+            'hostname': 'ip-10-0-0-2',
+            'tags': {'VmProvider': 'AWS', 'InstanceId': 'i-xyz', 'Account': '123456789012', 'Hostname': 'ip-10-0-0-2'}
+        }
+    ]}]
+    state_store = instances_without_agents.IncrementalStateStore(str(tmp_path))
+
+    results = instances_without_agents.generate_incremental_subaccount_report(
+        client, '2022-01-01T00:15:00Z', '2022-01-02T00:15:00Z', 'test', state_store
+    )
+    result_instances_without_agents, result_matched_instances, result_agents_without_inventory = results
+
+    # the fetch reaches back over the end of the previous run, for records ingested after it ran
+    assert(client.agent_info.search.call_args.kwargs['json']['timeFilter']['startTime'] == '2022-01-01T23:55:00Z')
+    assert([r.urn for r in result_instances_without_agents] == ['arn:task/c'])
+    assert(sorted(r.urn for r in result_matched_instances) == [
+        'arn:aws:ec2:us-east-1:123456789012:instance/i-abc', 'arn:aws:ec2:us-east-1:123456789012:instance/i-xyz', 'arn:task/d'
+    ])
+    assert([a.urn for a in result_agents_without_inventory] == ['on-prem-host'])
+
+    delta = state_store.deltas['test']
+    assert(delta['lost_coverage'] == [])
+    assert([r.urn for r in delta['gained_coverage']] == ['arn:aws:ec2:us-east-1:123456789012:instance/i-xyz'])
+    assert(delta['baseline'] is False)
+
+
+def test_incremental_runs_through_the_search_cache_fetch_each_new_window(tmp_path):
+    state_store = instances_without_agents.IncrementalStateStore(str(tmp_path / 'state'))
+    cache = instances_without_agents.SearchCache(str(tmp_path / 'cache'))
+
+    def agent_info_by_window(json):
+        # i-xyz's agent only reports in during the (overlapped) 00:15 to 00:30 window
+        if json['timeFilter']['startTime'] == '2022-01-02T00:10:00Z':
+            return [{'data': [{'hostname': 'ip-10-0-0-2', 'tags': {
+                'VmProvider': 'AWS', 'InstanceId': 'i-xyz', 'Account': '123456789012', 'Hostname': 'ip-10-0-0-2'
+            }}]}]
+        return mock_agent_info_search(json)
+
+    client = MagicMock()
+    client.inventory.search.side_effect = mock_inventory_search
+    client.agent_info.search.side_effect = agent_info_by_window
+
+    def run(start_time: str, end_time: str) -> tuple[list, list, list]:
+        return instances_without_agents.generate_incremental_subaccount_report(
+            instances_without_agents.CachedClient(client, cache, 'test'), start_time, end_time, 'test', state_store
+        )
+
+    run('2022-01-01T00:00:00Z', '2022-01-02T00:00:00Z')
+    run('2022-01-01T00:15:00Z', '2022-01-02T00:15:00Z')
+    _, result_matched_instances, _ = run('2022-01-01T00:30:00Z', '2022-01-02T00:30:00Z')
+
+    # two back-to-back 15 minute windows are both fetched rather than the second being served from the first
+    start_times = [c.kwargs['json']['timeFilter']['startTime'] for c in client.agent_info.search.call_args_list]
+    assert(start_times == ['2022-01-01T00:00:00Z', '2022-01-01T23:55:00Z', '2022-01-02T00:10:00Z'])
+    assert('arn:aws:ec2:us-east-1:123456789012:instance/i-xyz' in [r.urn for r in result_matched_instances])
+    gained_coverage = [r.urn for r in state_store.deltas['test']['gained_coverage']]
+    assert(gained_coverage == ['arn:aws:ec2:us-east-1:123456789012:instance/i-xyz'])
+
+
+def test_incremental_state_expire():
+    state = instances_without_agents.IncrementalState(
+        {'agents': {'old': ['2022-01-01T00:00:00Z', None], 'new': ['2022-01-02T00:00:00Z', None]}}
+    )
+    state.expire('2022-01-01T12:00:00Z')
+
+    assert(list(state.agents) == ['new'])
+
+
+###################################
+# AdaptiveLimiter / ThrottledClient
+###################################
+def rate_limit_error(retry_after: str = None):
+    response = requests.Response()
+    response.status_code = 429
+    response.reason = 'Too Many Requests'
+    if retry_after is not None:
+        response.headers['Retry-After'] = retry_after
+    response.request = None
+    return RateLimitError(response)
+
+
+def test_adaptive_limiter_retries_and_backs_off():
+    limiter = instances_without_agents.AdaptiveLimiter(8, max_retries=2)
+    request = MagicMock(side_effect=[rate_limit_error('0'), rate_limit_error('0'), 'ok'])
+
+    assert(limiter.call(request) == 'ok')
+    assert(request.call_count == 3)
+    # two throttles halve the bound twice, the success then adds 1/limit back
+    assert(limiter.limit == 2.5)
+    assert(limiter.in_flight == 0)
+
+
+def test_adaptive_limiter_gives_up_after_max_retries():
+    limiter = instances_without_agents.AdaptiveLimiter(4, max_retries=1)
+    request = MagicMock(side_effect=rate_limit_error('0'))
+
+    try:
+        limiter.call(request)
+        assert(False)
+    except RateLimitError:
+        pass
+    assert(request.call_count == 2)
+
+
+def test_adaptive_limiter_does_not_retry_client_errors():
+    limiter = instances_without_agents.AdaptiveLimiter(4)
+    request = MagicMock(side_effect=ValueError('bad request'))
+
+    try:
+        limiter.call(request)
+        assert(False)
+    except ValueError:
+        pass
+    assert(request.call_count == 1)
+    assert(limiter.limit == 4)
+
+
+def test_adaptive_limiters_throttle_each_tenant_apart_under_a_global_cap():
+    global_cap = threading.BoundedSemaphore(1)
+    prod = instances_without_agents.AdaptiveLimiter(4, max_retries=1, global_cap=global_cap)
+    dev = instances_without_agents.AdaptiveLimiter(4, max_retries=1, global_cap=global_cap)
+
+    assert(prod.call(MagicMock(side_effect=[rate_limit_error('0'), 'ok'])) == 'ok')
+    assert(prod.limit < 4)
+    assert(dev.limit == 4)
+
+    # the cap is shared, so dev waits for prod's request to finish
+    started = threading.Event()
+    finish = threading.Event()
+
+    def slow_request():
+        started.set()
+        finish.wait(5)
+        return 'prod'
+    thread = threading.Thread(target=prod.call, args=(slow_request,))
+    thread.start()
+    started.wait(5)
+    assert(not global_cap.acquire(blocking=False))
+    finish.set()
+    assert(dev.call(lambda: 'dev') == 'dev')
+    thread.join()
+    assert(prod.in_flight == 0 and dev.in_flight == 0)
+
+
+def test_throttled_client_pages_through_search():
+    client = MagicMock()
+    first_page = MagicMock()
+    first_page.json.return_value = {'data': [1], 'paging': {'urls': {'nextPage': 'https://next'}}}
+    second_page = MagicMock()
+    second_page.json.return_value = {'data': [2], 'paging': {'urls': {'nextPage': None}}}
+    client.inventory._session.post.side_effect = [rate_limit_error('0'), first_page]
+    client.inventory._session.get.return_value = second_page
+
+    throttled_client = instances_without_agents.ThrottledClient(client, instances_without_agents.AdaptiveLimiter(4))
+    pages = list(throttled_client.inventory.search(json={}))
+
+    assert([p['data'] for p in pages] == [[1], [2]])
+    client.inventory._session.get.assert_called_once_with('https://next')
+
+
+class FailingHandler(BaseHTTPRequestHandler):
+    requests = 0
+
+    def do_GET(self):
+        FailingHandler.requests += 1
+        self.send_response(500)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def test_throttled_searches_leave_retries_to_the_limiter():
+    from laceworksdk.http_session import HttpSession
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FailingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # the session the sdk builds, which retries 5xx responses on its own
+    session = HttpSession._retry_session(None)
+    client = MagicMock()
+    client.inventory._session._session = session
+    client.agent_info._session._session = session
+    try:
+        instances_without_agents.without_sdk_retries(client)
+        response = session.get(f'http://127.0.0.1:{server.server_port}/search')
+    finally:
+        server.shutdown()
+
+    assert(response.status_code == 500)
+    assert(FailingHandler.requests == 1)
+
+
+###################################
+# PartitionedClient
+###################################
+def sliced_search(oversized_start):
+    requests_seen = list()
+
+    def search(json):
+        start, end = json['timeFilter']['startTime'], json['timeFilter']['endTime']
+        requests_seen.append((start, end))
+        # one host per slice, plus a host reported in every slice with that slice's status
+        data = [{'urn': f'urn:{start}'}, {'urn': 'urn:shared', 'status': start}]
+        if start == oversized_start and end == '2022-01-02T00:00:00Z':
+            data += [{'urn': f'urn:bulk-{i}'} for i in range(10)]
+        return [{'data': data}]
+    return (search, requests_seen)
+
+
+def test_partitioned_client_dedupes_keeping_the_latest_slice():
+    client = MagicMock()
+    client.inventory.search.side_effect, requests_seen = sliced_search(None)
+    partitioned = instances_without_agents.PartitionedClient(client, 4)
+
+    time_filter = {'startTime': '2022-01-01T00:00:00Z', 'endTime': '2022-01-02T00:00:00Z'}
+    pages = list(partitioned.inventory.search(json={'timeFilter': time_filter}))
+    records = [r for page in pages for r in page['data']]
+
+    assert(len(requests_seen) == 4)
+    assert(sorted(requests_seen)[1] == ('2022-01-01T06:00:00Z', '2022-01-01T12:00:00Z'))
+    assert([r['status'] for r in records if r['urn'] == 'urn:shared'] == ['2022-01-01T18:00:00Z'])
+    assert(len(records) == 5)
+
+
+def test_partitioned_client_splits_slices_near_the_cap():
+    client = MagicMock()
+    client.inventory.search.side_effect, requests_seen = sliced_search('2022-01-01T12:00:00Z')
+    partitioned = instances_without_agents.PartitionedClient(client, 2, split_threshold=10)
+
+    time_filter = {'startTime': '2022-01-01T00:00:00Z', 'endTime': '2022-01-02T00:00:00Z'}
+    records = [r for page in partitioned.inventory.search(json={'timeFilter': time_filter}) for r in page['data']]
+
+    # the later half came back too large and was fetched again as two quarters
+    assert(sorted(requests_seen) == [
+        ('2022-01-01T00:00:00Z', '2022-01-01T12:00:00Z'),
+        ('2022-01-01T12:00:00Z', '2022-01-01T18:00:00Z'),
+        ('2022-01-01T12:00:00Z', '2022-01-02T00:00:00Z'),
+        ('2022-01-01T18:00:00Z', '2022-01-02T00:00:00Z')
+    ])
+    assert(sorted(r['urn'] for r in records) == [
+        'urn:2022-01-01T00:00:00Z', 'urn:2022-01-01T12:00:00Z', 'urn:2022-01-01T18:00:00Z', 'urn:shared'
+    ])
+
+
+def test_partitioned_client_passes_through_searches_without_a_time_filter():
+    client = MagicMock()
+    client.agent_info.search.return_value = iter([{'data': [1]}])
+    partitioned = instances_without_agents.PartitionedClient(client, 4)
+
+    assert(list(partitioned.agent_info.search(json={})) == [{'data': [1]}])
+
+
+###################################
+# SubaccountStats
+###################################
+def test_subaccount_stats_longest_first(tmp_path):
+    stats = instances_without_agents.SubaccountStats(str(tmp_path / 'stats.json'))
+    stats.record('small', 5.0, 100)
+    stats.record('large', 300.0, 100_000)
+    stats.record('medium', 60.0, 5_000)
+    stats.save()
 
-#     input_instance_inventory = ['abc', 'xyz']
-#     input_list_agent_instances = ['abc']
-#     input_lw_subaccount = 'test'
+    stats = instances_without_agents.SubaccountStats(str(tmp_path / 'stats.json'))
+    assert(stats.order(['small', 'new', 'medium', 'large']) == ['new', 'large', 'medium', 'small'])
 
-#     result_instances_without_agents, result_matched_instances, result_agents_without_inventory = instances_without_agents.apply_agent_presence_filtering(input_instance_inventory, input_list_agent_instances, input_lw_subaccount)
 
-#     assert(len(result_matched_instances) == 1)
-#     assert(result_matched_instances[0].urn =='abc')
+def test_subaccount_stats_smooths_run_times(tmp_path):
+    stats = instances_without_agents.SubaccountStats(str(tmp_path / 'stats.json'))
+    stats.record('test', 10.0, 100)
+    stats.record('test', 30.0)
+
+    assert(stats.cost('test') == 20.0)
+    assert(stats.stats['test']['records'] == 100)
+
+
+###################################
+# AsyncSearchEngine
+###################################
+class PagedSearchHandler(BaseHTTPRequestHandler):
+    throttled = set()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        # throttle the first attempt of every search to exercise the retry path
+        if self.headers['Account-Name'] not in self.throttled:
+            self.throttled.add(self.headers['Account-Name'])
+            self.respond(429, {'message': 'slow down'}, {'Retry-After': '0'})
+        else:
+            next_page = f'http://127.0.0.1:{self.server.server_port}/page2'
+            self.respond(200, {'data': [self.headers['Account-Name'], 1], 'paging': {'urls': {'nextPage': next_page}}})
+
+    def do_GET(self):
+        self.respond(200, {'data': [self.headers['Account-Name'], 2], 'paging': {'urls': {'nextPage': None}}})
+
+    def respond(self, status, body, headers={}):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_async_search_engine_pages_and_retries():
+    pytest.importorskip('aiohttp')
+    server = ThreadingHTTPServer(('127.0.0.1', 0), PagedSearchHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    client = MagicMock()
+    client.inventory._session._base_url = f'http://127.0.0.1:{server.server_port}'
+    client.inventory._session._access_token = 'token'
+    client.inventory._build_url.return_value = '/api/v2/Inventory/search'
+
+    engine = instances_without_agents.AsyncSearchEngine(client, max_in_flight=4)
+    try:
+        results = dict()
+        for lw_subaccount in ['one', 'two']:
+            client.inventory._session._subaccount = lw_subaccount
+            results[lw_subaccount] = instances_without_agents.AsyncSearchClient(client, engine).inventory.search(json={})
+        pages = {lw_subaccount: [p['data'] for p in results[lw_subaccount]] for lw_subaccount in results}
+    finally:
+        engine.close()
+        server.shutdown()
+
+    assert(pages == {'one': [['one', 1], ['one', 2]], 'two': [['two', 1], ['two', 2]]})
+
+
+class EndlessSearchHandler(PagedSearchHandler):
+    requests = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.do_GET()
+
+    def do_GET(self):
+        EndlessSearchHandler.requests += 1
+        self.respond(
+            200, {
+                'data': [EndlessSearchHandler.requests],
+                'paging': {'urls': {'nextPage': f'http://127.0.0.1:{self.server.server_port}/next'}}
+            }
+        )
+
+
+def test_async_search_engine_stops_downloading_when_the_consumer_stops():
+    pytest.importorskip('aiohttp')
+    server = ThreadingHTTPServer(('127.0.0.1', 0), EndlessSearchHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    client = MagicMock()
+    client.inventory._session._base_url = f'http://127.0.0.1:{server.server_port}'
+    client.inventory._session._access_token = 'token'
+    client.inventory._session._subaccount = 'one'
+    client.inventory._build_url.return_value = '/api/v2/Inventory/search'
+
+    engine = instances_without_agents.AsyncSearchEngine(client, max_in_flight=4)
+    try:
+        pages = instances_without_agents.AsyncSearchClient(client, engine).inventory.search(json={})
+        assert(next(pages)['data'] == [1])
+        time.sleep(0.5)
+        # the download runs at most a couple of pages ahead of a consumer that is not reading
+        ahead = EndlessSearchHandler.requests
+        assert(ahead <= 2 + instances_without_agents.ASYNC_PAGES_AHEAD)
+        pages.close()
+        time.sleep(0.5)
+        stopped = EndlessSearchHandler.requests
+        time.sleep(0.5)
+    finally:
+        engine.close()
+        server.shutdown()
+
+    assert(EndlessSearchHandler.requests == stopped)
+
+
+###################################
+# field projection
+###################################
+def project_record(record: dict, fields: list) -> dict:
+    # keep only the declared (possibly nested) paths of a record
+    projected = dict()
+    for field in fields:
+        source, target = record, projected
+        keys = field.split('.')
+        for key in keys[:-1]:
+            if key not in source:
+                break
+            source = source[key]
+            target = target.setdefault(key, {})
+        else:
+            if keys[-1] in source:
+                target[keys[-1]] = source[keys[-1]]
+    return projected
+
+
+def parse_inventory(resource_type: str, record: dict) -> list:
+    client = MagicMock()
+    client.inventory.search.return_value = [{'data': [record]}]
+    context = instances_without_agents.SubaccountContext('test')
+    normalizer = instances_without_agents.INVENTORY_NORMALIZERS[resource_type]
+    inventory = instances_without_agents.iter_instance_inventory(client, '', '', 'test', context, normalizer)
+    parsed = [(identifier, r.to_dict()) for identifier, r in inventory]
+    return (parsed, client.inventory.search.call_args.kwargs['json']['returns'])
+
+
+def test_parsers_only_read_declared_fields():
+    gcp_record = {
+        'urn': '//compute.googleapis.com/projects/p/zones/z/instances/1234',
+        'cloudDetails': {'projectName': 'p'},
+        'resourceConfig': {
+            'id': '1234', 'name': 'gke-node', 'creationTimestamp': '2022-01-01', 'status': 'RUNNING',
+            'machineType': 'e2-small', 'labels': {'goog-gke-node': ''}, 'tags': {'items': ['web']},
+            'disks': [{'licenses': ['projects/debian-cloud/global/licenses/debian-11'], 'deviceName': 'boot'}]
+        }
+    }
+    aws_record = {
+        'urn': 'arn:aws:ec2:us-east-1:123456789012:instance/i-abc',
+        'resourceConfig': {
+            'InstanceId': 'i-abc', 'LaunchTime': '2022-01-01', 'ImageId': 'ami-1',
+            'Tags': [{'Key': 'eks:cluster-name', 'Value': 'prod'}]
+        }
+    }
+    azure_record = {
+        'urn': '/subscriptions/s/resourceGroups/rg/providers/Microsoft.Compute/virtualMachines/vm',
+        'resourceTags': {'env': 'prod'},
+        'resourceConfig': {'vmId': 'abcd-1234', 'timeCreated': '2022-01-01', 'hardwareProfile': {'vmSize': 'B1s'}}
+    }
+    azure_vmss_record = {
+        'urn': '/subscriptions/s/resourceGroups/rg/providers/Microsoft.Compute/virtualMachineScaleSets/vmss/virtualMachines/0',
+        'resourceTags': {'aks-managed-cluster-name': 'aks-prod'},
+        'resourceConfig': {
+            'instanceId': '0', 'vmId': 'abcd-5678', 'timeCreated': '2022-01-01', 'sku': {'name': 'Standard_D2s_v3'}
+        }
+    }
+
+    for resource_type, record in [
+        ('compute.googleapis.com/Instance', gcp_record),
+        ('ec2:instance', aws_record),
+        ('microsoft.compute/virtualmachines', azure_record),
+        ('microsoft.compute/virtualmachinescalesets/virtualmachines', azure_vmss_record)
+    ]:
+        fields = instances_without_agents.INVENTORY_NORMALIZERS[resource_type].fields
+        full, returns = parse_inventory(resource_type, record)
+        projected, _ = parse_inventory(resource_type, project_record(record, fields))
+
+        assert(len(full) == 1)
+        assert(full == projected)
+        assert(returns == instances_without_agents.returned_fields(fields))
+
+
+def test_parsers_index_eks_gke_and_aks_clusters():
+    gcp_record = {
+        'urn': '//compute.googleapis.com/projects/p/zones/z/instances/1234',
+        'resourceConfig': {
+            'id': '1234', 'creationTimestamp': '2022-01-01', 'status': 'RUNNING',
+            'labels': {'goog-gke-node': '', 'goog-k8s-cluster-name': 'gke-prod'}
+        }
+    }
+    unnamed_gcp_record = {
+        'urn': '//compute.googleapis.com/projects/p/zones/z/instances/5678',
+        'resourceConfig': {
+            'id': '5678', 'creationTimestamp': '2022-01-01', 'status': 'RUNNING', 'labels': {'goog-gke-node': ''}
+        }
+    }
+    aks_record = {
+        'urn': '/subscriptions/s/resourceGroups/rg/providers/Microsoft.Compute/virtualMachines/aks-node',
+        'resourceTags': {'aks-managed-cluster-name': 'aks-prod', 'aks-managed-poolName': 'nodepool1'},
+        'resourceConfig': {'vmId': 'abcd-1234', 'timeCreated': '2022-01-01'}
+    }
+    legacy_aks_record = {
+        'urn': '/subscriptions/s/resourceGroups/rg/providers/Microsoft.Compute/virtualMachines/legacy-node',
+        'resourceTags': {'orchestrator': 'Kubernetes:1.18.0', 'poolName': 'agentpool'},
+        'resourceConfig': {'vmId': 'abcd-5678', 'timeCreated': '2022-01-01'}
+    }
+
+    for resource_type, record, identifier, cluster in [
+        ('compute.googleapis.com/Instance', gcp_record, '1234', 'gke-prod'),
+        ('compute.googleapis.com/Instance', unnamed_gcp_record, '5678', None),
+        ('microsoft.compute/virtualmachines', aks_record, 'abcd-1234', 'aks-prod'),
+        ('microsoft.compute/virtualmachines', legacy_aks_record, 'abcd-5678', None)
+    ]:
+        parsed, _ = parse_inventory(resource_type, record)
+        assert(parsed[0][1]['is_kubernetes'] == True)
+        assert(parsed[0][0] == identifier)
+        assert(parsed[0][1]['cluster'] == cluster)
+
+
+def test_process_pool_normalization_matches_inline():
+    from benchmarks.synthetic import FakeLaceworkClient, SyntheticTenant
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    fake_client = FakeLaceworkClient(SyntheticTenant(2000, page_size=100))
+    metrics = instances_without_agents.PhaseMetrics()
+    # raw responses only reach the pool through ThrottledClient, here under MeteredClient as in a --metrics run
+    throttled_client = instances_without_agents.ThrottledClient(fake_client, instances_without_agents.AdaptiveLimiter(1))
+    client = instances_without_agents.MeteredClient(throttled_client, metrics)
+
+    def report(parse_pool):
+        results = instances_without_agents.generate_subaccount_report(
+            client, '', '', fake_client.subaccount, parse_pool=parse_pool
+        )
+        return [sorted((r.to_dict() for r in records), key=lambda r: r['urn']) for records in results]
+
+    with ProcessPoolExecutor(2, mp_context=multiprocessing.get_context('spawn')) as parse_pool:
+        with patch.object(parse_pool, 'submit', wraps=parse_pool.submit) as submit:
+            pooled = report(parse_pool)
+        pooled_metrics = metrics.to_dict()['phases']
+
+    assert(pooled == report(None))
+    assert(any(r['cluster'] for r in pooled[1]))
+    # every inventory page went to the pool undecoded, and all of them were paged through
+    assert(submit.call_count > len(instances_without_agents.INVENTORY_NORMALIZERS))
+    assert(all(
+        call.args[0] == instances_without_agents.parse_raw_page and type(call.args[2]) == bytes
+        for call in submit.call_args_list
+    ))
+    assert(pooled_metrics['aws_inventory']['records'] > 0)
+    assert(pooled_metrics['aws_inventory']['pages'] > 1)
+
+
+def test_parse_raw_page_returns_the_next_page_with_the_rows():
+    aws_record = {
+        'urn': 'arn:aws:ec2:us-east-1:123456789012:instance/i-abc',
+        'resourceConfig': {'InstanceId': 'i-abc', 'LaunchTime': '2022-01-01'}
+    }
+    content = json.dumps({'paging': {'urls': {'nextPage': 'https://next'}}, 'data': [aws_record]}).encode()
+
+    next_page, (rows, warnings, failures) = instances_without_agents.parse_raw_page('ec2:instance', content)
+
+    assert(next_page == 'https://next')
+    assert(rows == instances_without_agents.normalize_page('ec2:instance', [aws_record])[0])
+    assert(failures == 0)
+    assert(instances_without_agents.parse_raw_page('ec2:instance', json.dumps({'data': []}).encode())[0] is None)
+
+
+def test_normalize_page_counts_failures_and_returns_warnings():
+    aws_record = {
+        'urn': 'arn:aws:ec2:us-east-1:123456789012:instance/i-abc', 'resourceConfig': {
+            'InstanceId': 'i-abc', 'LaunchTime': '2022-01-01', 'Tags': [{'Key': 'eks:cluster-name', 'Value': 'prod'}]
+        }
+    }
+    rows, warnings, failures = instances_without_agents.normalize_page(
+        'ec2:instance', [aws_record, {'urn': 'broken', 'resourceConfig': {}}]
+    )
+
+    assert(rows == [('i-abc', aws_record['urn'], '2022-01-01', True, '', aws_record['resourceConfig']['Tags'], 'prod')])
+    assert(failures == 1)
+    assert(len(warnings) == 1 and warnings[0][1][1]['urn'] == 'broken')
+
+
+def test_fargate_classifier_only_reads_declared_fields():
+    task = {
+        'resourceConfig': {
+            'taskArn': 'arn:task/a', 'launchType': 'FARGATE', 'tags': {'a': 'b'},
+            'containers': [{'image': 'lacework/datacollector', 'taskArn': 'arn:task/a'}]
+        }
+    }
+    projected = project_record(task, instances_without_agents.FARGATE_TASK_FIELDS)
+
+    full_tasks = instances_without_agents.classify_fargate_tasks([{'data': [task]}], set(), set(), 'test')
+    projected_tasks = instances_without_agents.classify_fargate_tasks([{'data': [projected]}], set(), set(), 'test')
+    full_result = [(has_agent, r.to_dict()) for has_agent, r in full_tasks]
+    projected_result = [(has_agent, r.to_dict()) for has_agent, r in projected_tasks]
+
+    assert(full_result == projected_result)
+
+
+#########################
+# synthetic benchmark data
+#########################
+def test_synthetic_tenant_is_deterministic_and_reconciles():
+    from benchmarks.synthetic import FakeLaceworkClient, SyntheticTenant
+
+    def report():
+        tenant = SyntheticTenant(2000, subaccounts=2, page_size=100)
+        client = FakeLaceworkClient(tenant, 'subaccount-001')
+        return instances_without_agents.generate_subaccount_report(client, 'start', 'end', 'subaccount-001')
+
+    first = report()
+    second = report()
+
+    assert([sorted(r.urn for r in results) for results in first] == [sorted(r.urn for r in results) for results in second])
+    # every cloud parser and the fargate pass see records
+    urns = [r.urn for r in first[0] + first[1]]
+    assert(any(u.startswith('arn:aws:ec2') for u in urns))
+    assert(any(u.startswith('//compute.googleapis.com') for u in urns))
+    assert(any('Microsoft.Compute' in u for u in urns))
+    assert(any(r.urn.startswith('arn:aws:ecs') for r in first[1]))
+    assert(all(r.subaccount == 'subaccount-001' for results in first for r in results))
+    # on-prem agents never reconcile with inventory
+    assert(any(r.urn.startswith('on-prem-subaccount-001') for r in first[2]))
+
+
+###################################
+# main
+###################################
+def test_main_rejects_conflicting_flags(caplog):
+    args = Namespace(
+        account=None, subaccount=None, api_key=None, api_secret=None, profile=None, profiles=None, tenants_file=None,
+        csv=False, json=False, ndjson=False, sqlite=None, statistics=False, by_cluster=False, async_engine=False,
+        incremental=None, serve=None, output=None, metrics=None
+    )
 
-#     assert(len(result_instances_without_agents) == 1)
-#     assert(result_instances_without_agents[0].urn =='xyz')
\ No newline at end of file
+    for overrides, message in [
+        (
+            {'sqlite': 'results.db', 'statistics': True},
+            '--sqlite writes per-host records and cannot be combined with --statistics'
+        ),
+        (
+            {'profiles': ['a', 'b'], 'serve': 9000},
+            '--profiles and --tenants-file cannot be combined with --serve or --incremental'
+        )
+    ]:
+        caplog.clear()
+        with pytest.raises(SystemExit) as exited:
+            instances_without_agents.main(Namespace(**dict(vars(args), **overrides)))
+        assert(exited.value.code == 1)
+        assert(message in caplog.text)